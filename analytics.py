@@ -0,0 +1,589 @@
+#!/usr/bin/env python3
+"""
+Cross-user API log analytics
+
+Scans the API logs of all users (active file and closed segments) in parallel and keeps the
+fields the queries need as compact columns in users/.analytics/: one binary file per column
+plus meta.json with the dictionaries (users, languages, models, ingredients) and a checkpoint
+per user. An update only reads what was appended since the previous one.
+
+Queries (vectorized with NumPy if installed, plain Python otherwise):
+- latency: call latency percentiles per language, user or model
+- tokens: token spend per user, language or model
+- ingredients: most frequent ingredients (overall or per language/user)
+- duplicates: identical prompts sent more than once and the tokens spent on the repeats
+
+Usage:
+  python3 analytics.py update [users_dir] [--workers 8] [--rebuild]
+  python3 analytics.py report [users_dir] [--since 7d] [--top 10] [--json]
+  python3 analytics.py query {latency,tokens,ingredients,duplicates} [users_dir] [--by lang] [--since 2024-05-01]
+"""
+
+import os
+import sys
+import gzip
+import json
+import math
+import array
+import hashlib
+import argparse
+from collections import Counter
+from datetime import datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor
+
+import jsonl_log
+import storage
+from ingredient_normalizer import canonical_names
+from user_registry import iter_user_dirs
+
+USERS_DIR = "users"
+LOG_NAME = "api_log.jsonl"
+# Column store below the users directory (hidden, so it is not taken for a user)
+ANALYTICS_DIR = ".analytics"
+FORMAT_VERSION = 1
+
+# Column name -> array typecode; one value per log entry, except "terms"
+COLUMNS = {
+    "user": "I",
+    "timestamp": "d",
+    "lang": "H",
+    "model": "H",
+    "latency_ms": "f",
+    "first_token_ms": "f",
+    "input_tokens": "I",
+    "output_tokens": "I",
+    "cache_read_tokens": "I",
+    "cache_creation_tokens": "I",
+    "flags": "B",
+    "prompt_hash": "Q",
+    "term_count": "B",
+    # Ingredient ids of all entries back to back (term_count per entry)
+    "terms": "I",
+}
+# Columns holding ids into a dictionary (meta.json) -> dictionary name
+DICTIONARY_COLUMNS = {"user": "user", "lang": "lang", "model": "model", "terms": "term"}
+GROUP_BY = ("user", "lang", "model")
+
+FLAG_PRECOMPUTED = 1
+FLAG_INTERRUPTED = 2
+MAX_TERMS = 255
+
+_np = False
+
+
+def _numpy():
+    """Import NumPy on first use (optional; the queries fall back to plain Python)"""
+    global _np
+    if _np is False:
+        try:
+            import numpy
+            _np = numpy
+        except ImportError:
+            _np = None
+    return _np
+
+
+def _percentile(sorted_values, q):
+    """Nearest-rank percentile of sorted values"""
+    if not len(sorted_values):
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(q / 100 * len(sorted_values))) - 1))
+    return float(sorted_values[index])
+
+
+# --- Scanning -------------------------------------------------------------------------------
+
+def pending_files(log_file, checkpoint):
+    """
+    (path, start offset) of the log data not scanned yet, plus the newest segment index.
+    The first segment closed since the checkpoint is the file that was active back then,
+    so the saved offset applies to it; everything newer is read from the start.
+    """
+    last = checkpoint.get("segment", 0)
+    offset = checkpoint.get("offset", 0)
+    files = []
+    newest = last
+    for index, path in jsonl_log.indexed_segments(log_file):
+        if index > last:
+            files.append((path, offset if index == last + 1 else 0))
+            newest = index
+    start = offset if newest == last else 0
+    try:
+        size = os.path.getsize(log_file)
+    except OSError:
+        size = 0
+    if size < start:
+        # The active file was replaced (e.g. by a migration): read it again
+        start = 0
+    if size > start:
+        files.append((log_file, start))
+    return files, newest
+
+
+def _read_lines(path, start):
+    """Complete lines of a file from start on, plus the offset after the last one"""
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, 'rb') as f:
+        # Seeking a gzip file decompresses up to the offset
+        f.seek(start)
+        data = f.read()
+    # A line still being written is picked up by the next update
+    end = data.rfind(b"\n") + 1
+    return data[:end].splitlines(), start + end
+
+
+def _number(value, default=math.nan):
+    return default if value is None else value
+
+
+def _timestamp(value):
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except (TypeError, ValueError):
+        return math.nan
+
+
+def prompt_hash(prompt):
+    """64-bit hash identifying identical prompts"""
+    return int.from_bytes(hashlib.blake2b(prompt.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def scan_log(files):
+    """
+    Parse log files ((path, start offset) pairs) into columns. Runs in a worker process, so the
+    ids refer to the worker's own dictionaries; returns columns, dictionaries and the end offset.
+    """
+    columns = {name: array.array(code) for name, code in COLUMNS.items() if name != "user"}
+    ids = {"lang": {}, "model": {}, "term": {}}
+    offset = 0
+    rows = 0
+    for path, start in files:
+        lines, offset = _read_lines(path, start)
+        for line in lines:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # Skip a partially written line (e.g. after a crash)
+                continue
+            usage = entry.get("usage") or {}
+            terms = canonical_names(entry.get("ingredients") or "")[:MAX_TERMS]
+            columns["timestamp"].append(_timestamp(entry.get("timestamp")))
+            columns["lang"].append(ids["lang"].setdefault(entry.get("lang") or "unknown", len(ids["lang"])))
+            columns["model"].append(ids["model"].setdefault(entry.get("model") or "unknown", len(ids["model"])))
+            columns["latency_ms"].append(_number(entry.get("latency_ms")))
+            columns["first_token_ms"].append(_number(entry.get("first_token_ms")))
+            columns["input_tokens"].append(usage.get("input_tokens") or 0)
+            columns["output_tokens"].append(usage.get("output_tokens") or 0)
+            columns["cache_read_tokens"].append(usage.get("cache_read_input_tokens") or 0)
+            columns["cache_creation_tokens"].append(usage.get("cache_creation_input_tokens") or 0)
+            columns["flags"].append((FLAG_PRECOMPUTED if entry.get("precomputed") else 0)
+                                    | (FLAG_INTERRUPTED if entry.get("interrupted") else 0))
+            columns["prompt_hash"].append(prompt_hash(entry.get("prompt") or ""))
+            columns["term_count"].append(len(terms))
+            term_ids = ids["term"]
+            columns["terms"].extend(term_ids.setdefault(term, len(term_ids)) for term in terms)
+            rows += 1
+    return {
+        "rows": rows,
+        "offset": offset,
+        "columns": columns,
+        "dictionaries": {name: list(values) for name, values in ids.items()}
+    }
+
+
+class LogAnalytics:
+    """Incrementally updated column store of all users' API logs"""
+
+    def __init__(self, users_dir=USERS_DIR):
+        self.users_dir = users_dir
+        self.directory = os.path.join(users_dir, ANALYTICS_DIR)
+        self.meta_file = os.path.join(self.directory, "meta.json")
+
+    def _column_file(self, name):
+        return os.path.join(self.directory, f"{name}.bin")
+
+    def _load_meta(self):
+        try:
+            with open(self.meta_file, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            if meta.get("version") == FORMAT_VERSION:
+                return meta
+        except (OSError, ValueError):
+            pass
+        return {
+            "version": FORMAT_VERSION,
+            "updated": None,
+            "lengths": {name: 0 for name in COLUMNS},
+            "dictionaries": {name: [] for name in set(DICTIONARY_COLUMNS.values())},
+            "checkpoints": {}
+        }
+
+    def _scan(self, jobs, workers):
+        """scan_log results of all jobs, in order (in worker processes if there is enough to do)"""
+        workers = min(workers or os.cpu_count() or 1, len(jobs))
+        if workers <= 1:
+            for files in jobs:
+                yield scan_log(files)
+            return
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # Several users per task: most logs are small
+            yield from pool.map(scan_log, jobs, chunksize=max(1, len(jobs) // (workers * 8)))
+
+    def update(self, workers=None, rebuild=False):
+        """
+        Add everything logged since the last update (all users, in parallel).
+        Returns {"users": scanned users, "rows": new entries, "total": all entries}.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        with storage.locked_file(self.meta_file):
+            if rebuild and os.path.exists(self.meta_file):
+                os.remove(self.meta_file)
+            meta = self._load_meta()
+            plan = []
+            for username, user_dir in iter_user_dirs(self.users_dir):
+                log_file = os.path.join(user_dir, LOG_NAME)
+                files, segment = pending_files(log_file, meta["checkpoints"].get(username, {}))
+                if files:
+                    plan.append((username, files, segment, files[-1][0] == log_file))
+
+            # Drop anything an interrupted update appended after the last saved meta.json
+            for name, code in COLUMNS.items():
+                with open(self._column_file(name), 'ab') as f:
+                    f.truncate(meta["lengths"][name] * array.array(code).itemsize)
+
+            dictionaries = meta["dictionaries"]
+            ids = {name: {value: i for i, value in enumerate(values)} for name, values in dictionaries.items()}
+
+            def global_id(name, value):
+                if value not in ids[name]:
+                    ids[name][value] = len(dictionaries[name])
+                    dictionaries[name].append(value)
+                return ids[name][value]
+
+            outputs = {name: open(self._column_file(name), 'ab') for name in COLUMNS}
+            rows = 0
+            try:
+                for (username, _, segment, active), result in zip(plan, self._scan([job[1] for job in plan], workers)):
+                    columns = result["columns"]
+                    columns["user"] = array.array(COLUMNS["user"], [global_id("user", username)]) * result["rows"]
+                    for name in ("lang", "model", "terms"):
+                        dictionary = DICTIONARY_COLUMNS[name]
+                        mapping = [global_id(dictionary, value) for value in result["dictionaries"][dictionary]]
+                        columns[name] = array.array(COLUMNS[name], [mapping[i] for i in columns[name]])
+                    for name, values in columns.items():
+                        values.tofile(outputs[name])
+                        meta["lengths"][name] += len(values)
+                    # The offset always refers to the active file
+                    meta["checkpoints"][username] = {"segment": segment, "offset": result["offset"] if active else 0}
+                    rows += result["rows"]
+            finally:
+                for f in outputs.values():
+                    f.close()
+
+            # meta.json is written last: it commits the appended rows and the checkpoints
+            meta["updated"] = datetime.now().isoformat()
+            storage.write_atomic(self.meta_file, json.dumps(meta, ensure_ascii=False), storage.fsync_policy())
+        return {"users": len(plan), "rows": rows, "total": meta["lengths"]["timestamp"]}
+
+    def load(self, since=None):
+        """All stored entries (at or after since, a datetime) as a LogTable"""
+        meta = self._load_meta()
+        np = _numpy()
+        columns = {}
+        for name, code in COLUMNS.items():
+            count = meta["lengths"][name]
+            if np is not None:
+                columns[name] = (np.fromfile(self._column_file(name), dtype=np.dtype(code), count=count)
+                                 if count else np.zeros(0, dtype=np.dtype(code)))
+            else:
+                columns[name] = array.array(code)
+                if count:
+                    with open(self._column_file(name), 'rb') as f:
+                        columns[name].fromfile(f, count)
+        table = LogTable(columns, meta["dictionaries"], meta.get("updated"))
+        return table.since(since.timestamp()) if since else table
+
+
+# --- Queries --------------------------------------------------------------------------------
+
+class LogTable:
+    """Loaded columns plus the group-by and percentile queries over them"""
+
+    def __init__(self, columns, dictionaries, updated=None):
+        self.columns = columns
+        self.dictionaries = dictionaries
+        self.updated = updated
+        self.np = _numpy() if not isinstance(columns["timestamp"], array.array) else None
+
+    def __len__(self):
+        return len(self.columns["timestamp"])
+
+    def since(self, timestamp):
+        """Entries logged at or after timestamp (seconds)"""
+        np = self.np
+        if np is not None:
+            keep = self.columns["timestamp"] >= timestamp
+            term_keep = np.repeat(keep, self.columns["term_count"])
+            columns = {name: values[term_keep if name == "terms" else keep] for name, values in self.columns.items()}
+        else:
+            rows = [i for i, value in enumerate(self.columns["timestamp"]) if value >= timestamp]
+            columns = {name: array.array(COLUMNS[name], (self.columns[name][i] for i in rows))
+                       for name in COLUMNS if name != "terms"}
+            starts = self._term_starts()
+            counts = self.columns["term_count"]
+            columns["terms"] = array.array(COLUMNS["terms"])
+            for i in rows:
+                columns["terms"].extend(self.columns["terms"][starts[i]:starts[i] + counts[i]])
+        return LogTable(columns, self.dictionaries, self.updated)
+
+    def _term_starts(self):
+        starts, position = [], 0
+        for count in self.columns["term_count"]:
+            starts.append(position)
+            position += count
+        return starts
+
+    def _keys(self, by):
+        """Group id per entry and the group labels (by=None: a single group)"""
+        if by is None:
+            keys = self.np.zeros(len(self), dtype=self.np.uint32) if self.np is not None else [0] * len(self)
+            return keys, ["all"]
+        if by not in GROUP_BY:
+            raise ValueError(f"Cannot group by {by!r} (use {', '.join(GROUP_BY)})")
+        return self.columns[by], self.dictionaries[DICTIONARY_COLUMNS[by]]
+
+    def latency(self, by="lang"):
+        """Latency percentiles (ms) of the model calls per group, precomputed answers excluded"""
+        keys, labels = self._keys(by)
+        latency, first_token = self.columns["latency_ms"], self.columns["first_token_ms"]
+        precomputed = self.columns["flags"]
+        groups = {}
+        np = self.np
+        if np is not None:
+            valid = ~np.isnan(latency) & ((precomputed & FLAG_PRECOMPUTED) == 0)
+            keys, latency, first_token = keys[valid], latency[valid], first_token[valid]
+            order = np.lexsort((latency, keys))
+            keys, latency, first_token = keys[order], latency[order], first_token[order]
+            group_ids, starts, counts = np.unique(keys, return_index=True, return_counts=True)
+            for key, start, count in zip(group_ids.tolist(), starts.tolist(), counts.tolist()):
+                first = first_token[start:start + count]
+                groups[key] = (latency[start:start + count], np.sort(first[~np.isnan(first)]))
+        else:
+            for i, value in enumerate(latency):
+                if not math.isnan(value) and not precomputed[i] & FLAG_PRECOMPUTED:
+                    values, first = groups.setdefault(keys[i], ([], []))
+                    values.append(value)
+                    if not math.isnan(first_token[i]):
+                        first.append(first_token[i])
+            groups = {key: (sorted(values), sorted(first)) for key, (values, first) in groups.items()}
+        result = []
+        for key, (values, first) in groups.items():
+            result.append({
+                by or "group": labels[key],
+                "calls": len(values),
+                "mean_ms": round(float(values.sum(dtype=np.float64) if np is not None else sum(values))
+                                 / len(values), 1),
+                "p50_ms": round(_percentile(values, 50), 1),
+                "p90_ms": round(_percentile(values, 90), 1),
+                "p99_ms": round(_percentile(values, 99), 1),
+                "first_token_p50_ms": round(_percentile(first, 50), 1) if len(first) else None
+            })
+        return sorted(result, key=lambda row: -row["calls"])
+
+    def tokens(self, by="user"):
+        """Calls and token spend per group, largest spend first"""
+        keys, labels = self._keys(by)
+        fields = ("input_tokens", "output_tokens", "cache_read_tokens", "cache_creation_tokens")
+        np = self.np
+        if np is not None:
+            calls = np.bincount(keys, minlength=len(labels))
+            sums = {field: np.bincount(keys, weights=self.columns[field], minlength=len(labels)) for field in fields}
+        else:
+            calls = [0] * len(labels)
+            sums = {field: [0] * len(labels) for field in fields}
+            for i, key in enumerate(keys):
+                calls[key] += 1
+                for field in fields:
+                    sums[field][key] += self.columns[field][i]
+        result = []
+        for key, label in enumerate(labels):
+            if calls[key]:
+                row = {by or "group": label, "calls": int(calls[key])}
+                row.update({field: int(sums[field][key]) for field in fields})
+                result.append(row)
+        return sorted(result, key=lambda row: -(row["input_tokens"] + row["output_tokens"]))
+
+    def ingredients(self, top=10, by=None):
+        """Most frequent ingredients, overall or per group: {label: [(ingredient, count), ...]}"""
+        keys, labels = self._keys(by)
+        terms, names = self.columns["terms"], self.dictionaries["term"]
+        np = self.np
+        if np is not None:
+            term_keys = np.repeat(keys, self.columns["term_count"]).astype(np.uint64)
+            pairs, counts = np.unique((term_keys << np.uint64(32)) | terms.astype(np.uint64), return_counts=True)
+            counter = Counter(dict(zip(pairs.tolist(), counts.tolist())))
+        else:
+            counter = Counter()
+            position = 0
+            for key, count in zip(keys, self.columns["term_count"]):
+                counter.update((key << 32) | term for term in terms[position:position + count])
+                position += count
+        result = {}
+        for pair, count in counter.most_common():
+            ranking = result.setdefault(labels[pair >> 32], [])
+            if len(ranking) < top:
+                ranking.append((names[pair & 0xFFFFFFFF], int(count)))
+        return result
+
+    def duplicates(self, top=10):
+        """
+        Prompts sent more than once: {"prompts", "repeated_calls", "repeated_tokens", "top": [...]}.
+        repeated_tokens are the input and output tokens of all calls after the first one,
+        i.e. what caching identical prompts would have saved.
+        """
+        hashes = self.columns["prompt_hash"]
+        spent = [self.columns["input_tokens"], self.columns["output_tokens"]]
+        np = self.np
+        groups = []
+        if np is not None:
+            tokens = spent[0].astype(np.int64) + spent[1]
+            _, first, inverse, counts = np.unique(hashes, return_index=True, return_inverse=True, return_counts=True)
+            totals = np.bincount(inverse.ravel(), weights=tokens, minlength=len(counts))
+            for group in np.nonzero(counts > 1)[0].tolist():
+                groups.append((int(counts[group]), int(totals[group] - tokens[first[group]]), int(first[group]), group))
+        else:
+            rows = {}
+            for i, value in enumerate(hashes):
+                rows.setdefault(value, []).append(i)
+            for group, indices in rows.items():
+                if len(indices) > 1:
+                    repeated = sum(spent[0][i] + spent[1][i] for i in indices[1:])
+                    groups.append((len(indices), repeated, indices[0], group))
+        groups.sort(key=lambda group: (-group[1], -group[0]))
+
+        starts = np.concatenate(([0], np.cumsum(self.columns["term_count"], dtype=np.int64))) if np is not None \
+            else self._term_starts()
+        entries = []
+        for calls, repeated, first, group in groups[:top]:
+            users = set(self.columns["user"][inverse.ravel() == group].tolist()) if np is not None \
+                else {self.columns["user"][i] for i in rows[group]}
+            term_ids = self.columns["terms"][int(starts[first]):int(starts[first]) + int(self.columns["term_count"][first])]
+            entries.append({
+                "calls": calls,
+                "users": len(users),
+                "repeated_tokens": repeated,
+                "lang": self.dictionaries["lang"][self.columns["lang"][first]],
+                "ingredients": ", ".join(self.dictionaries["term"][i] for i in term_ids)
+            })
+        return {
+            "prompts": len(groups),
+            "repeated_calls": sum(group[0] - 1 for group in groups),
+            "repeated_tokens": sum(group[1] for group in groups),
+            "top": entries
+        }
+
+
+# --- Command line ---------------------------------------------------------------------------
+
+def parse_since(value):
+    """'7d' / '12h' (relative to now) or an ISO date/time"""
+    if not value:
+        return None
+    units = {"d": "days", "h": "hours", "m": "minutes"}
+    if value[-1] in units and value[:-1].isdigit():
+        return datetime.now() - timedelta(**{units[value[-1]]: int(value[:-1])})
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid time: {value} (use e.g. 7d, 12h or 2024-05-01)")
+
+
+def print_table(rows, columns):
+    """Print dict rows as aligned columns"""
+    if not rows:
+        print("  (no entries)")
+        return
+    cells = [["-" if row[column] is None else str(row[column]) for column in columns] for row in rows]
+    widths = [max(len(column), *(len(line[i]) for line in cells)) for i, column in enumerate(columns)]
+    print("  " + "  ".join(column.ljust(width) for column, width in zip(columns, widths)))
+    for line in cells:
+        print("  " + "  ".join(cell.ljust(width) for cell, width in zip(line, widths)).rstrip())
+
+
+def run_query(table, name, by=None, top=10):
+    if name == "latency":
+        return table.latency(by)
+    if name == "tokens":
+        return table.tokens(by)[:top]
+    if name == "ingredients":
+        return table.ingredients(top, by)
+    return table.duplicates(top)
+
+
+def print_query(name, result, by=None):
+    group = by or "group"
+    if name == "latency":
+        print_table(result, [group, "calls", "mean_ms", "p50_ms", "p90_ms", "p99_ms", "first_token_p50_ms"])
+    elif name == "tokens":
+        print_table(result, [group, "calls", "input_tokens", "output_tokens", "cache_read_tokens",
+                             "cache_creation_tokens"])
+    elif name == "ingredients":
+        for label, ranking in result.items():
+            if by:
+                print(f"  {label}:")
+            print("  " + ", ".join(f"{term} ({count})" for term, count in ranking))
+    else:
+        print(f"  {result['prompts']} prompt(s) sent more than once: {result['repeated_calls']} repeated call(s), "
+              f"{result['repeated_tokens']} tokens")
+        print_table(result["top"], ["calls", "users", "repeated_tokens", "lang", "ingredients"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analytics over all users' API logs")
+    commands = parser.add_subparsers(dest="command", required=True)
+    update_parser = commands.add_parser("update", help="scan new log entries into the column store")
+    report_parser = commands.add_parser("report", help="update, then show all queries")
+    query_parser = commands.add_parser("query", help="update, then run one query")
+    query_parser.add_argument("query", choices=("latency", "tokens", "ingredients", "duplicates"))
+    query_parser.add_argument("--by", choices=GROUP_BY, help="group by (default: lang for latency, user for tokens)")
+    for command in (update_parser, report_parser, query_parser):
+        command.add_argument("users_dir", nargs="?", default=USERS_DIR)
+        command.add_argument("--workers", type=int, help="worker processes (default: CPU count)")
+    update_parser.add_argument("--rebuild", action="store_true", help="discard the column store and scan everything")
+    for command in (report_parser, query_parser):
+        command.add_argument("--since", type=parse_since, help="only entries since e.g. 7d, 12h or 2024-05-01")
+        command.add_argument("--top", type=int, default=10)
+        command.add_argument("--json", action="store_true", help="print the results as JSON")
+        command.add_argument("--no-update", action="store_true", help="query the column store as it is")
+    args = parser.parse_args()
+
+    analytics = LogAnalytics(args.users_dir)
+    if args.command == "update" or not args.no_update:
+        stats = analytics.update(args.workers, rebuild=getattr(args, "rebuild", False))
+        if args.command == "update" or not args.json:
+            print(f"[Analytics] {stats['rows']} new entries from {stats['users']} user(s), {stats['total']} in total")
+    if args.command == "update":
+        return 0
+
+    table = analytics.load(args.since)
+    if args.command == "query":
+        by = args.by or {"latency": "lang", "tokens": "user"}.get(args.query)
+        queries = [(args.query, by)]
+    else:
+        queries = [("latency", "lang"), ("tokens", "user"), ("tokens", "lang"), ("ingredients", None),
+                   ("duplicates", None)]
+    results = {f"{name}_by_{by}" if by else name: (name, by, run_query(table, name, by, args.top))
+               for name, by in queries}
+
+    if args.json:
+        print(json.dumps({key: result for key, (_, _, result) in results.items()}, indent=2, ensure_ascii=False))
+        return 0
+    print(f"{len(table)} entries" + (f" since {args.since:%Y-%m-%d %H:%M}" if args.since else ""))
+    for key, (name, by, result) in results.items():
+        print(f"\n{key.replace('_', ' ').capitalize()}:")
+        print_query(name, result, by)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Headless batch mode for the Recipe Assistant
+Reads JSONL jobs, runs them on a thread or process pool and writes JSONL results
+
+Job formats (one JSON object per line):
+  {"user": "alice", "ingredients": "tomatoes, pasta", "lang": "en"}
+  {"user": "alice", "type": "feedback", "dish": "Pasta Caprese", "rating": 5, "reason": ""}
+
+Jobs for the same user always run in input order, one at a time.
+Finished jobs are appended to the results file, so an interrupted run can be resumed.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import multiprocessing
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime
+
+import metrics
+import recipe_assistant as ra
+
+# Jobs of one user handed to a worker at once (results are written after each chunk)
+CHUNK_SIZE = 10
+
+def run_job(job, use_cache=True):
+    """Run a single job and return its result record"""
+    username = job["user"]
+    started = time.perf_counter()
+    record = {
+        "job": job["_line"],
+        "id": job.get("id"),
+        "user": username,
+        "type": job.get("type", "suggestion"),
+        "started_at": datetime.now().isoformat()
+    }
+
+    try:
+        if not username or not username.replace("_", "").replace("-", "").isalnum():
+            raise ValueError(f"Invalid username: {username!r}")
+
+        is_new_user = not os.path.isdir(ra.get_user_files(username)["dir"])
+        user_files = ra.ensure_user_directory(username)
+        if is_new_user:
+            preferences = ra.default_preferences(job.get("lang", "en"))
+            ra.save_preferences(preferences, user_files["preferences"])
+        else:
+            preferences = ra.load_preferences(user_files["preferences"])
+        lang = job.get("lang") or preferences.get("language", "en")
+
+        if record["type"] == "feedback":
+            rating = int(job["rating"])
+            if not 1 <= rating <= 5:
+                raise ValueError(f"Rating must be between 1 and 5, got {rating}")
+            verdict = ra.run_sync(ra.get_engine(None).record_feedback(
+                job["dish"], rating, preferences, user_files["preferences"], job.get("reason")))
+            record["result"] = {"verdict": verdict}
+        elif record["type"] == "suggestion":
+            ingredients = job.get("ingredients", "").strip()
+            if not ingredients:
+                raise ValueError("No ingredients provided")
+            # Default client and engine (one per worker process, shared by all threads)
+            response_text = ra.get_recipe_suggestion(
+                None, ingredients, preferences, user_files["preferences"],
+                user_files["log"], lang, use_cache=use_cache)
+            parser = ra.RecipeHeadingParser()
+            parser.feed(response_text)
+            record["result"] = {"recipes": parser.close(), "response": response_text}
+        else:
+            raise ValueError(f"Unknown job type: {record['type']}")
+        record["status"] = "ok"
+    except Exception as error:
+        record["status"] = "error"
+        record["error"] = f"{type(error).__name__}: {error}"
+
+    record["duration_ms"] = round((time.perf_counter() - started) * 1000, 2)
+    return record
+
+
+def run_user_jobs(jobs, use_cache=True):
+    """Run a chunk of one user's jobs in order (executed inside a worker)"""
+    results = [run_job(job, use_cache) for job in jobs]
+    if multiprocessing.parent_process() is not None:
+        # Worker processes flush their own metrics
+        metrics.export(ra.GLOBAL_LOG_FILE)
+    return results
+
+
+def read_jobs(jobs_file, done):
+    """Read jobs grouped by user, skipping jobs listed in done"""
+    by_user = OrderedDict()
+    invalid = []
+    with open(jobs_file, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f):
+            line = line.strip()
+            if not line or line_number in done:
+                continue
+            try:
+                job = json.loads(line)
+                job["_line"] = line_number
+                by_user.setdefault(job["user"], deque()).append(job)
+            except (ValueError, KeyError, TypeError) as error:
+                invalid.append({"job": line_number, "status": "error",
+                                "error": f"Invalid job: {error}", "duration_ms": 0})
+    return by_user, invalid
+
+
+def read_done(results_file, retry_errors=False):
+    """Collect line numbers of jobs that already have a result"""
+    done = set()
+    if not os.path.exists(results_file):
+        return done
+    with open(results_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if retry_errors and record.get("status") != "ok":
+                continue
+            done.add(record["job"])
+    return done
+
+
+def run_batch(jobs_file, results_file, workers=4, pool="thread", use_cache=True, retry_errors=False):
+    """Run all pending jobs and append their results, returns a summary dict"""
+    done = read_done(results_file, retry_errors)
+    by_user, invalid = read_jobs(jobs_file, done)
+    executor_class = ProcessPoolExecutor if pool == "process" else ThreadPoolExecutor
+
+    summary = {"skipped": len(done), "ok": 0, "error": 0}
+    started = time.perf_counter()
+
+    with open(results_file, 'a', encoding='utf-8') as out, executor_class(max_workers=workers) as executor:
+        def write(records):
+            for record in records:
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                summary["ok" if record["status"] == "ok" else "error"] += 1
+            out.flush()
+
+        write(invalid)
+
+        def submit_next(username):
+            queue = by_user[username]
+            chunk = [queue.popleft() for _ in range(min(CHUNK_SIZE, len(queue)))]
+            future = executor.submit(run_user_jobs, chunk, use_cache)
+            in_flight[future] = username
+
+        # At most one chunk per user is in flight, which keeps each user's jobs in order
+        in_flight = {}
+        for username in by_user:
+            submit_next(username)
+
+        while in_flight:
+            finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                username = in_flight.pop(future)
+                write(future.result())
+                if by_user[username]:
+                    submit_next(username)
+
+    summary["duration_s"] = round(time.perf_counter() - started, 2)
+    metrics.export(ra.GLOBAL_LOG_FILE)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run Recipe Assistant jobs from a JSONL file")
+    parser.add_argument("jobs", help="input JSONL file with jobs")
+    parser.add_argument("results", help="output JSONL file (appended; existing results are skipped)")
+    parser.add_argument("--workers", type=int, default=4, help="number of workers (default: 4)")
+    parser.add_argument("--pool", choices=["thread", "process"], default="thread", help="worker pool type")
+    parser.add_argument("--no-cache", action="store_true", help="bypass the suggestion cache")
+    parser.add_argument("--retry-errors", action="store_true", help="run failed jobs again")
+    args = parser.parse_args()
+
+    if not os.environ.get("ANTHROPIC_API_KEY"):
+        print("❌ Error: ANTHROPIC_API_KEY not found!")
+        return 1
+
+    summary = run_batch(args.jobs, args.results, workers=args.workers, pool=args.pool,
+                        use_cache=not args.no_cache, retry_errors=args.retry_errors)
+    print(f"Done: {summary['ok']} ok, {summary['error']} errors, "
+          f"{summary['skipped']} skipped ({summary['duration_s']}s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,4 @@
+"""
+Benchmarks for the Recipe Assistant
+Run from the repository root, e.g.: python3 -m benchmarks.bench_hot_paths run
+"""
@@ -0,0 +1,194 @@
+"""
+Benchmark of the cross-user log analytics (analytics.py)
+
+Generates synthetic API logs for many users (rotated segments, some of them gzipped), then:
+- times the full scan with one and with several worker processes,
+- appends new entries (including rotations) and times the incremental update,
+- times the queries (NumPy and plain Python) against the naive way: read_all() of every log,
+- checks the results against the naive computation and the two query paths against each other.
+
+Usage (from the repository root):
+  python3 -m benchmarks.bench_analytics [--users 100] [--entries 1000] [--workers 4]
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+from collections import Counter
+from datetime import datetime, timedelta
+
+import analytics
+import jsonl_log
+from ingredient_normalizer import canonical_names
+
+INGREDIENTS = ["tomatoes", "pasta", "basil", "rice", "eggs", "spinach", "potatoes", "onions", "cheese",
+               "chicken", "peppers", "lentils", "carrots", "garlic", "mushrooms", "zucchini", "tofu",
+               "Tomaten", "Nudeln", "Kartoffeln", "Zwiebeln", "Käse", "Eier", "Reis", "Paprika"]
+MODELS = ["claude-sonnet-4-20250514", "claude-3-5-haiku-20241022"]
+
+
+def make_pantries(rng, count=300):
+    return [", ".join(rng.sample(INGREDIENTS, rng.randint(2, 6))) for _ in range(count)]
+
+
+def make_entry(rng, pantries, username, when):
+    ingredients = rng.choice(pantries)
+    # A third of the prompts carry no user-specific context, so identical prompts repeat
+    context = "" if rng.random() < 0.33 else f"Liked: dish {rng.randint(0, 50)} of {username}\n"
+    precomputed = rng.random() < 0.05
+    entry = {
+        "timestamp": when.isoformat(),
+        "prompt": f"{context}Ingredients: {ingredients}\nSuggest 3 recipes.",
+        "response": "## Dish one\n...\n## Dish two\n...\n## Dish three\n...",
+        "ingredients": ingredients,
+        "lang": "de" if "Tomaten" in ingredients or rng.random() < 0.3 else "en",
+        "model": rng.choice(MODELS),
+        "usage": {"input_tokens": rng.randint(300, 900), "output_tokens": rng.randint(200, 1024),
+                  "cache_read_input_tokens": rng.choice([0, 512]), "cache_creation_input_tokens": 0},
+        "stop_reason": "end_turn"
+    }
+    if precomputed:
+        entry.update(precomputed=True, batch_id="msgbatch_1")
+    else:
+        entry.update(latency_ms=round(rng.lognormvariate(7.3, 0.4), 1),
+                     first_token_ms=round(rng.lognormvariate(6.2, 0.3), 1))
+    return entry
+
+
+def write_logs(users_dir, users, entries, seed=0, start=None, segment_bytes=64 * 1024):
+    """Append entries per user, rotating every segment_bytes (every 4th user gzips closed segments)"""
+    rng = random.Random(seed)
+    pantries = make_pantries(random.Random(1))
+    start = start or datetime(2024, 1, 1)
+    total = 0
+    for u in range(users):
+        username = f"user_{u:05d}"
+        user_dir = os.path.join(users_dir, username)
+        os.makedirs(user_dir, exist_ok=True)
+        log_file = os.path.join(user_dir, analytics.LOG_NAME)
+        lines = []
+        size = os.path.getsize(log_file) if os.path.exists(log_file) else 0
+        for i in range(entries):
+            when = start + timedelta(minutes=i * 7 + u)
+            line = json.dumps(make_entry(rng, pantries, username, when), ensure_ascii=False) + "\n"
+            lines.append(line)
+            size += len(line.encode("utf-8"))
+            if size >= segment_bytes:
+                with open(log_file, 'a', encoding='utf-8') as f:
+                    f.writelines(lines)
+                jsonl_log.rotate(log_file, compress=u % 4 == 0)
+                lines, size = [], 0
+        with open(log_file, 'a', encoding='utf-8') as f:
+            f.writelines(lines)
+        total += entries
+    return total
+
+
+def naive_tokens_and_ingredients(users_dir, top):
+    """The baseline: read every log completely and aggregate in Python"""
+    tokens, counter = {}, Counter()
+    for username in sorted(os.listdir(users_dir)):
+        if username.startswith("."):
+            continue
+        for entry in jsonl_log.read_all(os.path.join(users_dir, username, analytics.LOG_NAME)):
+            usage = entry.get("usage") or {}
+            tokens[username] = tokens.get(username, 0) + usage.get("input_tokens", 0) + usage.get("output_tokens", 0)
+            counter.update(canonical_names(entry.get("ingredients", "")))
+    return tokens, counter.most_common(top)
+
+
+def timed(func, *args, **kwargs):
+    t0 = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the cross-user log analytics")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--entries", type=int, default=1000, help="entries per user")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="recipe-analytics-")
+    users_dir = os.path.join(workdir, "users")
+    problems = []
+    try:
+        total, elapsed = timed(write_logs, users_dir, args.users, args.entries)
+        print(f"Generated {total} entries for {args.users} users in {elapsed:.1f}s")
+        store = analytics.LogAnalytics(users_dir)
+
+        print(f"\n{'scan':<28}{'seconds':>10}{'entries/s':>12}")
+        for workers in sorted({1, args.workers}):
+            stats, elapsed = timed(store.update, workers, rebuild=True)
+            print(f"{f'full, {workers} worker(s)':<28}{elapsed:>10.2f}{stats['rows'] / elapsed:>12.0f}")
+            if stats["rows"] != total:
+                problems.append(f"full scan found {stats['rows']} of {total} entries")
+
+        added = write_logs(users_dir, args.users, max(1, args.entries // 100), seed=1, start=datetime(2025, 1, 1))
+        stats, elapsed = timed(store.update, args.workers)
+        print(f"{f'incremental (+{added})':<28}{elapsed:>10.2f}{stats['rows'] / elapsed:>12.0f}")
+        if stats["rows"] != added or stats["total"] != total + added:
+            problems.append(f"incremental update found {stats['rows']} of {added} new entries")
+        stats, elapsed = timed(store.update, args.workers)
+        print(f"{'nothing new':<28}{elapsed:>10.2f}")
+        if stats["rows"]:
+            problems.append(f"update without new entries added {stats['rows']}")
+
+        # Queries: naive baseline, NumPy, plain Python
+        (naive_tokens, naive_top), naive_time = timed(naive_tokens_and_ingredients, users_dir, 10)
+        queries = [("latency by lang", lambda table: table.latency("lang")),
+                   ("latency by user", lambda table: table.latency("user")),
+                   ("tokens by user", lambda table: table.tokens("user")),
+                   ("tokens by lang", lambda table: table.tokens("lang")),
+                   ("top ingredients", lambda table: table.ingredients(10)),
+                   ("duplicate prompts", lambda table: table.duplicates(10))]
+        results = {}
+        paths = ["numpy", "python"] if analytics._numpy() is not None else ["python"]
+        print(f"\n{'query':<22}" + "".join(f"{path + ' ms':>12}" for path in paths))
+        timings = {}
+        for path in paths:
+            if path == "python":
+                analytics._np = None
+            table, load_time = timed(store.load)
+            timings[("load", path)] = load_time
+            for name, query in queries:
+                results[(name, path)], timings[(name, path)] = timed(query, table)
+        for name in ["load"] + [name for name, _ in queries]:
+            print(f"{name:<22}" + "".join(f"{timings[(name, path)] * 1000:>12.1f}" for path in paths))
+        print(f"{'naive read_all (tokens + ingredients)':<38}{naive_time * 1000:>10.1f} ms")
+
+        for name, _ in queries:
+            if len(paths) == 2 and results[(name, "numpy")] != results[(name, "python")]:
+                problems.append(f"{name}: NumPy and Python results differ")
+        tokens = {row["user"]: row["input_tokens"] + row["output_tokens"]
+                  for row in results[("tokens by user", "python")]}
+        if tokens != naive_tokens:
+            problems.append("token spend differs from the naive computation")
+        if [count for _, count in results[("top ingredients", "python")]["all"]] != [c for _, c in naive_top]:
+            problems.append("ingredient counts differ from the naive computation")
+
+        since = store.load(datetime(2025, 1, 1))
+        if len(since) != added:
+            problems.append(f"--since selected {len(since)} of {added} entries")
+        duplicates = results[("duplicate prompts", "python")]
+        print(f"\nDuplicate prompts: {duplicates['prompts']} ({duplicates['repeated_calls']} repeated calls, "
+              f"{duplicates['repeated_tokens']} tokens)")
+        column_bytes = sum(os.path.getsize(os.path.join(store.directory, name))
+                           for name in os.listdir(store.directory) if name.endswith(".bin"))
+        print(f"Column store: {column_bytes / 1e6:.1f} MB for {total + added} entries "
+              f"({column_bytes / (total + added):.0f} bytes per entry)")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print("OK" if not problems else "; ".join(problems))
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
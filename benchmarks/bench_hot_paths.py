@@ -0,0 +1,244 @@
+"""
+Microbenchmarks for the local hot paths of the Recipe Assistant
+
+Usage (from the repository root):
+  python3 -m benchmarks.bench_hot_paths run --out baseline.json
+  python3 -m benchmarks.bench_hot_paths run --sizes 10,1000 --out current.json
+  python3 -m benchmarks.bench_hot_paths compare baseline.json current.json --threshold 0.2
+"""
+
+import io
+import sys
+import json
+import time
+import shutil
+import random
+import argparse
+import builtins
+import platform
+import tracemalloc
+import contextlib
+from datetime import datetime, timedelta
+
+import recipe_assistant as ra
+from benchmarks.fake_client import FakeAnthropic, canned_response, RECIPE_NAMES, isolated_workdir
+
+# Number of ratings per synthetic user
+DEFAULT_SIZES = [10, 1000, 10000, 100000]
+# Number of entries in the synthetic API logs
+DEFAULT_LOG_SIZES = [100, 10000]
+# Each operation runs at least MIN_RUNS times and at least MIN_TIME seconds
+MIN_RUNS = 5
+MIN_TIME = 0.5
+MAX_RUNS = 20000
+
+
+def make_profile(num_ratings, lang="en", seed=0):
+    """Generate a synthetic preference profile with num_ratings ratings"""
+    rng = random.Random(seed)
+    start = datetime(2023, 1, 1)
+    ratings, liked, disliked = [], [], []
+    for i in range(num_ratings):
+        dish = f"{rng.choice(RECIPE_NAMES)} {i % 97}"
+        rating = rng.randint(1, 5)
+        entry = {"dish": dish, "rating": rating, "date": (start + timedelta(hours=i)).isoformat()}
+        if rating <= 2:
+            entry["reason"] = "too salty"
+            disliked.append(dish)
+        elif rating >= 4:
+            liked.append(dish)
+        ratings.append(entry)
+
+    suggested = [{
+        "name": f"{rng.choice(RECIPE_NAMES)} {i}",
+        "ingredients": "tomatoes, mozzarella, basil, pasta, garlic, olive oil",
+        "suggested_at": (start + timedelta(days=i)).isoformat(),
+        "rated": i % 3 == 0
+    } for i in range(20)]
+
+    return {
+        "language": lang,
+        "liked_dishes": liked,
+        "disliked_dishes": disliked,
+        "ratings": ratings,
+        "dietary_restrictions": ["vegetarian", "no nuts"],
+        "suggested_recipes": suggested
+    }
+
+
+def write_log(log_file, num_entries):
+    """Write a synthetic JSONL API log"""
+    prompt = ra.t("en", "claude_prompt_ingredients").format(ingredients="tomatoes, pasta", preferences="")
+    with open(log_file, 'w', encoding='utf-8') as f:
+        for i in range(num_entries):
+            entry = {"timestamp": datetime(2024, 1, 1).isoformat(), "prompt": prompt,
+                     "response": canned_response(i)}
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+def percentile(sorted_samples, q):
+    """Nearest-rank percentile of sorted samples"""
+    if not sorted_samples:
+        return 0.0
+    index = min(len(sorted_samples) - 1, max(0, int(round(q / 100 * len(sorted_samples))) - 1))
+    return sorted_samples[index]
+
+
+def measure(func, min_runs=MIN_RUNS, min_time=MIN_TIME, max_runs=MAX_RUNS):
+    """Time func repeatedly; report ops/sec, p50/p99 latency and peak memory"""
+    samples = []
+    sink = io.StringIO()
+    with contextlib.redirect_stdout(sink):
+        func()  # Warm-up
+        begin = time.perf_counter()
+        while len(samples) < max_runs and (len(samples) < min_runs or time.perf_counter() - begin < min_time):
+            t0 = time.perf_counter()
+            func()
+            samples.append(time.perf_counter() - t0)
+            sink.seek(0)
+            sink.truncate()
+
+        # Peak memory of a single run (measured separately, tracemalloc slows things down)
+        tracemalloc.start()
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    samples.sort()
+    total = sum(samples)
+    return {
+        "runs": len(samples),
+        "ops_per_sec": round(len(samples) / total, 2) if total else 0.0,
+        "p50_ms": round(percentile(samples, 50) * 1000, 4),
+        "p99_ms": round(percentile(samples, 99) * 1000, 4),
+        "peak_kib": round(peak / 1024, 1)
+    }
+
+
+def setup_user(username, num_ratings):
+    """Create a synthetic user with the configured storage backend"""
+    user_files = ra.ensure_user_directory(username)
+    prefs = make_profile(num_ratings, seed=num_ratings)
+    storage = ra.get_storage()
+    if hasattr(storage, "import_profile"):
+        storage.import_profile(username, prefs)
+    else:
+        ra.save_preferences(prefs, user_files["preferences"])
+    return user_files, ra.load_preferences(user_files["preferences"])
+
+
+def benchmark_cases(sizes, log_sizes):
+    """Yield (operation, size, func) for all benchmarked operations"""
+    client = FakeAnthropic()
+    response_text = canned_response("bench")
+
+    for size in sizes:
+        user_files, prefs = setup_user(f"bench_{size}", size)
+        pref_file = user_files["preferences"]
+
+        yield "load_preferences", size, lambda: ra.load_preferences(pref_file)
+        yield "save_preferences", size, lambda: ra.save_preferences(prefs, pref_file)
+        yield "build_prompt", size, lambda: ra.build_suggestion_prompt("tomatoes, pasta, basil", prefs, "en")
+        yield "save_suggested_recipes", size, lambda: ra.save_suggested_recipes(
+            response_text, "tomatoes, pasta, basil", prefs, pref_file)
+
+        def select_recipe():
+            original_input = builtins.input
+            builtins.input = lambda prompt="": "0"
+            try:
+                ra.select_recipe_from_suggestions(prefs, "en", pref_file)
+            finally:
+                builtins.input = original_input
+        yield "select_recipe_from_suggestions", size, select_recipe
+
+        yield "get_recipe_suggestion", size, lambda: ra.get_recipe_suggestion(
+            client, "tomatoes, pasta, basil", prefs, pref_file, user_files["log"], "en", use_cache=False)
+
+    for log_size in log_sizes:
+        user_files = ra.ensure_user_directory(f"bench_log_{log_size}")
+        write_log(user_files["log"], log_size)
+        log_file = user_files["log"]
+        yield "log_api_call", log_size, lambda: ra.log_api_call("prompt", response_text, log_file)
+        yield "load_api_log_last_5", log_size, lambda: ra.load_api_log(log_file, last=5)
+
+
+def run(args):
+    sizes = [int(s) for s in args.sizes.split(",")] if args.sizes else DEFAULT_SIZES
+    log_sizes = [int(s) for s in args.log_sizes.split(",")] if args.log_sizes else DEFAULT_LOG_SIZES
+
+    workdir = isolated_workdir("recipe-bench-", args.storage)
+
+    results = {}
+    try:
+        print(f"{'operation':<32}{'size':>8}{'ops/s':>12}{'p50 ms':>11}{'p99 ms':>11}{'peak KiB':>11}")
+        for operation, size, func in benchmark_cases(sizes, log_sizes):
+            stats = measure(func, min_time=args.min_time)
+            results[f"{operation}[{size}]"] = stats
+            print(f"{operation:<32}{size:>8}{stats['ops_per_sec']:>12}{stats['p50_ms']:>11}"
+                  f"{stats['p99_ms']:>11}{stats['peak_kib']:>11}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump({
+                "meta": {
+                    "date": datetime.now().isoformat(),
+                    "python": platform.python_version(),
+                    "platform": platform.platform(),
+                    "storage": ra.get_storage().name
+                },
+                "results": results
+            }, f, indent=2)
+        print(f"\nSaved results to {args.out}")
+    return 0
+
+
+def compare(args):
+    """Compare two result files; exit code 1 if any p50 regressed beyond the threshold"""
+    with open(args.baseline, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)["results"]
+    with open(args.current, 'r', encoding='utf-8') as f:
+        current = json.load(f)["results"]
+
+    regressions = 0
+    print(f"{'benchmark':<42}{'base p50':>11}{'new p50':>11}{'change':>10}")
+    for key in sorted(set(baseline) & set(current)):
+        old, new = baseline[key]["p50_ms"], current[key]["p50_ms"]
+        change = (new - old) / old if old else 0.0
+        flag = ""
+        if change > args.threshold:
+            flag = "  REGRESSION"
+            regressions += 1
+        print(f"{key:<42}{old:>11}{new:>11}{change:>+10.1%}{flag}")
+
+    for key in sorted(set(baseline) ^ set(current)):
+        print(f"{key:<42}  (only in {'baseline' if key in baseline else 'current'})")
+
+    print(f"\n{regressions} regression(s) beyond {args.threshold:.0%}")
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recipe Assistant hot path benchmarks")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="run the benchmarks")
+    run_parser.add_argument("--sizes", help="comma-separated ratings per user (default: 10,1000,10000,100000)")
+    run_parser.add_argument("--log-sizes", help="comma-separated log entry counts (default: 100,10000)")
+    run_parser.add_argument("--storage", choices=["json", "sqlite"], help="storage backend to benchmark")
+    run_parser.add_argument("--min-time", type=float, default=MIN_TIME, help="seconds per operation")
+    run_parser.add_argument("--out", help="save results as JSON (baseline)")
+
+    compare_parser = commands.add_parser("compare", help="compare two result files")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.2,
+                                help="relative p50 slowdown reported as regression (default: 0.2)")
+
+    args = parser.parse_args()
+    return run(args) if args.command == "run" else compare(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,164 @@
+"""
+Benchmark of the ingredient canonicalization (ingredient_normalizer.py)
+
+- Throughput of canonicalizing free-text ingredient lists (cold caches, repeated lists, new lists),
+  next to the previous normalization (lowercase, split, sort)
+- How many more requests share a cache key: distinct keys of the previous and the
+  canonical normalization on the same mixed English/German lists
+- Equivalence checks ("Tomaten, Mozzarella" == "mozzarella, tomatoes", ...)
+- Bulk re-normalization of synthetic profiles and logs (renormalize_all)
+
+Usage (from the repository root):
+  python3 -m benchmarks.bench_ingredients [--lists 100000] [--users 200] [--entries 200]
+"""
+
+import os
+import sys
+import json
+import random
+import shutil
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+
+import ingredient_normalizer as normalizer
+from benchmarks.bench_analytics import timed
+
+# Must canonicalize to the same set
+EQUIVALENT = [
+    ("Tomaten, Mozzarella", "mozzarella, tomatoes"),
+    ("Eier, Reis, Spinat", "eggs; rice; spinach"),
+    ("2 große Kartoffeln und frische Zwiebeln", "onions, potatoes"),
+    ("500g Hackfleisch, Paprika", "ground beef, red peppers"),
+    ("Kichererbsen, Kokosmilch, Süßkartoffeln", "sweet potatoes, coconut milk, chickpeas"),
+    ("Frühlingszwiebeln & Sojasoße", "soy sauce, scallions"),
+    ("Salz und Pfeffer", "salt, black pepper"),
+    ("Nudeln, Basilikum, Knoblauch", "pasta, basil, garlic cloves"),
+]
+# Must stay different
+DIFFERENT = [
+    ("cherry tomatoes", "tomatoes"),
+    ("chicken breast", "chicken"),
+    ("olive oil", "olives"),
+    ("sweet potatoes", "potatoes"),
+]
+DECORATIONS = ["", "", "", "2 ", "fresh ", "frische ", "500g ", "a handful of ", "1 Dose "]
+UNKNOWN = ["dragonfruit", "kohlrabi", "miso", "tahini", "halloumi", "gnocchi", "pak choi", "tempeh"]
+
+
+def legacy_normalize(ingredients):
+    """The previous normalization: lowercase, split on commas, deduplicate, sort"""
+    items = {item.strip().lower() for item in ingredients.replace(";", ",").split(",")}
+    return ", ".join(sorted(item for item in items if item))
+
+
+def make_lists(count, seed=0):
+    """Mixed English/German ingredient lists with plurals, quantities and capitalization"""
+    rng = random.Random(seed)
+    variants = [list(entry) for entry in normalizer.VOCABULARY[:60]]
+    lists = []
+    for _ in range(count):
+        items = []
+        for entry in rng.sample(variants, rng.randint(2, 6)):
+            item = rng.choice(DECORATIONS) + rng.choice(entry)
+            items.append(item.capitalize() if rng.random() < 0.4 else item)
+        if rng.random() < 0.2:
+            items.append(rng.choice(UNKNOWN))
+        rng.shuffle(items)
+        lists.append(rng.choice([", ", "; ", ","]).join(items))
+    return lists
+
+
+def clear_caches():
+    normalizer.canonical_item.cache_clear()
+    normalizer.canonical_names.cache_clear()
+    normalizer.ingredient_ids.cache_clear()
+
+
+def write_tree(users_dir, users, entries, lists):
+    """Profiles with 20 suggestions each and API logs, returns (suggestions, log entries)"""
+    rng = random.Random(1)
+    start = datetime(2024, 1, 1)
+    for u in range(users):
+        user_dir = os.path.join(users_dir, f"user_{u:05d}")
+        os.makedirs(user_dir)
+        suggestions = [{"name": f"Dish {i}", "ingredients": rng.choice(lists),
+                        "suggested_at": (start + timedelta(hours=i)).isoformat(), "rated": False}
+                       for i in range(20)]
+        with open(os.path.join(user_dir, "preferences.json"), 'w', encoding='utf-8') as f:
+            json.dump({"language": "en", "liked_dishes": [], "disliked_dishes": [], "ratings": [],
+                       "dietary_restrictions": [], "suggested_recipes": suggestions}, f, ensure_ascii=False)
+        with open(os.path.join(user_dir, "api_log.jsonl"), 'w', encoding='utf-8') as f:
+            for i in range(entries):
+                ingredients = rng.choice(lists)
+                f.write(json.dumps({"timestamp": (start + timedelta(minutes=i)).isoformat(),
+                                    "prompt": f"Available ingredients: {ingredients}",
+                                    "response": "## Dish one\n## Dish two", "ingredients": ingredients,
+                                    "lang": "en", "usage": {"input_tokens": 400, "output_tokens": 300}},
+                                   ensure_ascii=False) + "\n")
+    return users * 20, users * entries
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the ingredient canonicalization")
+    parser.add_argument("--lists", type=int, default=100000, help="ingredient lists to canonicalize")
+    parser.add_argument("--users", type=int, default=200, help="users for the bulk re-normalization")
+    parser.add_argument("--entries", type=int, default=200, help="log entries per user")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+    problems = []
+
+    lists = make_lists(args.lists)
+    print(f"{'normalization':<34}{'seconds':>10}{'lists/s':>12}")
+    _, elapsed = timed(lambda: [legacy_normalize(text) for text in lists])
+    print(f"{'previous (lowercase/split/sort)':<34}{elapsed:>10.2f}{len(lists) / elapsed:>12.0f}")
+    clear_caches()
+    _, elapsed = timed(lambda: [normalizer.ingredient_ids(text) for text in lists])
+    print(f"{'canonical IDs, cold caches':<34}{elapsed:>10.2f}{len(lists) / elapsed:>12.0f}")
+    # Repeated requests: a working set that fits the list cache
+    repeated = lists[:normalizer.ingredient_ids.cache_info().maxsize // 2] * 10
+    _, elapsed = timed(lambda: [normalizer.ingredient_ids(text) for text in repeated])
+    print(f"{'canonical IDs, repeated lists':<34}{elapsed:>10.2f}{len(repeated) / elapsed:>12.0f}")
+    clear_caches()
+    # Only the per-item cache: every list is new, its items are not
+    _, elapsed = timed(lambda: [normalizer.canonical_names.__wrapped__(text) for text in lists])
+    print(f"{'canonical names, new lists':<34}{elapsed:>10.2f}{len(lists) / elapsed:>12.0f}")
+
+    legacy_keys = {legacy_normalize(text) for text in lists}
+    canonical_keys = {normalizer.canonical_key(text) for text in lists}
+    print(f"\nDistinct cache keys: {len(legacy_keys)} previous, {len(canonical_keys)} canonical "
+          f"({len(lists) - len(canonical_keys)} of {len(lists)} requests share a key, "
+          f"previously {len(lists) - len(legacy_keys)})")
+
+    for a, b in EQUIVALENT:
+        if normalizer.ingredient_ids(a) != normalizer.ingredient_ids(b):
+            problems.append(f"{a!r} != {b!r}: {normalizer.canonical_names(a)} vs {normalizer.canonical_names(b)}")
+    for a, b in DIFFERENT:
+        if normalizer.ingredient_ids(a) == normalizer.ingredient_ids(b):
+            problems.append(f"{a!r} and {b!r} should differ")
+
+    workdir = tempfile.mkdtemp(prefix="recipe-ingredients-")
+    try:
+        users_dir = os.path.join(workdir, "users")
+        suggestions, log_entries = write_tree(users_dir, args.users, args.entries, lists[:5000])
+        clear_caches()
+        results, elapsed = timed(normalizer.renormalize_all, users_dir, args.workers,
+                                 os.path.join(workdir, "recipe_index.db"))
+        print(f"\nBulk re-normalization of {args.users} users: {elapsed:.2f}s "
+              f"({results['suggestions']} suggestions, {results['log_entries']} log entries, "
+              f"{(results['suggestions'] + results['log_entries']) / elapsed:.0f} items/s)")
+        if results["suggestions"] != suggestions or results["log_entries"] != log_entries:
+            problems.append(f"re-normalized {results} instead of {suggestions} suggestions, {log_entries} entries")
+        with open(os.path.join(users_dir, "user_00000", "preferences.json"), encoding='utf-8') as f:
+            recipe = json.load(f)["suggested_recipes"][0]
+        if recipe.get("ingredient_ids") != list(normalizer.ingredient_ids(recipe["ingredients"])):
+            problems.append("profile suggestions have no ingredient IDs after re-normalization")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print("OK" if not problems else "; ".join(problems))
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,232 @@
+"""
+End-to-end load test of the Recipe Assistant against the local mock Messages API
+
+N simulated users run the real CLI flow in threads: load the profile, get_recipe_suggestion
+(real Anthropic SDK client via base_url; the suggestion is saved with save_suggested_recipes)
+and get_feedback with a scripted rating. Concurrency is ramped (1, 2, 4, ...) until the p95
+of a session breaches the latency SLO. For every level the harness reports throughput,
+latency percentiles, file operations per session, profile merges and errors by type.
+
+The mock runs in its own process (so it does not compete for the GIL), with a lognormal
+latency by default; error rates and streaming can be set as well. Use --base-url to
+point the harness at an already running mock instead.
+
+Usage (from the repository root):
+  python3 -m benchmarks.bench_load [--users 50] [--ratings 1000] [--storage json] [--slo-ms 1500]
+                                   [--latency 0.2] [--distribution lognormal] [--error-rate 0.02]
+                                   [--stream] [--max-concurrency 64] [--duration 5] [--out load.json]
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import builtins
+import threading
+import subprocess
+import contextlib
+
+import recipe_assistant as ra
+import metrics
+import server
+from benchmarks.bench_hot_paths import percentile, setup_user
+from benchmarks.mock_messages_server import DISTRIBUTIONS
+from benchmarks.fake_client import isolated_workdir
+
+PANTRIES = ["tomatoes, pasta, basil", "rice, eggs, spinach", "potatoes, onions, cheese",
+            "chicken, peppers, rice", "lentils, carrots, onions", "Tomaten, Nudeln, Knoblauch",
+            "salmon, lemon, potatoes", "tofu, broccoli, soy sauce", "Kichererbsen, Spinat, Kokosmilch"]
+
+# Answers for the input() prompts of get_feedback, per thread
+_answers = threading.local()
+
+
+def scripted_input(prompt=""):
+    return _answers.queue.pop(0)
+
+
+def start_mock(args):
+    """Start the mock in a subprocess, returns (process, base_url)"""
+    command = [sys.executable, "-m", "benchmarks.mock_messages_server", "--port", "0",
+               "--latency", str(args.latency), "--distribution", args.distribution, "--sigma", str(args.sigma),
+               "--chunk-size", str(args.chunk_size), "--chunk-delay", str(args.chunk_delay), "--error-rate", str(args.error_rate),
+               "--error-status", str(args.error_status)]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    line = process.stdout.readline()
+    if "http://" not in line:
+        process.kill()
+        raise RuntimeError(f"Mock server did not start: {line!r}")
+    return process, line.split(" on ")[1].split()[0]
+
+
+def error_name(error):
+    status = getattr(error, "status_code", None)
+    return f"{type(error).__name__} {status}" if status else type(error).__name__
+
+
+def session(client, user, rng, stream):
+    """One user session: suggestion (saved) + feedback. Returns (suggest seconds, feedback seconds)"""
+    user_files = ra.get_user_files(user)
+    preferences = ra.load_preferences(user_files["preferences"])
+    lang = preferences.get("language", "en")
+    started = time.perf_counter()
+    response_text = ra.get_recipe_suggestion(client, rng.choice(PANTRIES), preferences, user_files["preferences"],
+                                             user_files["log"], lang, use_cache=False,
+                                             on_text=(lambda text: None) if stream else None,
+                                             offline_first=False, use_precomputed=False)
+    suggested = time.perf_counter()
+    parser = ra.RecipeHeadingParser()
+    parser.feed(response_text)
+    recipe_names = parser.close()
+    if recipe_names:
+        rating = rng.randint(1, 5)
+        _answers.queue = [str(rating)] + (["too salty"] if rating <= 2 else [])
+        ra.get_feedback(rng.choice(recipe_names), preferences, user_files["preferences"], lang)
+    return suggested - started, time.perf_counter() - suggested
+
+
+def run_level(client, users, concurrency, duration, stream, seed):
+    """Run concurrency threads for duration seconds, returns the level's results"""
+    metrics.reset()
+    deadline = time.perf_counter() + duration
+    samples, errors = [], {}
+    lock = threading.Lock()
+
+    def worker(index):
+        rng = random.Random(seed * 1000 + index)
+        while time.perf_counter() < deadline:
+            try:
+                result = session(client, rng.choice(users), rng, stream)
+            except Exception as error:
+                with lock:
+                    errors[error_name(error)] = errors.get(error_name(error), 0) + 1
+                continue
+            with lock:
+                samples.append(result)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    sessions = len(samples) or 1
+    counters = {}
+    for counter in metrics.snapshot()["counters"]:
+        if counter["name"] == "recipe_file_ops_total":
+            key = f"{counter['labels']['file']}_{counter['labels']['op']}s"
+            counters[key] = counters.get(key, 0) + counter["value"]
+        elif counter["name"] in ("recipe_preferences_merges_total", "recipe_api_retries_total"):
+            counters[counter["name"]] = counters.get(counter["name"], 0) + counter["value"]
+    totals = sorted(suggest + feedback for suggest, feedback in samples) or [0.0]
+    suggests = sorted(suggest for suggest, _ in samples) or [0.0]
+    feedbacks = sorted(feedback for _, feedback in samples) or [0.0]
+    return {
+        "concurrency": concurrency,
+        "sessions": len(samples),
+        "throughput": round(len(samples) / elapsed, 2),
+        "p50_ms": round(percentile(totals, 50) * 1000, 1),
+        "p95_ms": round(percentile(totals, 95) * 1000, 1),
+        "p99_ms": round(percentile(totals, 99) * 1000, 1),
+        "suggest_p95_ms": round(percentile(suggests, 95) * 1000, 1),
+        "feedback_p95_ms": round(percentile(feedbacks, 95) * 1000, 1),
+        "file_ops_per_session": round(sum(counters.get(key, 0) for key in counters if key.endswith("s")
+                                          and not key.startswith("recipe_")) / sessions, 2),
+        "file_ops": {key: round(value / sessions, 2) for key, value in sorted(counters.items())
+                     if not key.startswith("recipe_")},
+        "merges_per_session": round(counters.get("recipe_preferences_merges_total", 0) / sessions, 3),
+        "retries": counters.get("recipe_api_retries_total", 0),
+        "errors": errors
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ramp a simulated user load until the latency SLO is breached")
+    parser.add_argument("--users", type=int, default=50, help="simulated users")
+    parser.add_argument("--ratings", type=int, default=1000, help="ratings per synthetic profile")
+    parser.add_argument("--storage", choices=["json", "sqlite"], default="json")
+    parser.add_argument("--slo-ms", type=float, default=1500, help="p95 session latency SLO")
+    parser.add_argument("--start-concurrency", type=int, default=1)
+    parser.add_argument("--max-concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds per concurrency level")
+    parser.add_argument("--api-concurrency", type=int, default=ra.MAX_CONCURRENT_REQUESTS,
+                        help="concurrent model calls of the engine")
+    parser.add_argument("--stream", action="store_true", help="stream the responses")
+    parser.add_argument("--base-url", help="use a running mock instead of starting one")
+    parser.add_argument("--latency", type=float, default=0.2, help="mock latency (mean/median) in seconds")
+    parser.add_argument("--distribution", choices=DISTRIBUTIONS, default="lognormal")
+    parser.add_argument("--sigma", type=float, default=0.5, help="spread of the lognormal latency")
+    parser.add_argument("--chunk-size", type=int, default=16, help="characters per streamed chunk")
+    parser.add_argument("--chunk-delay", type=float, default=0.0, help="seconds between streamed chunks")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of mock requests that fail")
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--out", help="write the results as JSON")
+    args = parser.parse_args()
+
+    workdir = isolated_workdir("recipe-load-", args.storage)
+    metrics.enable()
+    mock, base_url = start_mock(args) if not args.base_url else (None, args.base_url)
+    client = server.make_client(base_url)
+    ra.get_engine(client).max_concurrency = args.api_concurrency
+    original_input = builtins.input
+    builtins.input = scripted_input
+    levels = []
+    breached = None
+    try:
+        print(f"Setting up {args.users} users with {args.ratings} ratings ({args.storage} storage)...")
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            users = []
+            for i in range(args.users):
+                setup_user(f"load_{i:04d}", args.ratings)
+                users.append(f"load_{i:04d}")
+
+        print(f"Mock: {args.distribution} latency {args.latency * 1000:.0f} ms, {args.error_rate:.0%} errors "
+              f"({base_url}); SLO: p95 <= {args.slo_ms:.0f} ms per session\n")
+        header = (f"{'conc':>5}{'sessions':>10}{'req/s':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+                  f"{'fs ops':>8}{'merges':>8}{'retries':>9}  errors")
+        print(header)
+        concurrency = args.start_concurrency
+        while concurrency <= args.max_concurrency:
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                level = run_level(client, users, concurrency, args.duration, args.stream, seed=concurrency)
+            levels.append(level)
+            errors = ", ".join(f"{name}: {count}" for name, count in sorted(level["errors"].items())) or "-"
+            print(f"{level['concurrency']:>5}{level['sessions']:>10}{level['throughput']:>8.1f}"
+                  f"{level['p50_ms']:>9.0f}{level['p95_ms']:>9.0f}{level['p99_ms']:>9.0f}"
+                  f"{level['file_ops_per_session']:>8.1f}{level['merges_per_session']:>8.2f}{level['retries']:>9}  {errors}")
+            if level["p95_ms"] > args.slo_ms or not level["sessions"]:
+                breached = level
+                break
+            concurrency *= 2
+    finally:
+        builtins.input = original_input
+        if mock is not None:
+            mock.terminate()
+            mock.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if levels:
+        print("\nFile operations per session at the last level: "
+              + ", ".join(f"{name} {value}" for name, value in levels[-1]["file_ops"].items()))
+    sustained = [level for level in levels if level is not breached]
+    if breached is not None:
+        best = max(sustained, key=lambda level: level["throughput"]) if sustained else None
+        print(f"SLO breached at concurrency {breached['concurrency']} (p95 {breached['p95_ms']:.0f} ms)"
+              + (f"; best within the SLO: {best['throughput']:.1f} sessions/s at concurrency "
+                 f"{best['concurrency']}" if best else ""))
+    else:
+        print(f"SLO held up to concurrency {args.max_concurrency}")
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump({"settings": vars(args), "levels": levels,
+                       "breached_at": breached["concurrency"] if breached else None}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
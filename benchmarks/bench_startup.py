@@ -0,0 +1,142 @@
+"""
+Startup benchmark for short-lived invocations of the Recipe Assistant
+
+Every case runs in a fresh interpreter (as from the shell or cron), without an API key:
+- python: bare interpreter startup (the floor)
+- import: import recipe_assistant
+- import+sdk: import recipe_assistant plus the Anthropic SDK (what every start cost before
+  the SDK was imported lazily; skipped if the SDK is not installed)
+- option_3 / option_4: full start to "view preferences" / "view API log" and exit
+
+Results use the bench_hot_paths format, so runs can be compared with
+  python3 -m benchmarks.bench_hot_paths compare baseline.json current.json
+
+Usage (from the repository root):
+  python3 -m benchmarks.bench_startup [--runs 10] [--out startup.json]
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import subprocess
+import importlib.util
+from datetime import datetime
+
+from benchmarks.bench_hot_paths import percentile
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RUNS = 10
+
+
+def make_workdir():
+    """Working directory with one user (and a short API log) for the option runs"""
+    workdir = tempfile.mkdtemp(prefix="recipe-startup-")
+    code = (
+        "import recipe_assistant as ra\n"
+        "files = ra.ensure_user_directory('alice')\n"
+        "prefs = ra.default_preferences('en')\n"
+        "ra.get_registry().register('alice', 'en', lambda: ra.save_preferences(prefs, files['preferences']))\n"
+        "ra.log_api_call('tomatoes', '## Pasta', files['log'])\n"
+    )
+    subprocess.run([sys.executable, "-c", code], cwd=workdir, env=child_env(),
+                   check=True, stdout=subprocess.DEVNULL)
+    return workdir
+
+
+def child_env():
+    env = dict(os.environ)
+    env.pop("ANTHROPIC_API_KEY", None)
+    env.pop("RECIPE_ASSISTANT_METRICS", None)
+    env["PYTHONPATH"] = REPO_DIR + os.pathsep + env.get("PYTHONPATH", "")
+    return env
+
+
+def startup_cases(workdir):
+    """(name, argv, stdin) per case"""
+    script = os.path.join(REPO_DIR, "recipe_assistant.py")
+    cases = [
+        ("python", [sys.executable, "-c", "pass"], None),
+        ("import", [sys.executable, "-c", "import recipe_assistant"], None),
+    ]
+    if importlib.util.find_spec("anthropic") is not None:
+        cases.append(("import+sdk", [sys.executable, "-c", "import recipe_assistant, anthropic"], None))
+    cases += [
+        ("option_3", [sys.executable, script], "1\n3\n"),
+        ("option_4", [sys.executable, script], "1\n4\n1\n"),
+    ]
+    return cases
+
+
+def measure_process(argv, stdin, cwd, runs):
+    """Wall time of a fresh process (one warm-up run for the bytecode cache)"""
+    samples = []
+    for i in range(runs + 1):
+        t0 = time.perf_counter()
+        result = subprocess.run(argv, input=stdin, cwd=cwd, env=child_env(), text=True,
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        elapsed = time.perf_counter() - t0
+        if result.returncode != 0:
+            raise RuntimeError(f"{' '.join(argv)} failed:\n{result.stderr}")
+        if i:
+            samples.append(elapsed)
+    samples.sort()
+    return {
+        "runs": len(samples),
+        "ops_per_sec": round(len(samples) / sum(samples), 2),
+        "p50_ms": round(percentile(samples, 50) * 1000, 2),
+        "p99_ms": round(percentile(samples, 99) * 1000, 2)
+    }
+
+
+def sdk_imported_at_startup(workdir):
+    """Check that importing recipe_assistant does not import the SDK"""
+    code = "import sys, recipe_assistant; print('anthropic' in sys.modules)"
+    result = subprocess.run([sys.executable, "-c", code], cwd=workdir, env=child_env(),
+                            text=True, stdout=subprocess.PIPE, check=True)
+    return result.stdout.strip() == "True"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recipe Assistant startup benchmark")
+    parser.add_argument("--runs", type=int, default=RUNS, help="runs per case")
+    parser.add_argument("--out", help="save results as JSON (baseline)")
+    args = parser.parse_args()
+
+    workdir = make_workdir()
+    results = {}
+    try:
+        print(f"{'case':<16}{'p50 ms':>10}{'p99 ms':>10}")
+        for name, argv, stdin in startup_cases(workdir):
+            stats = measure_process(argv, stdin, workdir, args.runs)
+            results[f"startup[{name}]"] = stats
+            print(f"{name:<16}{stats['p50_ms']:>10}{stats['p99_ms']:>10}")
+        sdk_eager = sdk_imported_at_startup(workdir)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if "startup[import+sdk]" in results:
+        saved = results["startup[import+sdk]"]["p50_ms"] - results["startup[import]"]["p50_ms"]
+        print(f"\nSDK import avoided by the read-only paths: {saved:.1f} ms")
+    print("SDK imported at startup: " + ("yes (lazy import broken)" if sdk_eager else "no"))
+
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump({
+                "meta": {
+                    "date": datetime.now().isoformat(),
+                    "python": platform.python_version(),
+                    "platform": platform.platform()
+                },
+                "results": results
+            }, f, indent=2)
+        print(f"\nSaved results to {args.out}")
+    return 1 if sdk_eager else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
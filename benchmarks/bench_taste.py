@@ -0,0 +1,206 @@
+"""
+Benchmark and check of the per-user taste models (taste_model.py)
+
+Synthetic users share a population taste (cuisines and ingredients most people like) plus
+their own deviations, and rate dishes accordingly. After the bulk retrain (parallel, from
+the JSON tree and from SQLite), held-out dishes are ranked by the models: the share of
+correctly ordered pairs is compared for the personal model, the pooled prior alone (what a
+new user gets) and no model. Also checks that incremental updates match a retrain, that the
+history index re-ranks by taste, and measures batch scoring throughput.
+
+Usage (from the repository root):
+  python3 -m benchmarks.bench_taste [--users 300] [--ratings 40] [--workers N]
+"""
+
+import os
+import sys
+import json
+import random
+import shutil
+import argparse
+import tempfile
+
+import numpy as np
+
+import profile_model
+import storage
+import taste_model
+from recipe_index import RecipeIndex
+from benchmarks.bench_analytics import timed
+
+CUISINES = ["Thai", "Italian", "Mexican", "Indian", "Japanese", "Greek", "German", "Korean"]
+DISH_TYPES = ["Curry", "Salad", "Soup", "Stew", "Bowl", "Bake", "Stir-Fry", "Wrap"]
+INGREDIENTS = [entry[0] for entry in taste_model.VOCABULARY[:40]]
+
+
+class World:
+    """Population taste plus per-user deviations over cuisines and ingredients"""
+
+    def __init__(self, rng, deviation=0.8):
+        self.rng = rng
+        self.features = [c.lower() for c in CUISINES] + INGREDIENTS
+        self.population = {f: rng.gauss(0, 0.6) for f in self.features}
+        self.deviation = deviation
+
+    def user_taste(self):
+        return {f: value + self.rng.gauss(0, self.deviation) for f, value in self.population.items()}
+
+    def dish(self):
+        cuisine = self.rng.choice(CUISINES)
+        pantry = self.rng.sample(INGREDIENTS, self.rng.randint(3, 5))
+        name = f"{cuisine} {pantry[0].title()} {self.rng.choice(DISH_TYPES)}"
+        return name, ", ".join(pantry), [cuisine.lower()] + pantry
+
+    def rating(self, taste, features):
+        value = sum(taste[f] for f in features) / len(features)
+        return max(1, min(5, round(3 + 2 * value + self.rng.gauss(0, 0.5))))
+
+
+def write_users(users_dir, world, users, ratings, held_out=20):
+    """JSON profiles with rating histories; returns {username: held-out [(dish, pantry, rating)]}"""
+    tests = {}
+    for u in range(users):
+        username = f"taste_{u:04d}"
+        taste = world.user_taste()
+        user_directory = os.path.join(users_dir, username)
+        os.makedirs(user_directory)
+        preferences = storage.default_preferences()
+        # A fifth of the users are new: no ratings yet
+        for i in range(ratings if u % 5 else 0):
+            name, pantry, features = world.dish()
+            date = f"2024-01-01T12:{i // 60:02d}:{i % 60:02d}"
+            preferences["suggested_recipes"].append({"name": name, "ingredients": pantry, "suggested_at": date,
+                                                     "rated": True})
+            preferences["ratings"].append({"dish": name, "rating": world.rating(taste, features), "date": date})
+        with open(os.path.join(user_directory, "preferences.json"), 'w', encoding='utf-8') as f:
+            json.dump(preferences, f)
+        tests[username] = [(name, pantry, world.rating(taste, features))
+                           for name, pantry, features in (world.dish() for _ in range(held_out))]
+    return tests
+
+
+def pair_accuracy(scores, ratings):
+    """Share of pairs with different ratings that the scores order correctly (ties count half)"""
+    scores, ratings = np.asarray(scores), np.asarray(ratings)
+    differ = ratings[:, None] > ratings[None, :]
+    if not differ.any():
+        return None
+    better = scores[:, None] - scores[None, :]
+    return float(((better > 0) + 0.5 * (better == 0))[differ].mean())
+
+
+def evaluate(users_dir, tests):
+    """Mean pair accuracy of the personal models and of the prior alone, for rated and new users"""
+    prior = taste_model.load_prior(taste_model.prior_path(users_dir))
+    results = {"rated": {"model": [], "prior": []}, "new": {"model": [], "prior": []}}
+    for username, dishes in tests.items():
+        recipes = [(name, pantry) for name, pantry, _ in dishes]
+        ratings = [rating for _, _, rating in dishes]
+        model = taste_model.load_model(os.path.join(users_dir, username), users_dir)
+        group = results["rated" if model.ratings else "new"]
+        for kind, scorer in (("model", model), ("prior", taste_model.TasteModel(prior=prior))):
+            accuracy = pair_accuracy(scorer.score(recipes), ratings)
+            if accuracy is not None:
+                group[kind].append(accuracy)
+    return {group: {kind: float(np.mean(values)) if values else 0.0 for kind, values in kinds.items()}
+            for group, kinds in results.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the per-user taste models")
+    parser.add_argument("--users", type=int, default=300)
+    parser.add_argument("--ratings", type=int, default=40, help="ratings per user (a fifth of the users have none)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+    problems = []
+    rng = random.Random(7)
+    workdir = tempfile.mkdtemp(prefix="recipe-taste-")
+    environment = os.environ.get(storage.STORAGE_ENV_VAR)
+    try:
+        users_dir = os.path.join(workdir, "users")
+        tests = write_users(users_dir, World(rng), args.users, args.ratings)
+
+        print(f"{'retrain':<34}{'seconds':>9}{'users/s':>10}")
+        for workers in sorted({1, args.workers}):
+            results, elapsed = timed(taste_model.retrain_all, users_dir, workers)
+            print(f"{f'JSON tree, {workers} worker(s)':<34}{elapsed:>9.2f}{results['users'] / elapsed:>10.0f}")
+        expected_ratings = sum(args.ratings for u in range(args.users) if u % 5)
+        if results["users"] != args.users or results["ratings"] != expected_ratings:
+            problems.append(f"retrained {results}")
+        model_bytes = sum(os.path.getsize(taste_model.model_path(os.path.join(users_dir, username)))
+                          for username in tests)
+        print(f"Model files: {model_bytes / len(tests) / 1024:.1f} KB per user, "
+              f"{results['features']} features in the pooled prior")
+
+        accuracy = evaluate(users_dir, tests)
+        print("\nHeld-out pairs ordered correctly (no model: 50%):")
+        print(f"  users with {args.ratings} ratings: personal model {accuracy['rated']['model']:.1%}, "
+              f"pooled prior only {accuracy['rated']['prior']:.1%}")
+        print(f"  new users (cold start):   pooled prior {accuracy['new']['model']:.1%}")
+        if accuracy["rated"]["model"] <= max(0.5, accuracy["rated"]["prior"]):
+            problems.append("personal models do not beat the pooled prior")
+        if accuracy["new"]["model"] <= 0.55:
+            problems.append("the pooled prior does not help new users")
+
+        # Incremental updates (one rating at a time) end where a retrain ends
+        username = "taste_0001"
+        user_directory = os.path.join(users_dir, username)
+        retrained = taste_model.TasteModel.load(taste_model.model_path(user_directory))
+        os.remove(taste_model.model_path(user_directory))
+        with open(os.path.join(user_directory, "preferences.json"), encoding='utf-8') as f:
+            history = json.load(f)
+        preferences = storage.default_preferences()
+        preferences["suggested_recipes"] = history["suggested_recipes"]
+        for entry in history["ratings"]:
+            profile_model.record_rating(preferences, dict(entry), None)
+            taste_model.record_rating(user_directory, preferences, entry)
+        incremental = taste_model.TasteModel.load(taste_model.model_path(user_directory))
+        if not (np.allclose(incremental.sums, retrained.sums) and np.array_equal(incremental.counts, retrained.counts)):
+            problems.append("incremental updates differ from the retrain")
+
+        # SQLite: the same models from the database
+        sqlite_storage = storage.SqliteStorage(os.path.join(users_dir, storage.SQLITE_DB_NAME))
+        storage.import_json_tree(users_dir, sqlite_storage)
+        sqlite_storage.close()
+        os.environ[storage.STORAGE_ENV_VAR] = "sqlite"
+        results, elapsed = timed(taste_model.retrain_all, users_dir, args.workers)
+        print(f"\nSQLite retrain, {args.workers} worker(s): {elapsed:.2f}s ({results['users']} users)")
+        from_sqlite = taste_model.TasteModel.load(taste_model.model_path(user_directory))
+        if results["users"] != args.users or not np.allclose(from_sqlite.sums, retrained.sums):
+            problems.append("SQLite retrain differs from the JSON retrain")
+
+        # Re-ranking: two equally matching responses, the disliked one is newer
+        model = taste_model.load_model(user_directory, users_dir)
+        liked, disliked = model.top(3)
+        index = RecipeIndex(os.path.join(workdir, "recipe_index.db"))
+        pantry = "rice, onions, garlic"
+        index.add("en", pantry, "## Liked", [f"{liked[0][0]} {liked[1][0]} Bowl"], username)
+        index.add("en", pantry, "## Disliked", [f"{disliked[0][0]} {disliked[1][0]} Bowl"], username)
+        plain = index.find_answer(pantry, "en")
+        ranked = index.find_answer(pantry, "en", taste=model)
+        index.close()
+        print(f"\nHistory answer for '{pantry}': {plain['recipes'][0]!r} by overlap, "
+              f"{ranked['recipes'][0]!r} by overlap and taste ({ranked['taste']:+.2f})")
+        if plain["response"] != "## Disliked" or ranked["response"] != "## Liked":
+            problems.append("the taste model does not re-rank history answers")
+
+        # Batch scoring throughput
+        world = World(random.Random(1))
+        candidates = [world.dish()[:2] for _ in range(100000)]
+        scores, elapsed = timed(model.score, candidates)
+        print(f"Batch scoring: {len(candidates)} candidates in {elapsed:.2f}s ({len(candidates) / elapsed:.0f}/s)")
+        if len(scores) != len(candidates):
+            problems.append("batch scoring lost candidates")
+    finally:
+        if environment is None:
+            os.environ.pop(storage.STORAGE_ENV_VAR, None)
+        else:
+            os.environ[storage.STORAGE_ENV_VAR] = environment
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print("OK" if not problems else "; ".join(problems))
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,176 @@
+"""
+Check the speculative prefetch (prefetch.py) in the interactive CLI against the fake client
+
+Runs main() with scripted input (the user takes --think seconds per prompt) for users with a
+suggestion history: typing the usual pantry in another order or language (hit, while the
+request is in flight and after it completed), a different pantry (miss), another menu option
+(abandoned) and prefetch switched off. Verifies the number of model calls, the streamed text,
+the saved suggestions and the log entries, and reports the time from entering the ingredients
+to the complete answer, the hit rate and the wasted tokens.
+
+Usage (from the repository root):
+  python3 -m benchmarks.check_prefetch [--latency 0.4] [--think 0.2]
+"""
+
+import io
+import os
+import sys
+import time
+import shutil
+import argparse
+import builtins
+import contextlib
+
+import prefetch
+import recipe_assistant as ra
+from benchmarks.fake_client import FakeAnthropic, isolated_workdir
+
+USUAL_PANTRY = "tomatoes, pasta, basil"
+
+
+def make_user(username):
+    """A user whose history has the usual pantry twice, then another one (the most recent)"""
+    user_files = ra.ensure_user_directory(username)
+    preferences = ra.default_preferences("en")
+    preferences["suggested_recipes"] = [
+        {"name": f"Dish {i}", "ingredients": pantry, "suggested_at": f"2024-01-0{i + 1}T12:00:00", "rated": True}
+        for i, pantry in enumerate([USUAL_PANTRY, USUAL_PANTRY, "rice, eggs"])
+    ]
+    ra.save_preferences(preferences, user_files["preferences"])
+    return user_files
+
+
+def run_session(username, answers, think):
+    """main() with scripted answers; returns (output, seconds from the ingredients to the answer)"""
+    answers = list(answers)
+    entered = []
+
+    def scripted_input(prompt=""):
+        time.sleep(think)
+        if len(answers) == 1:
+            # The answer after the suggestion: the user is done
+            entered.append(time.perf_counter())
+        return answers.pop(0)
+
+    original_select, original_input = ra.select_or_create_user, builtins.input
+    ra.select_or_create_user = lambda: username
+    builtins.input = scripted_input
+    output = io.StringIO()
+    started = []
+    try:
+        with contextlib.redirect_stdout(output):
+            original_print = builtins.print
+
+            def timed_print(*args, **kwargs):
+                # The thinking message is printed right after the ingredients are entered
+                if args and "🤔" in str(args[0]):
+                    started.append(time.perf_counter())
+                original_print(*args, **kwargs)
+
+            builtins.print = timed_print
+            try:
+                ra.main()
+            finally:
+                builtins.print = original_print
+    finally:
+        ra.select_or_create_user, builtins.input = original_select, original_input
+    waited = entered[0] - started[0] - think if started and entered else None
+    return output.getvalue(), waited
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the speculative prefetch with the fake client")
+    parser.add_argument("--latency", type=float, default=0.4, help="seconds before the fake model answers")
+    parser.add_argument("--think", type=float, default=0.2, help="seconds the user takes per prompt")
+    args = parser.parse_args()
+
+    workdir = isolated_workdir("recipe-prefetch-")
+    client = FakeAnthropic(latency=args.latency, chunk_delay=0.005)
+    ra._client = client
+    environment = {key: os.environ.get(key) for key in ("ANTHROPIC_API_KEY", prefetch.PREFETCH_ENV_VAR)}
+    os.environ["ANTHROPIC_API_KEY"] = "test-key"
+    problems = []
+    rows = []
+
+    def expect(condition, message):
+        if not condition:
+            problems.append(message)
+
+    def scenario(name, mode, answers, think, calls, outcome, saved_pantry):
+        if mode is None:
+            os.environ.pop(prefetch.PREFETCH_ENV_VAR, None)
+        else:
+            os.environ[prefetch.PREFETCH_ENV_VAR] = mode
+        ra.get_suggestion_cache().clear()
+        username = name.replace(" ", "_").replace(",", "")
+        user_files = make_user(username)
+        before = len(client.requests)
+        # Let earlier speculations' cancellations settle
+        time.sleep(0.05)
+        output, waited = run_session(username, answers, think)
+        time.sleep(0.05)
+        expect(len(client.requests) - before == calls,
+               f"{name}: {len(client.requests) - before} model calls instead of {calls}")
+        stats = prefetch.PrefetchStats(prefetch.prefetch_path(user_files["preferences"])).load()
+        if outcome is None:
+            expect(stats["speculations"] == 0, f"{name}: speculated with prefetch off")
+        else:
+            expect(stats[outcome] == 1 and stats["speculations"] == 1, f"{name}: stats {stats}")
+        entries = ra.load_api_log(user_files["log"])
+        saved = [r for r in ra.load_preferences(user_files["preferences"])["suggested_recipes"]
+                 if not r["rated"]]
+        if saved_pantry is not None:
+            expect(len(saved) == 3 and all(r["ingredients"] == saved_pantry for r in saved),
+                   f"{name}: saved {[r['ingredients'] for r in saved]}")
+            answer = [e for e in entries if (e.get("prefetched") or {}).get("used") is not False]
+            expect(answer and answer[-1]["response"] in output, f"{name}: streamed answer incomplete")
+        else:
+            expect(not saved, f"{name}: {len(saved)} suggestions saved without a request")
+        if outcome in ("misses", "abandoned"):
+            # Cancelled before the first chunk: nothing to log, the input tokens are estimated
+            wasted = [e for e in entries if (e.get("prefetched") or {}).get("used") is False]
+            expect(stats["wasted_input_tokens"] > 0, f"{name}: no wasted tokens counted")
+            expect(len(wasted) == int(stats["wasted_output_tokens"] > 0),
+                   f"{name}: {len(wasted)} wasted calls logged")
+            expect(all(e["ingredients"] == USUAL_PANTRY for e in wasted), f"{name}: wrong pantry logged")
+        if outcome == "hits":
+            used = [e for e in entries if (e.get("prefetched") or {}).get("used")]
+            expect(len(used) == 1, f"{name}: {len(used)} prefetched log entries")
+        rows.append((name, waited, stats))
+
+    try:
+        # Menu choice and ingredients after think seconds each: the request is still in flight
+        scenario("hit, in flight", "on", ["1", "Basilikum, Tomaten, Nudeln", "n"], args.think,
+                 1, "hits", "Basilikum, Tomaten, Nudeln")
+        scenario("hit, completed", "frequent", ["1", "pasta; basil; tomato", "n"], args.latency + 0.3,
+                 1, "hits", "pasta; basil; tomato")
+        scenario("miss", "on", ["1", "rice, eggs", "n"], args.think, 2, "misses", "rice, eggs")
+        # The speculation completes before the user picks another option
+        scenario("abandoned", "on", ["3"], args.latency + 0.3, 1, "abandoned", None)
+        scenario("prefetch off", None, ["1", "tomatoes, pasta, basil", "n"], args.think, 1, None,
+                 "tomatoes, pasta, basil")
+        # Most recent pantry instead of the most frequent one: the typed pantry matches
+        scenario("recent", "recent", ["1", "eggs, rice", "n"], args.think, 1, "hits", "eggs, rice")
+    finally:
+        for key, value in environment.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+        ra._client = None
+        stats = prefetch.collect_stats(ra.USERS_DIR)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"{'session':<18}{'answer after':>14}{'hits':>6}{'misses':>8}{'abandoned':>11}{'wasted tokens':>15}")
+    for name, waited, session_stats in rows:
+        print(f"{name:<18}{(f'{waited:.2f}s' if waited is not None else '-'):>14}{session_stats['hits']:>6}"
+              f"{session_stats['misses']:>8}{session_stats['abandoned']:>11}"
+              f"{session_stats['wasted_input_tokens'] + session_stats['wasted_output_tokens']:>15}")
+    print(f"Hit rate {stats['hit_rate']:.0%} ({stats['hits']} of {stats['hits'] + stats['misses']} requests), "
+          f"{stats['wasted_tokens']} tokens wasted, average head start {stats['avg_head_start']:.2f}s")
+    print("OK" if not problems else "; ".join(problems))
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,89 @@
+"""
+Check off-peak pre-generation against the fake Message Batches endpoint
+
+Creates users with a suggestion history, pre-generates their likely pantries as one batch,
+then sends lunch requests (similar and unrelated pantries) and reports the precompute hit rate.
+
+Usage (from the repository root):
+  python3 -m benchmarks.check_pregeneration [--users 20]
+"""
+
+import io
+import sys
+import shutil
+import random
+import argparse
+import contextlib
+
+import recipe_assistant as ra
+import pregenerate
+from benchmarks.fake_client import FakeAnthropic, isolated_workdir
+
+PANTRY_ITEMS = ["tomatoes", "pasta", "basil", "garlic", "rice", "eggs", "spinach", "onions",
+                "potatoes", "chicken", "lentils", "carrots", "mushrooms", "cheese", "peppers"]
+
+
+def make_users(num_users, rng):
+    """Users whose history contains one pantry of five ingredients"""
+    pantries = {}
+    for i in range(num_users):
+        username = f"pregen_{i}"
+        user_files = ra.ensure_user_directory(username)
+        prefs = ra.default_preferences("en" if i % 2 else "de")
+        pantry = rng.sample(PANTRY_ITEMS, 5)
+        prefs["suggested_recipes"] = [{"name": "Old Dish", "ingredients": ", ".join(pantry),
+                                       "suggested_at": "2024-01-01T12:00:00", "rated": True}]
+        ra.save_preferences(prefs, user_files["preferences"])
+        pantries[username] = pantry
+    return pantries
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check pre-generation with the fake batches endpoint")
+    parser.add_argument("--users", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    workdir = isolated_workdir("recipe-pregen-check-")
+    try:
+        pantries = make_users(args.users, rng)
+        client = FakeAnthropic()
+        client.messages.batches.polls_until_ended = 3
+        with contextlib.redirect_stdout(io.StringIO()):
+            stored, failed = pregenerate.run(client, ra.USERS_DIR, poll_interval=0)
+        print(f"Batch: {len(client.requests)} requests, {stored} stored, {failed} failed")
+
+        problems = []
+        if any(request.get("stream") for request in client.requests):
+            problems.append("batch requests must not stream")
+        calls_before = len(client.requests)
+
+        # Half the users come with a similar pantry (one item swapped), half with a different one
+        for i, (username, pantry) in enumerate(sorted(pantries.items())):
+            user_files = ra.get_user_files(username)
+            prefs = ra.load_preferences(user_files["preferences"])
+            if i % 2 == 0:
+                lunch = pantry[:4] + [rng.choice([p for p in PANTRY_ITEMS if p not in pantry])]
+                lunch += pantry[4:]
+            else:
+                lunch = [p for p in PANTRY_ITEMS if p not in pantry][:5]
+            with contextlib.redirect_stdout(io.StringIO()):
+                ra.get_recipe_suggestion(client, ", ".join(lunch), prefs, user_files["preferences"],
+                                         user_files["log"], prefs["language"], use_cache=False)
+
+        live_calls = len(client.requests) - calls_before
+        stats = pregenerate.collect_stats(ra.USERS_DIR)
+        total = {key: sum(s[key] for s in stats.values()) for key in ("hits", "misses")}
+        print(f"Lunch: {args.users} requests, {total['hits']} precomputed, {live_calls} live API calls")
+        print(f"Precompute hit rate: {pregenerate.hit_rate(total):.0%}")
+        if total["hits"] != (args.users + 1) // 2 or live_calls != args.users // 2:
+            problems.append("unexpected number of precomputed answers")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print("OK" if not problems else "; ".join(problems))
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
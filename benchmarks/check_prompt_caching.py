@@ -0,0 +1,63 @@
+"""
+Check the prompt caching request shape against the fake client
+
+Sends two suggestion requests for the same user (without the suggestion cache) and
+verifies that the static instructions go out as a cache-marked system block, that only
+the dynamic part is in the user turn and that the log records cache write and read tokens.
+
+Usage (from the repository root):
+  python3 -m benchmarks.check_prompt_caching
+"""
+
+import sys
+import shutil
+
+import recipe_assistant as ra
+from benchmarks.fake_client import FakeAnthropic, isolated_workdir
+
+
+def check(lang="en"):
+    """Run the check for one language, returns a list of problems (empty if all is fine)"""
+    client = FakeAnthropic()
+    user_files = ra.ensure_user_directory(f"cache_check_{lang}")
+    prefs = ra.default_preferences(lang)
+    ra.save_preferences(prefs, user_files["preferences"])
+
+    for ingredients in ("tomatoes, pasta, basil", "rice, eggs, spinach"):
+        ra.get_recipe_suggestion(client, ingredients, prefs, user_files["preferences"],
+                                 user_files["log"], lang, use_cache=False)
+
+    problems = []
+    static_text = ra.t(lang, "claude_prompt_system")
+    for request in client.requests:
+        system = request.get("system") or [{}]
+        if system[-1].get("cache_control") != {"type": "ephemeral"}:
+            problems.append("system block is not marked for prompt caching")
+        if system[-1].get("text") != static_text:
+            problems.append("system block does not contain the static instructions")
+        if len(request["messages"]) != 1 or static_text in request["messages"][0]["content"]:
+            problems.append("user turn contains more than the dynamic part")
+
+    first, second = [entry.get("usage", {}) for entry in ra.load_api_log(user_files["log"])]
+    if not first.get("cache_creation_input_tokens"):
+        problems.append("first call did not record cache write tokens")
+    if not second.get("cache_read_input_tokens"):
+        problems.append("second call did not record cache read tokens")
+    return problems
+
+
+def main():
+    workdir = isolated_workdir("recipe-cache-check-")
+    failed = False
+    try:
+        for lang in ra.TRANSLATIONS:
+            problems = check(lang)
+            print(f"{lang}: {'OK' if not problems else '; '.join(problems)}")
+            failed = failed or bool(problems)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,196 @@
+"""
+Check the resilience layer of the model call against the fault-injecting mock Messages API
+
+Runs the engine with the real Anthropic SDK client (via base_url) through four scenarios:
+- tail latency: a few requests are very slow. Compares p50/p99 without hedging (fixed timeout)
+  and with hedging, for complete and streamed responses
+- errors: a share of the requests fails with 503, retries must hide it
+- hang: the upstream stops answering, the adaptive timeout must end the wait
+- outage: every request fails, the circuit breaker must open, further suggestions must be
+  served from the log without calling the API, and the breaker must close after recovery
+
+Timeouts and delays are scaled down (resilience constants) so the check runs in seconds.
+
+Usage (from the repository root):
+  python3 -m benchmarks.check_resilience [--requests 200] [--concurrency 8]
+"""
+
+import io
+import sys
+import time
+import shutil
+import asyncio
+import argparse
+import contextlib
+
+import recipe_assistant as ra
+import resilience
+import server
+from benchmarks.bench_hot_paths import percentile
+from benchmarks.mock_messages_server import MockMessagesServer
+from benchmarks.fake_client import isolated_workdir
+
+PANTRIES = ["tomatoes, pasta, basil", "rice, eggs, spinach", "potatoes, onions, cheese",
+            "chicken, peppers, rice", "lentils, carrots, onions"]
+
+
+def make_user(username):
+    ra.create_user_profile(username, "en")
+    user_files = ra.get_user_files(username)
+    return user_files, ra.load_preferences(user_files["preferences"])
+
+
+async def timed_suggestion(engine, user, ingredients, stream):
+    """(seconds, outcome) of one suggestion: model, fallback or the error name"""
+    user_files, preferences = user
+    t0 = time.perf_counter()
+    try:
+        await engine.suggest(ingredients, preferences, user_files["preferences"], user_files["log"], "en",
+                             use_cache=False, on_text=(lambda text: None) if stream else None,
+                             use_precomputed=False, offline_first=False)
+        outcome = "fallback" if ingredients in engine.fallbacks else "model"
+    except Exception as error:
+        outcome = type(error).__name__
+    return time.perf_counter() - t0, outcome
+
+
+class CountingEngine(ra.AsyncRecipeEngine):
+    """Engine that remembers the pantries answered from the fallback"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fallbacks = set()
+
+    async def _answer_from_fallback(self, ingredients, *args, **kwargs):
+        response_text = await super()._answer_from_fallback(ingredients, *args, **kwargs)
+        if response_text is not None:
+            self.fallbacks.add(ingredients)
+        return response_text
+
+
+async def run_load(engine, user, requests, concurrency, stream=False):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with semaphore:
+            return await timed_suggestion(engine, user, PANTRIES[i % len(PANTRIES)] + f", herb {i}", stream)
+
+    return await asyncio.gather(*(one(i) for i in range(requests)))
+
+
+def summary(results):
+    latencies = sorted(seconds for seconds, _ in results)
+    outcomes = {}
+    for _, outcome in results:
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+    return {
+        "p50_ms": round(percentile(latencies, 50) * 1000),
+        "p99_ms": round(percentile(latencies, 99) * 1000),
+        "max_ms": round(latencies[-1] * 1000),
+        "outcomes": outcomes
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check timeouts, hedging, retries and the circuit breaker")
+    parser.add_argument("--requests", type=int, default=200, help="requests per tail latency run")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.05, help="normal mock latency in seconds")
+    parser.add_argument("--slow-rate", type=float, default=0.03, help="share of very slow requests")
+    parser.add_argument("--slow-latency", type=float, default=2.0, help="latency of the slow requests")
+    args = parser.parse_args()
+
+    # Scaled down for the check (production defaults are in resilience.py)
+    resilience.MIN_TIMEOUT = 0.5
+    resilience.MIN_HEDGE_DELAY = 0.1
+    resilience.BACKOFF_BASE = 0.05
+
+    workdir = isolated_workdir("recipe-resilience-")
+    mock = MockMessagesServer(latency=args.latency).start()
+    client = server.make_client(mock.url)
+    problems = []
+
+    def expect(condition, message):
+        if not condition:
+            problems.append(message)
+
+    rows = []
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            alice, bob, carol = make_user("alice"), make_user("bob"), make_user("carol")
+
+            # Tail latency: without hedging (tracker never warms up: fixed initial timeout) and with it
+            mock.slow_rate, mock.slow_latency = args.slow_rate, args.slow_latency
+            for name, hedging, stream in (("complete, no hedging", False, False), ("complete, hedged", True, False),
+                                          ("streamed, no hedging", False, True), ("streamed, hedged", True, True)):
+                engine = CountingEngine(client, max_concurrency=args.concurrency)
+                if not hedging:
+                    for tracker in engine.latency.values():
+                        tracker.min_samples = float("inf")
+                before = len(mock.requests)
+                result = summary(ra.run_sync(run_load(engine, alice, args.requests, args.concurrency, stream)))
+                result["extra_requests"] = len(mock.requests) - before - args.requests
+                rows.append((name, result))
+                expect(result["outcomes"] == {"model": args.requests}, f"{name}: {result['outcomes']}")
+            expect(rows[1][1]["p99_ms"] < rows[0][1]["p99_ms"], "hedging did not lower the p99 (complete)")
+            expect(rows[3][1]["p99_ms"] < rows[2][1]["p99_ms"], "hedging did not lower the p99 (streamed)")
+            mock.slow_rate = 0.0
+
+            # Errors: 20% of the requests fail with 503
+            engine = CountingEngine(client, max_concurrency=args.concurrency)
+            mock.error_rate = 0.2
+            errors = summary(ra.run_sync(run_load(engine, alice, 100, args.concurrency)))
+            mock.error_rate = 0.0
+            expect(errors["outcomes"].get("model", 0) >= 97, f"retries did not hide 503s: {errors['outcomes']}")
+
+            # Hang: a warmed-up engine, then the upstream stops answering
+            engine = CountingEngine(client, max_concurrency=args.concurrency)
+            ra.run_sync(run_load(engine, bob, 30, args.concurrency))
+            timeout = engine.latency["message"].timeout()
+            mock.slow_rate, mock.slow_latency = 1.0, 30.0
+            hang_seconds, hang_outcome = ra.run_sync(timed_suggestion(engine, bob, PANTRIES[0], False))
+            mock.slow_rate = 0.0
+            expect(hang_seconds < 10, f"hanging upstream blocked for {hang_seconds:.1f}s")
+            expect(hang_outcome == "fallback", f"hanging upstream: {hang_outcome} instead of the fallback")
+
+            # Outage: every request fails until the breaker opens, then fail fast with the fallback
+            engine = CountingEngine(client, max_concurrency=args.concurrency)
+            engine.breaker = resilience.CircuitBreaker(cooldown=1.0)
+            mock.error_rate = 1.0
+            outage = [ra.run_sync(timed_suggestion(engine, alice, PANTRIES[i % 5], False)) for i in range(4)]
+            expect(engine.breaker.state == resilience.OPEN, f"breaker {engine.breaker.state} during the outage")
+            before = len(mock.requests)
+            open_results = [ra.run_sync(timed_suggestion(engine, alice, PANTRIES[i % 5] + ", salt", False))
+                            for i in range(20)]
+            expect(len(mock.requests) == before, "API called while the breaker was open")
+            expect(all(outcome == "fallback" for _, outcome in open_results), "open breaker: fallback not served")
+            fail_fast_ms = max(seconds for seconds, _ in open_results) * 1000
+            expect(fail_fast_ms < 200, f"open breaker took {fail_fast_ms:.0f} ms")
+            _, no_history = ra.run_sync(timed_suggestion(engine, carol, "quinoa, kale", False))
+            expect(no_history == "ModelUnavailableError", f"user without history: {no_history}")
+            # Recovery: after the cooldown one probe closes the breaker again
+            mock.error_rate = 0.0
+            time.sleep(1.1)
+            _, recovered = ra.run_sync(timed_suggestion(engine, alice, PANTRIES[1] + ", thyme", False))
+            expect(recovered == "model" and engine.breaker.state == resilience.CLOSED,
+                   f"no recovery: {recovered}, breaker {engine.breaker.state}")
+    finally:
+        mock.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"Tail latency: {args.requests} requests, {args.slow_rate:.0%} delayed by {args.slow_latency:.1f}s "
+          f"(normal {args.latency * 1000:.0f} ms)")
+    print(f"  {'run':<24}{'p50 ms':>8}{'p99 ms':>8}{'max ms':>8}{'extra requests':>16}")
+    for name, result in rows:
+        print(f"  {name:<24}{result['p50_ms']:>8}{result['p99_ms']:>8}{result['max_ms']:>8}"
+              f"{result['extra_requests']:>16}")
+    print(f"Errors (20% 503): {errors['outcomes']}, p99 {errors['p99_ms']} ms")
+    print(f"Hang: answered after {hang_seconds:.2f}s ({hang_outcome}, attempt timeout {timeout:.2f}s)")
+    print(f"Outage: outcomes {[outcome for _, outcome in outage]}, then {len(open_results)} fallbacks "
+          f"in <= {fail_fast_ms:.1f} ms each without API calls; recovery: {recovered}")
+    print("OK" if not problems else "; ".join(problems))
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,172 @@
+"""
+Check the model routing (model_router.py) against the fake client
+
+Sends suggestion requests of different shapes through the engine and verifies the chosen
+tier, model and output budget, the "route" field of the log entries and the escalation to
+the standard tier with its full budget when the fast tier's answer has no "## " recipe
+headings (complete and streamed) or was cut off at max_tokens. Prints the decisions and the output budget compared to sending everything to
+the standard tier.
+
+Usage (from the repository root):
+  python3 -m benchmarks.check_routing
+"""
+
+import io
+import sys
+import shutil
+import contextlib
+
+import jsonl_log
+import recipe_assistant as ra
+import model_router
+from benchmarks.fake_client import FakeAnthropic, FakeMessage, isolated_workdir
+
+FAST_MODEL = model_router.TIERS["fast"]["model"]
+STANDARD_MODEL = model_router.TIERS["standard"]["model"]
+LIKED_DISHES = [f"Dish number {i} with tomatoes and herbs" for i in range(40)]
+
+
+class HeadinglessFastClient(FakeAnthropic):
+    """Fake client whose fast model answers in prose, without '## ' recipe headings"""
+
+    def build_message(self, kwargs):
+        message = super().build_message(kwargs)
+        if kwargs.get("model") == FAST_MODEL:
+            text = message.content[0].text.replace("## ", "")
+            return FakeMessage(text, FAST_MODEL, message.usage.input_tokens)
+        return message
+
+
+class TruncatedFastClient(FakeAnthropic):
+    """Fake client whose fast model stops at max_tokens after the first recipe"""
+
+    def build_message(self, kwargs):
+        message = super().build_message(kwargs)
+        if kwargs.get("model") == FAST_MODEL:
+            text = message.content[0].text
+            message = FakeMessage(text[:text.index("## ", 3)], FAST_MODEL, message.usage.input_tokens)
+            message.stop_reason = "max_tokens"
+        return message
+
+
+def make_user(username, lang="en", liked=()):
+    ra.create_user_profile(username, lang)
+    user_files = ra.get_user_files(username)
+    preferences = ra.load_preferences(user_files["preferences"])
+    preferences["liked_dishes"] = list(liked)
+    ra.save_preferences(preferences, user_files["preferences"])
+    return user_files, preferences
+
+
+def suggest(engine, user, ingredients, lang="en", stream=False):
+    """Run one suggestion, returns the log entries it added"""
+    user_files, preferences = user
+    before = jsonl_log.count_entries(user_files["log"])
+    ra.run_sync(engine.suggest(ingredients, preferences, user_files["preferences"], user_files["log"], lang,
+                               use_cache=False, on_text=(lambda text: None) if stream else None,
+                               use_precomputed=False, offline_first=False))
+    added = jsonl_log.count_entries(user_files["log"]) - before
+    return ra.load_api_log(user_files["log"], last=added) if added else []
+
+
+def main():
+    workdir = isolated_workdir("recipe-routing-")
+    problems = []
+    rows = []
+
+    def expect(condition, message):
+        if not condition:
+            problems.append(message)
+
+    def check_route(name, entries, client, tier, reason):
+        route = entries[-1].get("route") if entries else None
+        if route is None:
+            problems.append(f"{name}: no route in the log entry")
+            return None
+        request = client.requests[-1]
+        expect(route["tier"] == tier and route["reason"] == reason,
+               f"{name}: {route['tier']}/{route['reason']} instead of {tier}/{reason}")
+        expect(request["model"] == route["model"] == entries[-1]["model"], f"{name}: model not sent as routed")
+        expect(request["max_tokens"] == route["max_tokens"], f"{name}: budget not sent as routed")
+        expect(route["max_tokens"] <= model_router.TIERS[route["tier"]]["max_tokens"], f"{name}: budget over cap")
+        rows.append((name, route))
+        return route
+
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            client = FakeAnthropic()
+            engine = ra.AsyncRecipeEngine(client)
+            new_user = make_user("newcomer")
+            regular = make_user("regular", liked=LIKED_DISHES)
+            german = make_user("neu", "de")
+
+            small = check_route("3 ingredients, new user", suggest(engine, new_user, "tomatoes, pasta, basil"),
+                                client, "fast", "simple")
+            check_route("10 ingredients", suggest(
+                engine, new_user, "tomatoes, pasta, basil, garlic, onions, peppers, cheese, olives, capers, tuna"),
+                client, "standard", "complex")
+            check_route("3 ingredients, long history", suggest(engine, regular, "tomatoes, pasta, basil"),
+                        client, "standard", "complex")
+            german_small = check_route("3 ingredients, German", suggest(engine, german, "Tomaten, Nudeln, Basilikum",
+                                                                        "de"), client, "fast", "simple")
+            if small and german_small:
+                expect(german_small["max_tokens"] > small["max_tokens"], "German budget not larger than English")
+
+            # Standard tier slow: moderate requests move to the fast tier
+            engine.router.latency["standard"].seed([model_router.LATENCY_TARGET * 2] * 30)
+            check_route("7 ingredients, slow standard", suggest(
+                engine, new_user, "rice, eggs, spinach, onions, garlic, peppers, cheese"), client, "fast", "latency")
+            check_route("10 ingredients, slow standard", suggest(
+                engine, new_user, "rice, eggs, spinach, onions, garlic, peppers, cheese, ham, peas, corn"),
+                client, "standard", "complex")
+
+            # Routing off: the previous fixed model and budget
+            engine.router.mode = "off"
+            off = check_route("routing off", suggest(engine, new_user, "tomatoes, pasta, basil"),
+                              client, "standard", "off")
+            expect(off is None or off["max_tokens"] == ra.MAX_TOKENS, "routing off: not the full budget")
+            engine.router.mode = None
+            complex_route = check_route("10 ingredients, German", suggest(
+                engine, german, "Tomaten, Nudeln, Basilikum, Knoblauch, Zwiebeln, Paprika, Käse, Oliven, Kapern, "
+                "Thunfisch", "de"), client, "standard", "complex")
+            expect(complex_route is None or complex_route["max_tokens"] == ra.MAX_TOKENS,
+                   "standard tier: not the full budget")
+
+            # Escalation: the fast tier answers without headings or is cut off
+            cases = [(HeadinglessFastClient, False, 0), (HeadinglessFastClient, True, 0), (TruncatedFastClient, False, 1)]
+            for client_class, stream, fast_recipes in cases:
+                name = "escalation, " + ("cut off" if fast_recipes else "streamed" if stream else "complete")
+                client = client_class()
+                engine = ra.AsyncRecipeEngine(client)
+                user = make_user(f"escalation_{len(rows)}")
+                entries = suggest(engine, user, "lentils, carrots, onions", stream=stream)
+                expect([request["max_tokens"] for request in client.requests][1:] == [ra.MAX_TOKENS],
+                       f"{name}: escalated request without the full budget")
+                expect([request["model"] for request in client.requests] == [FAST_MODEL, STANDARD_MODEL],
+                       f"{name}: requests {[request['model'] for request in client.requests]}")
+                expect(len(entries) == 2, f"{name}: {len(entries)} log entries instead of 2")
+                if len(entries) == 2:
+                    first, second = entries[0]["route"], entries[1]["route"]
+                    expect(first["escalated"] and first["recipes"] == fast_recipes, f"{name}: fast entry {first}")
+                    expect(second["reason"] == "escalated" and second["recipes"] == 3
+                           and not second["escalated"], f"{name}: standard entry {second}")
+                    rows.append((name, second))
+                preferences = ra.load_preferences(user[0]["preferences"])
+                expect(len(preferences["suggested_recipes"]) == 3,
+                       f"{name}: {len(preferences['suggested_recipes'])} recipes saved instead of 3")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"{'request':<32}{'tier':<10}{'reason':<11}{'max_tokens':>11}{'ingredients':>13}{'context':>9}")
+    for name, route in rows:
+        features = route["features"]
+        print(f"{name:<32}{route['tier']:<10}{route['reason']:<11}{route['max_tokens']:>11}"
+              f"{features['ingredients']:>13}{features['context_tokens']:>9}")
+    budget = sum(route["max_tokens"] for _, route in rows)
+    print(f"Output budget: {budget} tokens routed vs {len(rows) * ra.MAX_TOKENS} with the standard tier only")
+    print("OK" if not problems else "; ".join(problems))
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
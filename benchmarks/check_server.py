@@ -0,0 +1,148 @@
+"""
+Check the HTTP service mode end to end against the mock Messages endpoint
+
+Starts the mock Messages API and server.py (real Anthropic SDK client via base_url), exercises
+all endpoints, runs concurrent suggestions for several users, then shuts the server down and
+checks that write-behind profiles reached the disk.
+
+Usage (from the repository root):
+  python3 -m benchmarks.check_server [--users 8] [--requests 40] [--latency 0.05]
+"""
+
+import io
+import sys
+import json
+import time
+import shutil
+import argparse
+import threading
+import contextlib
+import http.client
+from concurrent.futures import ThreadPoolExecutor
+
+import recipe_assistant as ra
+import server
+from storage import create_storage
+from benchmarks.bench_hot_paths import percentile
+from benchmarks.mock_messages_server import MockMessagesServer
+from benchmarks.fake_client import isolated_workdir
+
+PANTRIES = ["tomatoes, pasta, basil", "rice, eggs, spinach", "potatoes, onions, cheese",
+            "chicken, peppers, rice", "lentils, carrots, onions"]
+
+
+def call(port, method, path, body=None, connection=None):
+    """Send a JSON request, returns (status, body)"""
+    conn = connection or http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    data = json.dumps(body).encode("utf-8") if body is not None else None
+    headers = {"Content-Type": "application/json"} if data else {}
+    conn.request(method, path, body=data, headers=headers)
+    response = conn.getresponse()
+    result = json.loads(response.read())
+    if connection is None:
+        conn.close()
+    return response.status, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the HTTP server against the mock Messages API")
+    parser.add_argument("--users", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=40, help="concurrent suggestion requests")
+    parser.add_argument("--latency", type=float, default=0.05, help="mock model latency in seconds")
+    args = parser.parse_args()
+
+    workdir = isolated_workdir("recipe-server-check-")
+    mock = MockMessagesServer(latency=args.latency).start()
+    started = threading.Event()
+    holder = {}
+
+    def ready(http_server):
+        holder["server"] = http_server
+        started.set()
+
+    problems = []
+
+    def expect(condition, message):
+        if not condition:
+            problems.append(message)
+
+    thread = threading.Thread(target=lambda: server.serve(port=0, base_url=mock.url, flush_interval=3600,
+                                                          ready=ready), daemon=True)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            thread.start()
+            started.wait(30)
+            port = holder["server"].server_address[1]
+
+            # Registration and validation
+            for i in range(args.users):
+                status, _ = call(port, "POST", "/users", {"username": f"user_{i}", "language": "en" if i % 2 else "de"})
+                expect(status == 200, f"register user_{i}: {status}")
+            expect(call(port, "POST", "/users", {"username": "user_0"})[0] == 409, "duplicate user not rejected")
+            expect(call(port, "POST", "/users", {"username": "../x"})[0] == 400, "invalid username not rejected")
+            expect(call(port, "GET", "/users/nobody/preferences")[0] == 404, "unknown user not 404")
+            expect(call(port, "POST", "/users/user_0/feedback", {"dish": "X", "rating": 9})[0] == 400,
+                   "invalid rating not rejected")
+
+            # One suggestion, then the same pantry again (suggestion cache, no second model call)
+            status, first = call(port, "POST", "/users/user_0/suggestions", {"ingredients": PANTRIES[0]})
+            expect(status == 200 and len(first.get("recipes", [])) == 3, f"suggestion failed: {status} {first}")
+            calls = len(mock.requests)
+            status, again = call(port, "POST", "/users/user_0/suggestions", {"ingredients": PANTRIES[0]})
+            expect(again.get("response") == first.get("response") and len(mock.requests) == calls,
+                   "repeated pantry was not served from the cache")
+
+            # Concurrent suggestions over keep-alive connections
+            latencies = []
+
+            def client_worker(worker):
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+                for i in range(worker, args.requests, args.users):
+                    t0 = time.perf_counter()
+                    status, result = call(port, "POST", f"/users/user_{worker}/suggestions",
+                                          {"ingredients": PANTRIES[i % len(PANTRIES)] + f", herb {i}",
+                                           "use_cache": False}, connection=conn)
+                    latencies.append(time.perf_counter() - t0)
+                    expect(status == 200, f"concurrent suggestion: {status} {result}")
+                conn.close()
+
+            t0 = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=args.users) as pool:
+                list(pool.map(client_worker, range(args.users)))
+            elapsed = time.perf_counter() - t0
+
+            # Feedback, preferences and log
+            recipe = first["recipes"][0]
+            status, result = call(port, "POST", "/users/user_0/feedback", {"dish": recipe, "rating": 5})
+            expect(status == 200 and result.get("verdict") == "liked", f"feedback failed: {status} {result}")
+            status, prefs = call(port, "GET", "/users/user_0/preferences")
+            expect(status == 200 and recipe in prefs.get("liked_dishes", []), "liked dish missing in preferences")
+            status, log = call(port, "GET", "/users/user_0/log?last=2")
+            expect(status == 200 and len(log.get("entries", [])) == 2, "log endpoint returned wrong entries")
+            status, health = call(port, "GET", "/health")
+
+            # Write-behind (JSON): the rating is in memory only until the server stops
+            preferences_file = ra.get_user_files("user_0")["preferences"]
+            if health.get("storage") == "json":
+                with open(preferences_file, 'r', encoding='utf-8') as f:
+                    expect(not json.load(f)["ratings"], "profile was written before the flush")
+            holder["server"].shutdown()
+            thread.join(30)
+        stored = create_storage(ra.USERS_DIR).load(preferences_file)
+        expect([r["dish"] for r in stored["ratings"]] == [recipe], "rating not on disk after shutdown")
+    finally:
+        mock.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    latencies.sort()
+    print(f"Endpoints: register, suggestions, feedback, preferences, log, health ({health})")
+    print(f"Concurrent: {args.requests} suggestions from {args.users} clients in {elapsed:.2f}s "
+          f"({args.requests / elapsed:.1f} req/s, p50 {percentile(latencies, 50) * 1000:.0f} ms, "
+          f"p99 {percentile(latencies, 99) * 1000:.0f} ms, mock latency {args.latency * 1000:.0f} ms)")
+    print(f"Model calls: {len(mock.requests)}")
+    print("OK" if not problems else "; ".join(problems))
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,265 @@
+"""
+Deterministic fake Anthropic client for benchmarks
+Returns canned '##'-formatted recipe responses without any network access
+"""
+
+import os
+import time
+import random
+import tempfile
+import asyncio
+import threading
+from types import SimpleNamespace
+
+def isolated_workdir(prefix, storage=None):
+    """
+    Point recipe_assistant at a new temp dir: its users directory and the stores created
+    from it on first use (preference storage, registry, suggestion cache, recipe index).
+    Returns the temp dir; storage selects a backend (default: from the environment).
+    """
+    import recipe_assistant as ra
+    from storage import create_storage
+
+    workdir = tempfile.mkdtemp(prefix=prefix)
+    ra.use_users_dir(os.path.join(workdir, "users"))
+    if storage:
+        ra._storage = create_storage(ra.USERS_DIR, storage)
+    return workdir
+
+
+RECIPE_NAMES = [
+    "Pasta Caprese", "Tomato Basil Soup", "Chicken Stir Fry", "Vegetable Curry",
+    "Mushroom Risotto", "Greek Salad", "Shakshuka", "Fried Rice",
+    "Spinach Omelette", "Lentil Stew", "Bruschetta", "Potato Gratin"
+]
+
+
+class FakeUsage:
+    def __init__(self, input_tokens, output_tokens):
+        self.input_tokens = input_tokens
+        self.output_tokens = output_tokens
+        self.cache_creation_input_tokens = 0
+        self.cache_read_input_tokens = 0
+
+
+class FakeTextBlock:
+    type = "text"
+
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeMessage:
+    def __init__(self, text, model, input_tokens, cache_creation=0, cache_read=0):
+        self.content = [FakeTextBlock(text)]
+        self.model = model
+        self.role = "assistant"
+        self.stop_reason = "end_turn"
+        self.usage = FakeUsage(input_tokens, len(text) // 4)
+        self.usage.cache_creation_input_tokens = cache_creation
+        self.usage.cache_read_input_tokens = cache_read
+
+
+def canned_response(seed, num_recipes=3):
+    """Build a deterministic '##'-formatted response for a seed"""
+    rng = random.Random(seed)
+    parts = []
+    for name in rng.sample(RECIPE_NAMES, num_recipes):
+        parts.append(
+            f"## {name}\n\n"
+            "**Ingredients:**\n- Ingredient one ✓\n- Ingredient two ✓\n- Salt and pepper\n\n"
+            "**Preparation:**\n1. Prepare the ingredients.\n2. Cook everything.\n3. Season and serve.\n\n"
+            "**Time:** 20 minutes\n"
+        )
+    return "\n".join(parts)
+
+
+def check_request(kwargs):
+    """Validate the request shape like the Messages API would (raises ValueError)"""
+    for key in ("model", "max_tokens", "messages"):
+        if key not in kwargs:
+            raise ValueError(f"missing required field: {key}")
+    system = kwargs.get("system")
+    if system is not None and not isinstance(system, str):
+        for block in system:
+            if block.get("type") != "text" or not isinstance(block.get("text"), str):
+                raise ValueError("system blocks must be text blocks")
+            cache_control = block.get("cache_control")
+            if cache_control is not None and cache_control != {"type": "ephemeral"}:
+                raise ValueError(f"unsupported cache_control: {cache_control}")
+    messages = kwargs["messages"]
+    if not messages or messages[0].get("role") != "user":
+        raise ValueError("messages must start with a user turn")
+    for message in messages:
+        if message.get("role") not in ("user", "assistant"):
+            raise ValueError(f"invalid role: {message.get('role')}")
+
+
+def _cached_prefix(kwargs):
+    """Text of the system blocks up to and including the last cache_control marker"""
+    system = kwargs.get("system")
+    if not system or isinstance(system, str):
+        return ""
+    prefix = ""
+    texts = []
+    for block in system:
+        texts.append(block["text"])
+        if block.get("cache_control"):
+            prefix = "\n".join(texts)
+    return prefix
+
+
+def _prompt_text(kwargs):
+    """Concatenate all text of a request (system + messages)"""
+    texts = []
+    system = kwargs.get("system")
+    if isinstance(system, str):
+        texts.append(system)
+    elif system:
+        texts.extend(block.get("text", "") for block in system)
+    for message in kwargs.get("messages", []):
+        content = message["content"]
+        if isinstance(content, str):
+            texts.append(content)
+        else:
+            texts.extend(block.get("text", "") for block in content)
+    return "\n".join(texts)
+
+
+class FakeStream:
+    """Mimics the context manager returned by client.messages.stream()"""
+
+    def __init__(self, message, chunk_size, chunk_delay):
+        self._message = message
+        self._chunk_size = chunk_size
+        self._chunk_delay = chunk_delay
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    @property
+    def text_stream(self):
+        text = self._message.content[0].text
+        for i in range(0, len(text), self._chunk_size):
+            if self._chunk_delay:
+                time.sleep(self._chunk_delay)
+            yield text[i:i + self._chunk_size]
+
+    def get_final_message(self):
+        return self._message
+
+
+class FakeBatches:
+    """Mimics client.messages.batches; a batch ends after polls_until_ended retrieve() calls"""
+
+    def __init__(self, owner, polls_until_ended=1):
+        self._owner = owner
+        self.polls_until_ended = polls_until_ended
+        self._batches = {}
+
+    def _view(self, batch_id):
+        batch = self._batches[batch_id]
+        ended = batch["polls"] >= self.polls_until_ended
+        total = len(batch["requests"])
+        return SimpleNamespace(
+            id=batch_id,
+            processing_status="ended" if ended else "in_progress",
+            request_counts=SimpleNamespace(processing=0 if ended else total, succeeded=total if ended else 0,
+                                           errored=0, canceled=0, expired=0)
+        )
+
+    def create(self, requests):
+        for request in requests:
+            self._owner.record(request["params"])
+        batch_id = f"msgbatch_fake_{len(self._batches) + 1}"
+        self._batches[batch_id] = {"requests": list(requests), "polls": 0}
+        return self._view(batch_id)
+
+    def retrieve(self, batch_id):
+        self._batches[batch_id]["polls"] += 1
+        return self._view(batch_id)
+
+    def results(self, batch_id):
+        if self._view(batch_id).processing_status != "ended":
+            raise ValueError(f"batch {batch_id} is still processing")
+        for request in self._batches[batch_id]["requests"]:
+            message = self._owner.build_message(request["params"])
+            yield SimpleNamespace(custom_id=request["custom_id"],
+                                  result=SimpleNamespace(type="succeeded", message=message))
+
+
+class FakeMessages:
+    def __init__(self, owner):
+        self._owner = owner
+        self.batches = FakeBatches(owner)
+
+    def create(self, **kwargs):
+        self._owner.record(kwargs)
+        if self._owner.latency:
+            time.sleep(self._owner.latency)
+        return self._owner.build_message(kwargs)
+
+    def stream(self, **kwargs):
+        self._owner.record(kwargs)
+        if self._owner.latency:
+            time.sleep(self._owner.latency)
+        return FakeStream(self._owner.build_message(kwargs), self._owner.chunk_size, self._owner.chunk_delay)
+
+
+class FakeAnthropic:
+    """Drop-in replacement for anthropic.Anthropic in benchmarks"""
+
+    def __init__(self, latency=0.0, chunk_size=16, chunk_delay=0.0, seed=0):
+        self.latency = latency
+        self.chunk_size = chunk_size
+        self.chunk_delay = chunk_delay
+        self.seed = seed
+        self.requests = []
+        self._cached_prefixes = set()
+        self._lock = threading.Lock()
+        self.messages = FakeMessages(self)
+
+    def record(self, kwargs):
+        check_request(kwargs)
+        with self._lock:
+            self.requests.append(kwargs)
+
+    def build_message(self, kwargs):
+        prompt = _prompt_text(kwargs)
+        # Same prompt -> same response, like a deterministic model
+        text = canned_response(f"{self.seed}:{prompt}")
+        # Cache-marked prefix: written on first use, read afterwards
+        prefix = _cached_prefix(kwargs)
+        cache_creation = cache_read = 0
+        if prefix:
+            with self._lock:
+                cache_hit = prefix in self._cached_prefixes
+                self._cached_prefixes.add(prefix)
+            if cache_hit:
+                cache_read = len(prefix) // 4
+            else:
+                cache_creation = len(prefix) // 4
+        input_tokens = (len(prompt) - len(prefix)) // 4
+        return FakeMessage(text, kwargs.get("model", ""), input_tokens, cache_creation, cache_read)
+
+
+class AsyncFakeMessages:
+    def __init__(self, owner):
+        self._owner = owner
+
+    async def create(self, **kwargs):
+        self._owner.record(kwargs)
+        if self._owner.latency:
+            await asyncio.sleep(self._owner.latency)
+        return self._owner.build_message(kwargs)
+
+
+class AsyncFakeAnthropic(FakeAnthropic):
+    """Drop-in replacement for anthropic.AsyncAnthropic in benchmarks"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.messages = AsyncFakeMessages(self)
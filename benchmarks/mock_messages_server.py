@@ -0,0 +1,233 @@
+"""
+Local stand-in for the Anthropic Messages API (POST /v1/messages, JSON and SSE streaming)
+
+Validates requests and answers with the canned responses of fake_client (including the
+prompt caching usage fields), after an optional latency. Point the SDK at it via base_url:
+
+  python3 -m benchmarks.mock_messages_server --port 9000 --latency 0.2
+  python3 server.py --base-url http://127.0.0.1:9000
+
+The latency is fixed, or drawn per request from a distribution (--distribution exponential:
+mean --latency; lognormal: median --latency, spread --sigma). Streamed responses are sent in
+--chunk-size character chunks, --chunk-delay seconds apart.
+
+Fault injection for testing timeouts, hedging and the circuit breaker: a share of the
+requests fails with an error status (--error-rate, --error-status) or is answered only after
+an extra delay (--slow-rate, --slow-latency; a long delay simulates a hanging upstream).
+The fault settings are plain attributes and can be changed while the server runs.
+"""
+
+import sys
+import json
+import math
+import time
+import uuid
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from benchmarks.fake_client import FakeAnthropic
+
+# Characters per content_block_delta event when streaming
+STREAM_CHUNK_SIZE = 16
+# Latency distributions of draw_latency()
+DISTRIBUTIONS = ("fixed", "exponential", "lognormal")
+
+
+def message_to_dict(message):
+    """JSON body of a fake message, as returned by the Messages API"""
+    usage = message.usage
+    return {
+        "id": f"msg_{uuid.uuid4().hex[:24]}",
+        "type": "message",
+        "role": "assistant",
+        "model": message.model,
+        "content": [{"type": "text", "text": message.content[0].text}],
+        "stop_reason": message.stop_reason,
+        "stop_sequence": None,
+        "usage": {
+            "input_tokens": usage.input_tokens,
+            "output_tokens": usage.output_tokens,
+            "cache_creation_input_tokens": usage.cache_creation_input_tokens,
+            "cache_read_input_tokens": usage.cache_read_input_tokens
+        }
+    }
+
+
+def stream_events(body, chunk_size=STREAM_CHUNK_SIZE):
+    """(event, data) pairs of a streamed response"""
+    text = body["content"][0]["text"]
+    start = dict(body, content=[], stop_reason=None)
+    start["usage"] = dict(body["usage"], output_tokens=1)
+    yield "message_start", {"type": "message_start", "message": start}
+    yield "content_block_start", {"type": "content_block_start", "index": 0,
+                                  "content_block": {"type": "text", "text": ""}}
+    for i in range(0, len(text), chunk_size):
+        yield "content_block_delta", {"type": "content_block_delta", "index": 0,
+                                      "delta": {"type": "text_delta", "text": text[i:i + chunk_size]}}
+    yield "content_block_stop", {"type": "content_block_stop", "index": 0}
+    yield "message_delta", {"type": "message_delta",
+                            "delta": {"stop_reason": body["stop_reason"], "stop_sequence": None},
+                            "usage": {"output_tokens": body["usage"]["output_tokens"]}}
+    yield "message_stop", {"type": "message_stop"}
+
+
+class MockMessagesHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        if self.path.split("?")[0] != "/v1/messages":
+            self._send_json(404, {"type": "error", "error": {"type": "not_found_error", "message": self.path}})
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            self.server.fake.record(request)
+        except ValueError as error:
+            self._send_json(400, {"type": "error",
+                                  "error": {"type": "invalid_request_error", "message": str(error)}})
+            return
+        fault = self.server.pick_fault()
+        if fault == "error":
+            status = self.server.error_status
+            error_type = "overloaded_error" if status == 529 else "api_error"
+            self._send_json(status, {"type": "error", "error": {"type": error_type, "message": "Injected fault"}})
+            return
+        latency = self.server.draw_latency() + (self.server.slow_latency if fault == "slow" else 0.0)
+        if latency:
+            time.sleep(latency)
+        body = message_to_dict(self.server.fake.build_message(request))
+        if request.get("stream"):
+            self._send_stream(body)
+        else:
+            self._send_json(200, body)
+
+    def _send_json(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_stream(self, body):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for event, data in stream_events(body, self.server.chunk_size):
+            chunk = f"event: {event}\ndata: {json.dumps(data)}\n\n".encode("utf-8")
+            self.wfile.write(f"{len(chunk):x}\r\n".encode("ascii") + chunk + b"\r\n")
+            if self.server.chunk_delay:
+                self.wfile.flush()
+                time.sleep(self.server.chunk_delay)
+        self.wfile.write(b"0\r\n\r\n")
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MockMessagesServer(ThreadingHTTPServer):
+    """Mock Messages endpoint; start() serves it in a background thread"""
+
+    daemon_threads = True
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, chunk_delay=0.0, seed=0,
+                 error_rate=0.0, error_status=503, slow_rate=0.0, slow_latency=0.0,
+                 distribution="fixed", sigma=0.5, chunk_size=STREAM_CHUNK_SIZE):
+        super().__init__((host, port), MockMessagesHandler)
+        if distribution not in DISTRIBUTIONS:
+            raise ValueError(f"Unknown latency distribution: {distribution}")
+        self.latency = latency
+        self.distribution = distribution
+        self.sigma = sigma
+        self.chunk_delay = chunk_delay
+        self.chunk_size = chunk_size
+        self.fake = FakeAnthropic(seed=seed)
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.faults = {"error": 0, "slow": 0}
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self._thread = None
+
+    def pick_fault(self):
+        """"error", "slow" or None for the next request"""
+        with self._rng_lock:
+            draw = self._rng.random()
+            fault = None
+            if draw < self.error_rate:
+                fault = "error"
+            elif draw < self.error_rate + self.slow_rate:
+                fault = "slow"
+            if fault:
+                self.faults[fault] += 1
+            return fault
+
+    def draw_latency(self):
+        """Seconds before the next response, from the configured distribution"""
+        if not self.latency or self.distribution == "fixed":
+            return self.latency
+        with self._rng_lock:
+            if self.distribution == "exponential":
+                return self._rng.expovariate(1 / self.latency)
+            return self._rng.lognormvariate(math.log(self.latency), self.sigma)
+
+    def handle_error(self, request, client_address):
+        # Clients that gave up (timeouts, cancelled hedged requests) close the connection early
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def requests(self):
+        """Validated requests received so far"""
+        return self.fake.requests
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name="mock-messages", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock Anthropic Messages endpoint")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds before each response")
+    parser.add_argument("--distribution", choices=DISTRIBUTIONS, default="fixed",
+                        help="latency distribution (exponential: mean, lognormal: median --latency)")
+    parser.add_argument("--sigma", type=float, default=0.5, help="spread of the lognormal distribution")
+    parser.add_argument("--chunk-size", type=int, default=STREAM_CHUNK_SIZE, help="characters per streamed chunk")
+    parser.add_argument("--chunk-delay", type=float, default=0.0, help="seconds between streamed chunks")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with an error")
+    parser.add_argument("--error-status", type=int, default=503, help="status of injected errors (e.g. 500, 503, 529)")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="share of requests delayed by --slow-latency")
+    parser.add_argument("--slow-latency", type=float, default=0.0, help="extra seconds for slow requests")
+    args = parser.parse_args()
+
+    server = MockMessagesServer(args.host, args.port, args.latency, args.chunk_delay, error_rate=args.error_rate,
+                                error_status=args.error_status, slow_rate=args.slow_rate,
+                                slow_latency=args.slow_latency, distribution=args.distribution,
+                                sigma=args.sigma, chunk_size=args.chunk_size)
+    print(f"Mock Messages API on {server.url} (Ctrl+C to stop)", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
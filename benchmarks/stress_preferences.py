@@ -0,0 +1,145 @@
+"""
+Stress test: many processes writing the same user's preferences.json at once
+
+Every worker runs sessions of "load, add a suggestion, rate it" (one batch, i.e. one write
+per session) against the same profile, while a reader keeps loading the file. Afterwards
+no rating may be missing and the reader must never have seen a partial file.
+
+--legacy runs the same workload with the old write (truncate and rewrite in place, no lock,
+no merge) for comparison. --kill SIGKILLs workers at random moments (crash mid-write);
+the file must still be valid.
+
+Usage (from the repository root):
+  python3 -m benchmarks.stress_preferences [--processes 8] [--sessions 25] [--legacy] [--kill 2]
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import signal
+import argparse
+import tempfile
+import multiprocessing
+
+import profile_model
+from storage import JsonStorage, default_preferences
+
+
+def legacy_session(preferences_file, worker, session):
+    """The old write path: read, modify, truncate and rewrite in place"""
+    with open(preferences_file, 'r', encoding='utf-8') as f:
+        prefs = profile_model.from_stored(json.load(f))
+    dish = f"Dish {worker}-{session}"
+    prefs["suggested_recipes"].append({"name": dish, "ingredients": "eggs", "suggested_at": "", "rated": False})
+    profile_model.record_rating(prefs, {"dish": dish, "rating": 5, "date": "2024-01-01T12:00:00"}, "liked")
+    with open(preferences_file, 'w', encoding='utf-8') as f:
+        json.dump(prefs, f, indent=2, ensure_ascii=False, default=profile_model.to_json)
+
+
+def session(storage, preferences_file, worker, session):
+    """One CLI-like session: suggestion plus feedback, written once at the end"""
+    with storage.batch():
+        prefs = storage.load(preferences_file)
+        dish = f"Dish {worker}-{session}"
+        storage.add_suggestions(prefs, preferences_file, [
+            {"name": dish, "ingredients": "eggs", "suggested_at": "", "rated": False}])
+        storage.add_rating(prefs, preferences_file,
+                           {"dish": dish, "rating": 5, "date": "2024-01-01T12:00:00"}, "liked")
+
+
+def writer(preferences_file, worker, sessions, legacy, errors):
+    storage = JsonStorage()
+    for i in range(sessions):
+        try:
+            if legacy:
+                legacy_session(preferences_file, worker, i)
+            else:
+                session(storage, preferences_file, worker, i)
+        except ValueError:
+            # Legacy mode: read a half-written file
+            with errors.get_lock():
+                errors.value += 1
+
+
+def reader(preferences_file, stop, reads, errors):
+    while not stop.is_set():
+        try:
+            with open(preferences_file, 'r', encoding='utf-8') as f:
+                json.load(f)
+            with reads.get_lock():
+                reads.value += 1
+        except ValueError:
+            with errors.get_lock():
+                errors.value += 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent preference writes to one user")
+    parser.add_argument("--processes", type=int, default=8)
+    parser.add_argument("--sessions", type=int, default=25, help="sessions per process")
+    parser.add_argument("--legacy", action="store_true", help="use the old in-place write for comparison")
+    parser.add_argument("--kill", type=int, default=0, help="SIGKILL this many workers at random moments")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="recipe-stress-")
+    preferences_file = os.path.join(workdir, "preferences.json")
+    with open(preferences_file, 'w', encoding='utf-8') as f:
+        json.dump(default_preferences(), f)
+
+    write_errors = multiprocessing.Value("i", 0)
+    read_errors = multiprocessing.Value("i", 0)
+    reads = multiprocessing.Value("i", 0)
+    stop = multiprocessing.Event()
+    workers = [multiprocessing.Process(target=writer, args=(preferences_file, i, args.sessions, args.legacy,
+                                                            write_errors))
+               for i in range(args.processes)]
+    watcher = multiprocessing.Process(target=reader, args=(preferences_file, stop, reads, read_errors))
+    try:
+        started = time.perf_counter()
+        watcher.start()
+        for process in workers:
+            process.start()
+        rng = random.Random(0)
+        for process in rng.sample(workers, min(args.kill, len(workers))):
+            time.sleep(rng.uniform(0.0, 0.3))
+            os.kill(process.pid, signal.SIGKILL)
+        for process in workers:
+            process.join()
+        elapsed = time.perf_counter() - started
+        stop.set()
+        watcher.join()
+
+        problems = []
+        try:
+            final = JsonStorage().load(preferences_file)
+            stored = profile_model.rating_count(final)
+        except ValueError:
+            stored = 0
+            problems.append("final file is corrupt")
+        expected = args.processes * args.sessions
+        killed = sum(1 for process in workers if process.exitcode == -signal.SIGKILL)
+        leftovers = [name for name in os.listdir(workdir) if name.endswith(".tmp")]
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"{'legacy' if args.legacy else 'locked'} writes: {args.processes} processes x {args.sessions} "
+          f"sessions in {elapsed:.2f}s ({expected / elapsed:.0f} sessions/s), {killed} killed")
+    print(f"Ratings stored: {stored} of {expected} ({expected - stored} lost)")
+    print(f"Reader: {reads.value} reads, {read_errors.value} partial; writers: {write_errors.value} failed reads")
+    if leftovers:
+        print(f"Temp files left by killed workers: {len(leftovers)}")
+    if read_errors.value or write_errors.value:
+        problems.append("partial file seen")
+    if killed == 0 and stored != expected:
+        problems.append("lost updates")
+    if killed and stored > expected:
+        problems.append("duplicated ratings")
+    print("OK" if not problems else "; ".join(problems))
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,201 @@
+"""
+Token-budgeted preference context for the Recipe Assistant prompts
+Liked/disliked dishes and rating comments are ranked by ingredient overlap with the
+current request and by recency-weighted score, then added until the token budget is full.
+
+The per-profile features (stem matrix, strengths, ages) are cached per profile version,
+so only the ranking runs for each request. Uses NumPy if installed (imported on the first
+request, not at startup), plain Python otherwise.
+"""
+
+import os
+import re
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+import metrics
+import profile_model
+
+# Default token budget for the whole preference context
+CONTEXT_TOKEN_BUDGET = 120
+# Override the budget with RECIPE_ASSISTANT_CONTEXT_TOKENS=<tokens>
+CONTEXT_TOKENS_ENV_VAR = "RECIPE_ASSISTANT_CONTEXT_TOKENS"
+# Rough token estimate used for budgeting
+CHARS_PER_TOKEN = 4
+# Weight of the ingredient overlap relative to the recency-weighted score (both 0-1)
+OVERLAP_WEIGHT = 2.0
+# Number of profiles whose features are kept in memory
+MAX_CACHED_PROFILES = 128
+# Words are compared by their first letters so that plural and German forms match
+# (tomato/tomatoes/Tomaten -> "tomat")
+STEM_LENGTH = 5
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+# NumPy module, None if not installed, False until first checked
+_np = False
+
+
+def _numpy():
+    """Import NumPy on first use (it adds noticeably to the startup time)"""
+    global _np
+    if _np is False:
+        try:
+            import numpy
+            _np = numpy
+        except ImportError:
+            _np = None
+    return _np
+
+
+def token_budget():
+    """Configured token budget"""
+    try:
+        return int(os.environ.get(CONTEXT_TOKENS_ENV_VAR, CONTEXT_TOKEN_BUDGET))
+    except ValueError:
+        return CONTEXT_TOKEN_BUDGET
+
+
+def estimate_tokens(text):
+    """Approximate number of tokens of a text"""
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def stems(text):
+    """Set of word stems of a dish name or ingredient list"""
+    words = re.findall(r"[^\W\d_]+", text.lower())
+    return {w[:STEM_LENGTH] for w in words if len(w) > 2}
+
+
+def _age_days(date, now):
+    try:
+        return max(0.0, (now - datetime.fromisoformat(date)).total_seconds() / 86400)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class ProfileFeatures:
+    """Context candidates of one profile version (oldest first within each kind)"""
+
+    def __init__(self, preferences, now=None):
+        now = now or datetime.now()
+        dish_stats = preferences.get("dish_stats") or {}
+        # The pantry a dish was suggested for adds ingredient words to its name
+        pantries = {recipe["name"].lower(): recipe.get("ingredients", "")
+                    for recipe in preferences.get("suggested_recipes", [])}
+
+        self.kinds, self.texts, self.stem_sets, self.strengths, self.ages = [], [], [], [], []
+        for kind in ("liked", "disliked"):
+            dishes = list(OrderedDict.fromkeys(preferences.get(f"{kind}_dishes", [])))
+            for position, dish in enumerate(dishes):
+                stats = dish_stats.get(dish)
+                if stats is not None and stats.count:
+                    # A mean rating of 5 (liked) or 1 (disliked) gives full strength
+                    strength = abs(stats.mean - profile_model.NEUTRAL_RATING) / 2
+                    age = _age_days(stats.last_date, now)
+                else:
+                    # Without an aggregate the list order is the only recency information
+                    strength, age = 1.0, float(len(dishes) - 1 - position)
+                self._add(kind, dish, stems(dish + " " + pantries.get(dish.lower(), "")), strength, age)
+        for entry in preferences.get("ratings", []):
+            if entry.get("reason"):
+                self._add("note", f"{entry['dish']} ({entry['rating']}/5): {entry['reason']}",
+                          stems(entry["dish"]), 1.0, _age_days(entry.get("date"), now))
+
+        self.vocabulary = {}
+        for stem_set in self.stem_sets:
+            for stem in stem_set:
+                self.vocabulary.setdefault(stem, len(self.vocabulary))
+
+        np = _numpy()
+        self.matrix = None
+        if np is not None:
+            self.matrix = np.zeros((len(self.texts), max(1, len(self.vocabulary))), dtype=np.uint8)
+            for row, stem_set in enumerate(self.stem_sets):
+                self.matrix[row, [self.vocabulary[s] for s in stem_set]] = 1
+            half_life = profile_model.SCORE_HALF_LIFE_DAYS
+            self.weights = np.asarray(self.strengths) * 0.5 ** (np.asarray(self.ages) / half_life)
+
+    def _add(self, kind, text, stem_set, strength, age):
+        self.kinds.append(kind)
+        self.texts.append(text)
+        self.stem_sets.append(stem_set)
+        self.strengths.append(strength)
+        self.ages.append(age)
+
+    def rank(self, ingredients):
+        """Candidate indices, most relevant first (newer first on ties)"""
+        query = stems(ingredients)
+        count = len(self.texts)
+        if self.matrix is not None:
+            np = _numpy()
+            columns = [self.vocabulary[s] for s in query if s in self.vocabulary]
+            overlap = self.matrix[:, columns].sum(axis=1) if columns else np.zeros(count)
+            relevance = OVERLAP_WEIGHT * overlap / max(1, len(query)) + self.weights
+            return np.lexsort((-np.arange(count), -relevance)).tolist()
+
+        half_life = profile_model.SCORE_HALF_LIFE_DAYS
+        relevance = [OVERLAP_WEIGHT * len(stem_set & query) / max(1, len(query))
+                     + self.strengths[i] * 0.5 ** (self.ages[i] / half_life)
+                     for i, stem_set in enumerate(self.stem_sets)]
+        return sorted(range(count), key=lambda i: (-relevance[i], -i))
+
+
+def get_features(preferences):
+    """Features of a profile, rebuilt only when its version changed"""
+    key = id(preferences)
+    version = preferences.get("version", 0)
+    with _cache_lock:
+        entry = _cache.get(key)
+        # The entry holds a reference to the profile, so the id cannot have been reused
+        if entry is not None and entry[0] is preferences and entry[1] == version:
+            _cache.move_to_end(key)
+            metrics.increment("recipe_context_cache_total", result="hit")
+            return entry[2]
+    metrics.increment("recipe_context_cache_total", result="miss")
+    features = ProfileFeatures(preferences)
+    with _cache_lock:
+        _cache[key] = (preferences, version, features)
+        _cache.move_to_end(key)
+        while len(_cache) > MAX_CACHED_PROFILES:
+            _cache.popitem(last=False)
+    return features
+
+
+def build_context(preferences, labels, ingredients="", budget=None):
+    """
+    Build the preference context for a request within the token budget.
+    labels maps liked/disliked/dietary/note to the (translated) section names.
+    Dietary restrictions (e.g. allergies) are always included, also beyond the budget;
+    the most relevant dishes and comments fill what is left of it.
+    """
+    budget = token_budget() if budget is None else budget
+    sections = {"liked": [], "disliked": [], "dietary": [], "note": []}
+    used = 0
+
+    def add(kind, text, limit):
+        nonlocal used
+        cost = estimate_tokens(", " + text if sections[kind] else f"\n{labels[kind]}: {text}")
+        if used + cost <= limit:
+            sections[kind].append(text)
+            used += cost
+
+    for restriction in preferences.get("dietary_restrictions", []):
+        add("dietary", restriction, float("inf"))
+    features = get_features(preferences)
+    for i in features.rank(ingredients):
+        if used >= budget:
+            break
+        add(features.kinds[i], features.texts[i], budget)
+
+    context = ""
+    if sections["liked"]:
+        context += f"\n\n{labels['liked']}: {', '.join(sections['liked'])}"
+    if sections["disliked"]:
+        context += f"\n{labels['disliked']}: {', '.join(sections['disliked'])}"
+    if sections["dietary"]:
+        context += f"\n{labels['dietary']}: {', '.join(sections['dietary'])}"
+    if sections["note"]:
+        context += f"\n{labels['note']}: {'; '.join(sections['note'])}"
+    return context
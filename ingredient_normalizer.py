@@ -0,0 +1,305 @@
+"""
+Bilingual ingredient canonicalization for the Recipe Assistant
+
+Free-text ingredient lists ("2 große Tomaten; Mozzarella", "mozzarella, tomatoes") are turned
+into canonical, sorted ingredient sets: items are split, quantities, units and filler words
+are dropped, and English/German synonyms and plurals are mapped to one English name
+("Tomaten", "tomatoes" -> "tomato"). Each canonical name has an integer ID; names in the
+vocabulary below have fixed small IDs, others a stable hash-based ID.
+
+The lookup tables are built once at import; results are memoized per item and per list,
+so bulk re-normalization mostly costs dictionary lookups.
+
+Usage: python3 ingredient_normalizer.py renormalize [users_dir] [--workers N]
+       python3 ingredient_normalizer.py show "<ingredients>"
+"""
+
+import os
+import re
+import sys
+import zlib
+import unicodedata
+from functools import lru_cache
+
+# Canonical name first, then its English/German variants (plurals of regular English nouns
+# are handled by _singular). The position defines the ID: append new entries, never reorder.
+VOCABULARY = (
+    ("tomato", "tomatoes", "tomate", "tomaten"),
+    ("cherry tomato", "cherry tomatoes", "kirschtomate", "kirschtomaten", "cocktailtomate", "cocktailtomaten"),
+    ("potato", "potatoes", "kartoffel", "kartoffeln", "erdapfel", "erdäpfel"),
+    ("sweet potato", "sweet potatoes", "süßkartoffel", "süßkartoffeln", "suesskartoffel", "suesskartoffeln"),
+    ("onion", "zwiebel", "zwiebeln"),
+    ("red onion", "rote zwiebel", "rote zwiebeln"),
+    ("spring onion", "scallion", "green onion", "frühlingszwiebel", "frühlingszwiebeln", "lauchzwiebel",
+     "lauchzwiebeln"),
+    ("garlic", "knoblauch", "garlic clove", "knoblauchzehe", "knoblauchzehen"),
+    ("leek", "lauch", "porree"),
+    ("carrot", "karotte", "karotten", "möhre", "möhren", "moehre", "moehren", "mohrrübe", "mohrrüben"),
+    ("bell pepper", "peppers", "red pepper", "red peppers", "green pepper", "green peppers", "yellow pepper",
+     "yellow peppers", "paprika", "paprikas", "rote paprika", "grüne paprika", "gelbe paprika", "paprikaschote", "paprikaschoten"),
+    ("chili", "chilli", "chilies", "chillies", "chili pepper", "chilischote", "chilischoten"),
+    ("cucumber", "gurke", "gurken", "salatgurke", "salatgurken"),
+    ("zucchini", "zucchinis", "courgette", "zucchino"),
+    ("eggplant", "aubergine", "auberginen"),
+    ("mushroom", "pilz", "pilze", "champignon", "champignons"),
+    ("spinach", "spinat", "baby spinach", "babyspinat", "blattspinat"),
+    ("broccoli", "brokkoli"),
+    ("cauliflower", "blumenkohl"),
+    ("cabbage", "kohl", "weißkohl", "weisskohl"),
+    ("red cabbage", "rotkohl", "blaukraut"),
+    ("kale", "grünkohl", "gruenkohl"),
+    ("lettuce", "kopfsalat", "blattsalat", "eisbergsalat"),
+    ("pumpkin", "kürbis", "kuerbis", "hokkaido"),
+    ("corn", "mais", "sweetcorn", "sweet corn", "zuckermais"),
+    ("pea", "erbse", "erbsen"),
+    ("green bean", "grüne bohnen", "gruene bohnen", "prinzessbohnen", "buschbohnen"),
+    ("bean", "bohne", "bohnen"),
+    ("kidney bean", "kidneybohnen", "kidney bohnen", "kidneybohne"),
+    ("chickpea", "kichererbse", "kichererbsen"),
+    ("lentil", "linse", "linsen"),
+    ("asparagus", "spargel"),
+    ("celery", "sellerie", "staudensellerie"),
+    ("avocado", "avocados"),
+    ("olive", "oliven"),
+    ("apple", "apfel", "äpfel", "aepfel"),
+    ("banana", "banane", "bananen"),
+    ("lemon", "zitrone", "zitronen"),
+    ("lime", "limette", "limetten"),
+    ("orange", "orangen", "apfelsine", "apfelsinen"),
+    ("strawberry", "erdbeere", "erdbeeren"),
+    ("raspberry", "himbeere", "himbeeren"),
+    ("blueberry", "heidelbeere", "heidelbeeren", "blaubeere", "blaubeeren"),
+    ("pear", "birne", "birnen"),
+    ("cherry", "kirsche", "kirschen"),
+    ("grape", "weintraube", "weintrauben", "trauben"),
+    ("mango", "mangos", "mangoes"),
+    ("pineapple", "ananas"),
+    ("peach", "pfirsich", "pfirsiche"),
+    ("plum", "pflaume", "pflaumen"),
+    ("ginger", "ingwer"),
+    ("basil", "basilikum"),
+    ("parsley", "petersilie"),
+    ("coriander", "cilantro", "koriander"),
+    ("dill",),
+    ("thyme", "thymian"),
+    ("rosemary", "rosmarin"),
+    ("oregano",),
+    ("mint", "minze"),
+    ("chives", "chive", "schnittlauch"),
+    ("rice", "reis", "basmati", "basmatireis", "jasminreis", "jasmine rice"),
+    ("pasta", "nudeln", "nudel", "teigwaren"),
+    ("noodle", "asia nudeln", "mie nudeln", "reisnudeln", "rice noodle"),
+    ("spaghetti",),
+    ("bread", "brot"),
+    ("flour", "mehl"),
+    ("oats", "oat", "rolled oats", "haferflocken", "hafer"),
+    ("quinoa",),
+    ("couscous",),
+    ("bulgur",),
+    ("egg", "ei", "eier"),
+    ("milk", "milch"),
+    ("butter",),
+    ("cream", "sahne", "schlagsahne"),
+    ("sour cream", "saure sahne", "schmand", "crème fraîche", "creme fraiche"),
+    ("cheese", "käse", "kaese"),
+    ("mozzarella",),
+    ("parmesan", "parmigiano", "parmesankäse", "parmesankaese"),
+    ("feta", "feta cheese", "fetakäse", "schafskäse", "schafskaese"),
+    ("cheddar",),
+    ("yogurt", "yoghurt", "joghurt", "jogurt"),
+    ("quark",),
+    ("tofu",),
+    ("chicken", "hähnchen", "haehnchen", "hühnchen", "huhn", "hühnerfleisch"),
+    ("chicken breast", "hähnchenbrust", "haehnchenbrust", "hühnerbrust", "hähnchenbrustfilet"),
+    ("beef", "rind", "rindfleisch"),
+    ("minced meat", "mince", "ground meat", "ground beef", "minced beef", "hackfleisch", "hack", "rinderhack"),
+    ("pork", "schwein", "schweinefleisch"),
+    ("bacon", "speck", "schinkenspeck"),
+    ("ham", "schinken"),
+    ("sausage", "wurst", "würstchen", "wuerstchen", "bratwurst"),
+    ("salmon", "lachs"),
+    ("tuna", "thunfisch"),
+    ("fish", "fisch"),
+    ("shrimp", "shrimps", "prawn", "garnele", "garnelen", "krabben"),
+    ("salt", "salz"),
+    ("pepper", "black pepper", "pfeffer", "schwarzer pfeffer"),
+    ("sugar", "zucker"),
+    ("honey", "honig"),
+    ("olive oil", "olivenöl", "olivenoel"),
+    ("oil", "öl", "oel", "vegetable oil", "pflanzenöl", "rapsöl", "sonnenblumenöl"),
+    ("vinegar", "essig"),
+    ("soy sauce", "sojasauce", "sojasoße", "sojasosse"),
+    ("mustard", "senf"),
+    ("tomato paste", "tomato puree", "tomatenmark"),
+    ("coconut milk", "kokosmilch"),
+    ("vegetable stock", "vegetable broth", "gemüsebrühe", "gemuesebruehe"),
+    ("chicken stock", "chicken broth", "hühnerbrühe", "huehnerbruehe"),
+    ("stock", "broth", "brühe", "bruehe", "fond"),
+    ("walnut", "walnuss", "walnüsse", "walnuesse"),
+    ("almond", "mandel", "mandeln"),
+    ("peanut", "erdnuss", "erdnüsse", "erdnuesse"),
+    ("hazelnut", "haselnuss", "haselnüsse", "haselnuesse"),
+    ("white wine", "weißwein", "weisswein"),
+    ("red wine", "rotwein"),
+    ("chocolate", "schokolade"),
+    ("cinnamon", "zimt"),
+    ("cumin", "kreuzkümmel", "kreuzkuemmel"),
+    ("curry powder", "curry", "currypulver"),
+    ("paprika powder", "paprikapulver", "smoked paprika", "rosenpaprika"),
+    ("nutmeg", "muskat", "muskatnuss"),
+    ("beetroot", "beet", "rote bete", "rote beete"),
+    ("radish", "radieschen", "rettich"),
+    ("fennel", "fenchel"),
+    ("artichoke", "artischocke", "artischocken"),
+    ("breadcrumbs", "paniermehl", "semmelbrösel", "semmelbroesel"),
+    ("yeast", "hefe"),
+    ("baking powder", "backpulver"),
+)
+
+# Quantities, units and descriptive words that do not change the ingredient
+FILLER_WORDS = frozenset("""
+    a an the of some few little bit and with fresh large small medium big ripe organic frozen canned
+    dried cooked raw whole leftover chopped diced sliced grated peeled can cans tin tins pack piece pieces
+    bunch handful pinch clove cloves g kg mg ml l cl dl oz lb lbs tbsp tsp cup cups
+    und mit etwas ein eine einen einige paar frisch frische frischer frisches frischen groß große großer
+    grosse kleine kleiner klein reif reife bio tiefgekühlt tiefgekühlte tk getrocknet getrocknete gekocht
+    gekochte roh rohe gehackt gehackte geschnitten gerieben geriebener geschält dose dosen glas packung pck
+    stück stk bund handvoll prise zehe zehen el tl becher
+""".split())
+
+# Separators between items of a list (commas, semicolons, lines, "and"/"und", ...)
+_ITEM_SEPARATOR = re.compile(r"[,;\n/&+]|\b(?:and|und|or|oder)\b")
+_WORD = re.compile(r"[^\W\d_]+")
+# IDs of names outside the vocabulary: this bit plus 31 bits of a CRC of the name
+UNKNOWN_ID_FLAG = 1 << 31
+
+
+def _build_tables():
+    names = {}
+    ids = {}
+    for position, (canonical, *variants) in enumerate(VOCABULARY, start=1):
+        ids[canonical] = position
+        for variant in (canonical, *variants):
+            names[unicodedata.normalize("NFC", variant)] = canonical
+    return names, ids
+
+
+# variant -> canonical name, canonical name -> ID
+_NAMES, _IDS = _build_tables()
+_NAMES_BY_ID = {ingredient_id: name for name, ingredient_id in _IDS.items()}
+
+
+def _singular(word):
+    """English singular of a regular plural"""
+    if len(word) <= 3:
+        return word
+    if word.endswith("ies") and len(word) > 4:
+        return word[:-3] + "y"
+    if word.endswith(("oes", "ches", "shes", "sses", "xes")):
+        return word[:-2]
+    if word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    return word
+
+
+@lru_cache(maxsize=65536)
+def canonical_item(item):
+    """Canonical name of one item ("2 große Tomaten" -> "tomato"), None if nothing is left"""
+    words = [word for word in _WORD.findall(unicodedata.normalize("NFC", item.lower()))
+             if word not in FILLER_WORDS]
+    if not words:
+        return None
+    # Whole phrase as written, then in the singular, then word by word
+    for phrase in (" ".join(words), " ".join(map(_singular, words))):
+        name = _NAMES.get(phrase)
+        if name is not None:
+            return name
+    phrase = " ".join(_NAMES.get(word) or _singular(word) for word in words)
+    return _NAMES.get(phrase, phrase)
+
+
+def ingredient_id(name):
+    """ID of a canonical name: fixed for the vocabulary, a stable hash otherwise"""
+    known = _IDS.get(name)
+    if known is not None:
+        return known
+    return UNKNOWN_ID_FLAG | (zlib.crc32(name.encode("utf-8")) & (UNKNOWN_ID_FLAG - 1))
+
+
+def ingredient_name(ingredient_id):
+    """Canonical name of a vocabulary ID (None for hash-based IDs)"""
+    return _NAMES_BY_ID.get(ingredient_id)
+
+
+@lru_cache(maxsize=16384)
+def canonical_names(ingredients):
+    """Sorted tuple of the distinct canonical names in a free-text ingredient list"""
+    names = {canonical_item(item) for item in _ITEM_SEPARATOR.split(ingredients.lower())}
+    names.discard(None)
+    return tuple(sorted(names))
+
+
+@lru_cache(maxsize=16384)
+def ingredient_ids(ingredients):
+    """Sorted tuple of the ingredient IDs of a free-text ingredient list"""
+    return tuple(sorted({ingredient_id(name) for name in canonical_names(ingredients)}))
+
+
+def canonical_key(ingredients):
+    """One string for the canonical set (the same for any order, spelling or language)"""
+    return ", ".join(canonical_names(ingredients))
+
+
+def similarity(ids_a, ids_b):
+    """Jaccard similarity of two ID sets (or free-text ingredient lists)"""
+    a = set(ingredient_ids(ids_a) if isinstance(ids_a, str) else ids_a)
+    b = set(ingredient_ids(ids_b) if isinstance(ids_b, str) else ids_b)
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def renormalize_all(users_dir, workers=None, index_file=None):
+    """
+    Re-normalize existing data: the ingredient IDs of every profile's suggestions, the
+    recipe index postings and the analytics column store (rebuilt from all logs).
+    Returns counts per part.
+    """
+    import analytics
+    import storage
+    from recipe_index import RecipeIndex, INDEX_DB_NAME
+
+    backend = storage.create_storage(users_dir)
+    if backend.name == "sqlite":
+        suggestions = backend.renormalize_suggestions()
+        backend.close()
+    else:
+        suggestions = storage.renormalize_json_tree(users_dir)
+    counts = {"suggestions": suggestions}
+    index = RecipeIndex(index_file or os.path.join(users_dir, INDEX_DB_NAME))
+    try:
+        counts["indexed_responses"] = index.retokenize()
+    finally:
+        index.close()
+    counts["log_entries"] = analytics.LogAnalytics(users_dir).update(workers, rebuild=True)["rows"]
+    return counts
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in ("renormalize", "show"):
+        print("Usage: python3 ingredient_normalizer.py renormalize [users_dir] [--workers N]\n"
+              "       python3 ingredient_normalizer.py show \"<ingredients>\"")
+        sys.exit(1)
+    if sys.argv[1] == "show":
+        for name in canonical_names(" ".join(sys.argv[2:])):
+            print(f"{ingredient_id(name):>10}  {name}")
+        sys.exit(0)
+    args = sys.argv[2:]
+    workers = None
+    if "--workers" in args:
+        position = args.index("--workers")
+        workers = int(args[position + 1])
+        del args[position:position + 2]
+    results = renormalize_all(args[0] if args else "users", workers)
+    print(f"Re-normalized {results['suggestions']} suggestion(s), {results['indexed_responses']} indexed "
+          f"response(s) and {results['log_entries']} log entr(ies)")
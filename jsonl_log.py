@@ -0,0 +1,267 @@
+"""
+Append-only JSONL log with segment rotation
+One JSON object per line; writes only append, "last N" reads seek from the end
+"""
+
+import os
+import re
+import sys
+import gzip
+import json
+import shutil
+
+import metrics
+from storage import locked_file
+from user_registry import iter_user_dirs
+
+# Rotate the active segment once it reaches this size (bytes)
+SEGMENT_MAX_BYTES = 1024 * 1024
+# Optionally rotate after this many entries (None = size-based only)
+SEGMENT_MAX_ENTRIES = None
+# Gzip closed segments
+COMPRESS_SEGMENTS = False
+# Number of closed segments to keep (None = keep all)
+MAX_SEGMENTS = None
+
+# Block size used when reading backwards from the end of a file
+READ_BLOCK_SIZE = 64 * 1024
+
+
+def _segment_pattern(log_file):
+    """Regex matching closed segment names for a log file"""
+    base = os.path.basename(log_file)
+    stem, ext = os.path.splitext(base)
+    return re.compile(rf"^{re.escape(stem)}\.(\d+){re.escape(ext)}(\.gz)?$")
+
+
+def indexed_segments(log_file):
+    """(index, path) of the closed segments of a log file, oldest first"""
+    log_dir = os.path.dirname(log_file) or "."
+    if not os.path.isdir(log_dir):
+        return []
+    pattern = _segment_pattern(log_file)
+    segments = []
+    for name in os.listdir(log_dir):
+        match = pattern.match(name)
+        if match:
+            segments.append((int(match.group(1)), os.path.join(log_dir, name)))
+    segments.sort()
+    return segments
+
+
+def list_segments(log_file):
+    """List closed segments of a log file, oldest first"""
+    return [path for _, path in indexed_segments(log_file)]
+
+
+def _count_lines(path):
+    """Count lines in an uncompressed file without parsing it"""
+    count = 0
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(READ_BLOCK_SIZE), b""):
+            count += block.count(b"\n")
+    return count
+
+
+def _needs_rotation(log_file, max_bytes, max_entries):
+    """Check whether the active segment is full"""
+    try:
+        size = os.path.getsize(log_file)
+    except OSError:
+        return False
+    if size == 0:
+        return False
+    if max_bytes and size >= max_bytes:
+        return True
+    if max_entries and _count_lines(log_file) >= max_entries:
+        return True
+    return False
+
+
+def rotate(log_file, compress=COMPRESS_SEGMENTS, max_segments=MAX_SEGMENTS):
+    """Close the active segment and start a new one"""
+    if not os.path.exists(log_file):
+        return None
+
+    pattern = _segment_pattern(log_file)
+    segments = list_segments(log_file)
+    next_index = 1
+    if segments:
+        next_index = int(pattern.match(os.path.basename(segments[-1])).group(1)) + 1
+
+    stem, ext = os.path.splitext(log_file)
+    closed_path = f"{stem}.{next_index:06d}{ext}"
+    os.replace(log_file, closed_path)
+
+    if compress:
+        with open(closed_path, 'rb') as src, gzip.open(closed_path + ".gz", 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(closed_path)
+        closed_path += ".gz"
+
+    # Drop the oldest segments beyond the retention limit
+    if max_segments is not None:
+        segments = list_segments(log_file)
+        for old_path in segments[:max(0, len(segments) - max_segments)]:
+            os.remove(old_path)
+
+    return closed_path
+
+
+def append_entry(log_file, entry, max_bytes=SEGMENT_MAX_BYTES, max_entries=SEGMENT_MAX_ENTRIES,
+                 compress=COMPRESS_SEGMENTS, max_segments=MAX_SEGMENTS):
+    """
+    Append one entry to the log, rotating the active segment if it is full.
+    The check, the rotation and the append hold the log's lock, so concurrent writers
+    (server threads, batch workers, the CLI) never close the same segment twice.
+    """
+    line = json.dumps(entry, ensure_ascii=False) + "\n"
+    with locked_file(log_file):
+        if _needs_rotation(log_file, max_bytes, max_entries):
+            rotate(log_file, compress=compress, max_segments=max_segments)
+        with open(log_file, 'a', encoding='utf-8') as f:
+            f.write(line)
+    if metrics.enabled():
+        metrics.file_op("write", "log", nbytes=len(line.encode("utf-8")))
+
+
+def _read_segment(path):
+    """Read all entries of one segment"""
+    opener = gzip.open if path.endswith(".gz") else open
+    entries = []
+    metrics.file_op("read", "log", path=path)
+    with opener(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    # Skip a partially written line (e.g. after a crash)
+                    continue
+    return entries
+
+
+def _tail_lines(path, n):
+    """Return the last n non-empty lines of an uncompressed file by seeking from the end"""
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        buffer = b""
+        # n + 1 newlines guarantee n complete lines after the first (partial) one
+        while position > 0 and buffer.count(b"\n") <= n:
+            read_size = min(READ_BLOCK_SIZE, position)
+            position -= read_size
+            f.seek(position)
+            buffer = f.read(read_size) + buffer
+        metrics.file_op("read", "log", nbytes=len(buffer))
+        lines = buffer.split(b"\n")
+        # The first element may be a partial line unless we reached the start
+        if position > 0:
+            lines = lines[1:]
+    return [line for line in lines if line.strip()][-n:]
+
+
+def read_last(log_file, n):
+    """Read the last n entries (oldest first), continuing into closed segments if needed"""
+    entries = []
+    if os.path.exists(log_file):
+        for line in _tail_lines(log_file, n):
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                continue
+
+    for segment in reversed(list_segments(log_file)):
+        if len(entries) >= n:
+            break
+        if segment.endswith(".gz"):
+            older = _read_segment(segment)
+        else:
+            older = []
+            for line in _tail_lines(segment, n - len(entries)):
+                try:
+                    older.append(json.loads(line))
+                except ValueError:
+                    continue
+        entries = older[-(n - len(entries)):] + entries
+
+    return entries[-n:] if n else []
+
+
+def read_all(log_file):
+    """Read all entries from all segments, oldest first"""
+    entries = []
+    for segment in list_segments(log_file):
+        entries.extend(_read_segment(segment))
+    if os.path.exists(log_file):
+        entries.extend(_read_segment(log_file))
+    return entries
+
+
+def count_entries(log_file):
+    """Count entries across all segments"""
+    total = 0
+    for segment in list_segments(log_file):
+        if segment.endswith(".gz"):
+            with gzip.open(segment, 'rb') as f:
+                for block in iter(lambda: f.read(READ_BLOCK_SIZE), b""):
+                    total += block.count(b"\n")
+        else:
+            total += _count_lines(segment)
+    if os.path.exists(log_file):
+        total += _count_lines(log_file)
+    return total
+
+
+def migrate_json_log(json_file, log_file):
+    """
+    One-shot migration of a legacy JSON array log into the JSONL format.
+    Returns the number of migrated entries; the old file is kept as *.migrated.
+    """
+    with locked_file(log_file):
+        if not os.path.exists(json_file):
+            return 0
+
+        with open(json_file, 'r', encoding='utf-8') as f:
+            try:
+                old_entries = json.load(f)
+            except ValueError:
+                old_entries = []
+
+        # Migrated entries go before anything already written in the new format
+        existing = ""
+        if os.path.exists(log_file):
+            with open(log_file, 'r', encoding='utf-8') as f:
+                existing = f.read()
+
+        tmp_file = log_file + ".tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            for entry in old_entries:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            f.write(existing)
+        os.replace(tmp_file, log_file)
+        os.replace(json_file, json_file + ".migrated")
+
+    return len(old_entries)
+
+
+def migrate_users_dir(users_dir, json_name="api_log.json", jsonl_name="api_log.jsonl"):
+    """Migrate the legacy logs of all users in a directory"""
+    migrated = {}
+    if not os.path.isdir(users_dir):
+        return migrated
+    for username, user_dir in iter_user_dirs(users_dir):
+        json_file = os.path.join(user_dir, json_name)
+        if os.path.isfile(json_file):
+            migrated[username] = migrate_json_log(json_file, os.path.join(user_dir, jsonl_name))
+    return migrated
+
+
+if __name__ == "__main__":
+    # Usage: python3 jsonl_log.py [users_dir]
+    users_dir = sys.argv[1] if len(sys.argv) > 1 else "users"
+    results = migrate_users_dir(users_dir)
+    for username, count in sorted(results.items()):
+        print(f"{username}: {count} entries migrated")
+    print(f"Migrated {len(results)} log file(s)")
@@ -0,0 +1,261 @@
+"""
+Lightweight latency, token and file I/O metrics for the Recipe Assistant
+Disabled by default; when disabled every hook is a cheap no-op
+
+Enable with RECIPE_ASSISTANT_METRICS=json (rolling JSON file) or
+RECIPE_ASSISTANT_METRICS=prometheus (Prometheus text format file)
+"""
+
+import os
+import json
+import time
+import threading
+from datetime import datetime
+
+METRICS_ENV_VAR = "RECIPE_ASSISTANT_METRICS"
+# Prometheus text file (e.g. for the node_exporter textfile collector)
+PROMETHEUS_FILE = "recipe_assistant_metrics.prom"
+# Number of recent API calls kept in the rolling JSON file
+MAX_RECENT_CALLS = 100
+# Histogram buckets in seconds
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_mode = os.environ.get(METRICS_ENV_VAR, "").strip().lower()
+_enabled = _mode not in ("", "0", "off", "false", "no")
+_lock = threading.Lock()
+# (name, sorted label items) -> value (counters) or [count, sum, min, max, bucket counts] (histograms)
+_counters = {}
+_histograms = {}
+_recent_calls = []
+
+
+def enabled():
+    """Check whether metrics are being recorded"""
+    return _enabled
+
+
+def enable(mode="json"):
+    """Turn metrics on at runtime (e.g. in benchmarks; the apps use RECIPE_ASSISTANT_METRICS)"""
+    global _enabled, _mode
+    _enabled = True
+    _mode = mode
+
+
+def reset():
+    """Drop all recorded metrics"""
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+        del _recent_calls[:]
+
+
+def increment(name, value=1, **labels):
+    """Add to a counter"""
+    if not _enabled:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name, value, **labels):
+    """Record a value (e.g. a duration in seconds) in a histogram"""
+    if not _enabled:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = [0, 0.0, value, value, [0] * len(LATENCY_BUCKETS)]
+        hist[0] += 1
+        hist[1] += value
+        hist[2] = min(hist[2], value)
+        hist[3] = max(hist[3], value)
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if value <= bound:
+                hist[4][i] += 1
+                break
+
+
+class _NoopTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+class _PhaseTimer:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        observe("recipe_phase_seconds", time.perf_counter() - self.start, phase=self.name)
+        return False
+
+
+_NOOP_TIMER = _NoopTimer()
+
+
+def phase(name):
+    """Context manager timing one phase of a flow (no-op when disabled)"""
+    if not _enabled:
+        return _NOOP_TIMER
+    return _PhaseTimer(name)
+
+
+def file_op(op, kind, nbytes=None, path=None):
+    """Record a file read/write; the size is taken from path if nbytes is not given"""
+    if not _enabled:
+        return
+    if nbytes is None and path is not None:
+        try:
+            nbytes = os.path.getsize(path)
+        except OSError:
+            nbytes = 0
+    increment("recipe_file_ops_total", op=op, file=kind)
+    increment("recipe_file_bytes_total", nbytes or 0, op=op, file=kind)
+
+
+def api_call(model, latency, message=None, error=None):
+    """Record a model call: latency, tokens and stop reason"""
+    if not _enabled:
+        return
+    stop_reason = getattr(message, "stop_reason", None) or ("error" if error else "unknown")
+    observe("recipe_api_latency_seconds", latency, model=model)
+    increment("recipe_api_calls_total", model=model, stop_reason=stop_reason)
+
+    call = {
+        "timestamp": datetime.now().isoformat(),
+        "model": model,
+        "latency_s": round(latency, 4),
+        "stop_reason": stop_reason
+    }
+    usage = getattr(message, "usage", None)
+    if usage is not None:
+        for field in ("input_tokens", "output_tokens", "cache_read_input_tokens", "cache_creation_input_tokens"):
+            value = getattr(usage, field, None)
+            if value:
+                increment("recipe_api_tokens_total", value, model=model, type=field.replace("_tokens", ""))
+                call[field] = value
+    if error is not None:
+        call["error"] = type(error).__name__
+
+    with _lock:
+        _recent_calls.append(call)
+        del _recent_calls[:-MAX_RECENT_CALLS]
+
+
+def snapshot():
+    """Return all metrics as a JSON-serializable dict"""
+    with _lock:
+        counters = [{"name": name, "labels": dict(labels), "value": value}
+                    for (name, labels), value in sorted(_counters.items())]
+        histograms = [{"name": name, "labels": dict(labels), "count": h[0], "sum": round(h[1], 6),
+                       "min": round(h[2], 6), "max": round(h[3], 6), "buckets": list(h[4])}
+                      for (name, labels), h in sorted(_histograms.items())]
+        return {"counters": counters, "histograms": histograms, "recent_calls": list(_recent_calls)}
+
+
+def _escape_label(value):
+    """Escape a label value for the text format (backslash, double quote, newline)"""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels, extra=None):
+    items = list(labels.items()) + (list(extra.items()) if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape_label(value)}"' for key, value in items) + "}"
+
+
+def render_prometheus(data=None):
+    """Render metrics in the Prometheus text exposition format"""
+    data = data or snapshot()
+    lines = []
+    typed = set()
+    for counter in data["counters"]:
+        if counter["name"] not in typed:
+            lines.append(f"# TYPE {counter['name']} counter")
+            typed.add(counter["name"])
+        lines.append(f"{counter['name']}{_format_labels(counter['labels'])} {counter['value']}")
+    for hist in data["histograms"]:
+        name = hist["name"]
+        if name not in typed:
+            lines.append(f"# TYPE {name} histogram")
+            typed.add(name)
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS, hist["buckets"]):
+            cumulative += count
+            lines.append(f"{name}_bucket{_format_labels(hist['labels'], {'le': bound})} {cumulative}")
+        lines.append(f"{name}_bucket{_format_labels(hist['labels'], {'le': '+Inf'})} {hist['count']}")
+        lines.append(f"{name}_sum{_format_labels(hist['labels'])} {hist['sum']}")
+        lines.append(f"{name}_count{_format_labels(hist['labels'])} {hist['count']}")
+    return "\n".join(lines) + "\n"
+
+
+def _merge(old, new):
+    """Add the metrics of this process to those already in the rolling file"""
+    counters = {(c["name"], json.dumps(c["labels"], sort_keys=True)): c for c in old.get("counters", [])}
+    for c in new["counters"]:
+        key = (c["name"], json.dumps(c["labels"], sort_keys=True))
+        if key in counters:
+            counters[key]["value"] += c["value"]
+        else:
+            counters[key] = c
+    histograms = {(h["name"], json.dumps(h["labels"], sort_keys=True)): h for h in old.get("histograms", [])}
+    for h in new["histograms"]:
+        key = (h["name"], json.dumps(h["labels"], sort_keys=True))
+        if key in histograms:
+            merged = histograms[key]
+            merged["count"] += h["count"]
+            merged["sum"] = round(merged["sum"] + h["sum"], 6)
+            merged["min"] = min(merged["min"], h["min"])
+            merged["max"] = max(merged["max"], h["max"])
+            merged["buckets"] = [a + b for a, b in zip(merged["buckets"], h["buckets"])]
+        else:
+            histograms[key] = h
+    return {
+        "counters": list(counters.values()),
+        "histograms": list(histograms.values()),
+        "recent_calls": (old.get("recent_calls", []) + new["recent_calls"])[-MAX_RECENT_CALLS:]
+    }
+
+
+def export(json_file, prometheus_file=PROMETHEUS_FILE):
+    """
+    Merge the metrics of this process into the rolling JSON file and, in prometheus
+    mode, also render the merged totals as a Prometheus text file (no-op when disabled).
+    The read-merge-write holds the file's lock, so processes exporting at once (batch
+    workers, CLI sessions) don't overwrite each other's totals.
+    """
+    if not _enabled:
+        return None
+    # Imported here: storage records its file operations through this module
+    from storage import locked_file, write_atomic
+
+    with locked_file(json_file):
+        old = {}
+        if os.path.exists(json_file):
+            try:
+                with open(json_file, 'r', encoding='utf-8') as f:
+                    old = json.load(f)
+            except ValueError:
+                old = {}
+        merged = _merge(old, snapshot())
+        merged["updated_at"] = datetime.now().isoformat()
+
+        write_atomic(json_file, json.dumps(merged, indent=2, ensure_ascii=False))
+        if _mode == "prometheus":
+            write_atomic(prometheus_file, render_prometheus(merged))
+        reset()
+    return merged
+
@@ -0,0 +1,123 @@
+"""
+Model routing for recipe suggestions: picks a model tier and an output-token budget per request
+
+Simple requests (few ingredients, little preference context) go to the fast, cheaper tier;
+long or personalised ones to the standard tier. When the standard tier has recently been
+slow, moderate requests are moved to the fast tier as well. The fast tier's output budget
+grows with the number of ingredients (more to cover) and with the language (German needs
+more tokens for the same recipe); the standard tier always gets its full budget.
+
+If the fast tier's answer contains no "## " recipe headings or was cut off at its budget,
+the engine escalates to the standard tier with the full budget. Every decision is recorded
+in the API log entry ("route").
+"""
+
+import os
+
+import resilience
+from context_builder import estimate_tokens
+from ingredient_normalizer import canonical_names
+
+# Model tiers: model, output budget = base + per ingredient, capped at max_tokens
+# (tiers without a base always get max_tokens)
+TIERS = {
+    "fast": {"model": "claude-3-5-haiku-20241022", "base_tokens": 500, "tokens_per_ingredient": 30,
+             "max_tokens": 800},
+    "standard": {"model": "claude-sonnet-4-20250514", "max_tokens": 1000}
+}
+# Tier answers escalate to (None: no escalation)
+ESCALATION = {"fast": "standard", "standard": None}
+# Output tokens per language relative to English
+LANG_TOKEN_FACTOR = {"en": 1.0, "de": 1.15}
+# Requests up to these sizes count as simple and go to the fast tier
+FAST_MAX_INGREDIENTS = 5
+FAST_MAX_CONTEXT_TOKENS = 40
+# While the standard tier's p95 latency (seconds) is above the target, requests up to
+# LATENCY_MAX_INGREDIENTS ingredients go to the fast tier too
+LATENCY_TARGET = 12.0
+LATENCY_MAX_INGREDIENTS = 8
+# RECIPE_ASSISTANT_ROUTING=auto (default) | fast | standard | off (standard model, full budget)
+ROUTING_ENV_VAR = "RECIPE_ASSISTANT_ROUTING"
+ROUTING_MODES = ("auto", "fast", "standard", "off")
+
+
+def routing_mode():
+    """Routing mode from the environment (unknown values mean auto)"""
+    mode = os.environ.get(ROUTING_ENV_VAR, "auto").strip().lower()
+    return mode if mode in ROUTING_MODES else "auto"
+
+
+def request_features(ingredients, preference_context, lang):
+    """The request features the routing is based on"""
+    return {
+        "ingredients": len(canonical_names(ingredients)),
+        "context_tokens": estimate_tokens(preference_context) if preference_context else 0,
+        "lang": lang
+    }
+
+
+def output_budget(tier, features):
+    """max_tokens for a tier and request"""
+    config = TIERS[tier]
+    if "base_tokens" not in config:
+        return config["max_tokens"]
+    budget = config["base_tokens"] + config["tokens_per_ingredient"] * features["ingredients"]
+    budget *= LANG_TOKEN_FACTOR.get(features["lang"], 1.0)
+    return min(config["max_tokens"], int(round(budget, -1)))
+
+
+class ModelRouter:
+    """Routing decisions plus the recent end-to-end latency of each tier"""
+
+    def __init__(self, mode=None):
+        self.mode = mode
+        # Only the percentiles are used, so the trackers' timeouts do not matter
+        self.latency = {tier: resilience.LatencyTracker(resilience.MAX_TIMEOUT) for tier in TIERS}
+
+    def record(self, tier, seconds):
+        self.latency[tier].record(seconds)
+
+    def seed(self, log_entries):
+        """Start from the latencies of earlier routed calls in the log"""
+        for entry in log_entries:
+            tier = (entry.get("route") or {}).get("tier")
+            if tier in self.latency and entry.get("latency_ms") is not None:
+                self.latency[tier].record(entry["latency_ms"] / 1000)
+
+    def route(self, ingredients, preference_context, lang):
+        """Pick the tier for a request, returns the route dict that goes into the log"""
+        features = request_features(ingredients, preference_context, lang)
+        mode = self.mode or routing_mode()
+        if mode == "off":
+            return self._route("standard", "off", features, max_tokens=TIERS["standard"]["max_tokens"])
+        if mode in TIERS:
+            return self._route(mode, "forced", features)
+
+        if (features["ingredients"] <= FAST_MAX_INGREDIENTS
+                and features["context_tokens"] <= FAST_MAX_CONTEXT_TOKENS):
+            return self._route("fast", "simple", features)
+        standard_p95 = self.latency["standard"].p95()
+        if (standard_p95 is not None and standard_p95 > LATENCY_TARGET
+                and features["ingredients"] <= LATENCY_MAX_INGREDIENTS):
+            features["standard_p95_ms"] = round(standard_p95 * 1000)
+            return self._route("fast", "latency", features)
+        return self._route("standard", "complex", features)
+
+    def escalate(self, route, recipe_names, stop_reason):
+        """The route for a retry on the next larger tier with its full budget, or None
+
+        An answer is escalated when it has no recipe headings or was cut off at max_tokens.
+        """
+        tier = ESCALATION[route["tier"]]
+        if tier is None or (recipe_names and stop_reason != "max_tokens"):
+            return None
+        return self._route(tier, "escalated", route["features"], max_tokens=TIERS[tier]["max_tokens"])
+
+    def _route(self, tier, reason, features, max_tokens=None):
+        return {
+            "tier": tier,
+            "model": TIERS[tier]["model"],
+            "max_tokens": max_tokens or output_budget(tier, features),
+            "reason": reason,
+            "features": features
+        }
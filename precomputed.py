@@ -0,0 +1,101 @@
+"""
+Precomputed recipe suggestions for the Recipe Assistant
+Answers generated off-peak (see pregenerate.py) are kept per user in precomputed.json
+and served once when a later request's pantry matches closely enough
+"""
+
+import os
+import json
+from datetime import datetime, timedelta
+
+from storage import locked_file, write_atomic
+from ingredient_normalizer import similarity
+
+# File name inside each user directory
+PRECOMPUTED_FILE = "precomputed.json"
+# Serve a precomputed answer if the ingredient overlap reaches this value (0-1)
+MATCH_THRESHOLD = 0.6
+# Precomputed answers older than this are dropped
+MAX_AGE = timedelta(hours=24)
+
+
+def precomputed_path(preferences_file):
+    """Path of the precomputed answers next to a user's preferences file"""
+    return os.path.join(os.path.dirname(preferences_file), PRECOMPUTED_FILE)
+
+
+class PrecomputedAnswers:
+    """
+    One user's precomputed answers plus hit/miss counters.
+    Changes hold the file's lock: pregenerate.py stores answers from another process.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def _load(self):
+        data = {"answers": [], "stats": {"generated": 0, "hits": 0, "misses": 0}}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    data.update(json.load(f))
+            except ValueError:
+                pass
+        return data
+
+    def _save(self, data):
+        write_atomic(self.path, json.dumps(data, indent=2, ensure_ascii=False))
+
+    @staticmethod
+    def _fresh(answers, now):
+        return [a for a in answers
+                if now - datetime.fromisoformat(a["created_at"]) <= MAX_AGE]
+
+    def add(self, answers):
+        """Store newly generated answers (dicts with ingredients, lang, prompt, response, recipes, ...)"""
+        with locked_file(self.path):
+            data = self._load()
+            data["answers"] = self._fresh(data["answers"], datetime.now()) + list(answers)
+            data["stats"]["generated"] += len(answers)
+            self._save(data)
+
+    def pantries(self, lang):
+        """Ingredient lists that already have a fresh precomputed answer"""
+        return {a["ingredients"] for a in self._fresh(self._load()["answers"], datetime.now())
+                if a["lang"] == lang}
+
+    def take(self, ingredients, lang, disliked_dishes=(), threshold=MATCH_THRESHOLD):
+        """
+        Remove and return the best matching fresh answer, or None.
+        Answers containing a dish the user disliked since they were generated are skipped.
+        """
+        with locked_file(self.path):
+            data = self._load()
+            answers = self._fresh(data["answers"], datetime.now())
+            if not answers:
+                return None
+
+            disliked = {d.lower() for d in disliked_dishes}
+            best, best_score = None, threshold
+            for answer in answers:
+                if answer["lang"] != lang or any(name.lower() in disliked for name in answer["recipes"]):
+                    continue
+                score = similarity(ingredients, answer["ingredients"])
+                if score >= best_score:
+                    best, best_score = answer, score
+
+            if best is not None:
+                answers.remove(best)
+                best["score"] = best_score
+            data["answers"] = answers
+            data["stats"]["hits" if best is not None else "misses"] += 1
+            self._save(data)
+        return best
+
+    def stats(self):
+        """Counters: generated, hits, misses (plus the number of answers still waiting)"""
+        data = self._load()
+        return dict(data["stats"], waiting=len(self._fresh(data["answers"], datetime.now())))
@@ -0,0 +1,215 @@
+"""
+Speculative prefetch for the Recipe Assistant CLI
+While the user is still at the menu, a suggestion for their usual pantry is requested in
+the background. If the ingredients they type canonicalize to the same set, option 1 continues
+with that request (in flight or complete); otherwise it is cancelled and its tokens are counted
+as wasted. Outcomes are counted per user in prefetch.json
+
+Usage (statistics of all users):
+  python3 prefetch.py [users_dir]
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import threading
+from collections import Counter
+
+import metrics
+from storage import locked_file, write_atomic
+from context_builder import estimate_tokens
+from ingredient_normalizer import canonical_key
+
+# File name inside each user directory
+PREFETCH_FILE = "prefetch.json"
+# RECIPE_ASSISTANT_PREFETCH=off (default) | frequent (also: on) | recent
+PREFETCH_ENV_VAR = "RECIPE_ASSISTANT_PREFETCH"
+PREFETCH_MODES = ("off", "frequent", "recent")
+# Requests (groups of suggestions saved together) considered for the usual pantry
+PANTRY_WINDOW = 20
+STAT_FIELDS = ("speculations", "hits", "hits_in_flight", "misses", "abandoned",
+               "wasted_input_tokens", "wasted_output_tokens", "head_start_seconds")
+
+
+def prefetch_mode():
+    """Prefetch mode from the environment (off unless enabled)"""
+    mode = os.environ.get(PREFETCH_ENV_VAR, "off").strip().lower()
+    if mode in ("1", "on", "true", "yes"):
+        return "frequent"
+    return mode if mode in PREFETCH_MODES else "off"
+
+
+def speculated_pantry(suggested_recipes, mode="frequent"):
+    """
+    The pantry to prefetch for: the most frequent one of the last requests
+    (ties: the most recent), or simply the most recent one. None without history.
+    """
+    requests = []
+    for recipe in reversed(suggested_recipes):
+        request = (recipe["suggested_at"], recipe["ingredients"])
+        if not requests or requests[-1] != request:
+            requests.append(request)
+            if len(requests) == PANTRY_WINDOW:
+                break
+    # Most recent first; keys without known ingredients cannot be matched
+    pantries = [(canonical_key(ingredients), ingredients) for _, ingredients in requests]
+    pantries = [(key, ingredients) for key, ingredients in pantries if key]
+    if not pantries:
+        return None
+    if mode == "recent":
+        return pantries[0][1]
+    counts = Counter(key for key, _ in pantries)
+    best = max(counts.values())
+    return next(ingredients for key, ingredients in pantries if counts[key] == best)
+
+
+def prefetch_path(preferences_file):
+    """Path of the prefetch statistics next to a user's preferences file"""
+    return os.path.join(os.path.dirname(preferences_file), PREFETCH_FILE)
+
+
+class Speculation:
+    """
+    A suggestion request started before the user entered the ingredients.
+    Streamed chunks are buffered until result() is awaited; the request runs on the engine's loop.
+    """
+
+    def __init__(self, ingredients, prompt, preference_context, route):
+        self.ingredients = ingredients
+        self.key = canonical_key(ingredients)
+        self.prompt = prompt
+        self.preference_context = preference_context
+        self.route = route
+        self.started_at = time.perf_counter()
+        self.first_token_at = None
+        self.finished_at = None
+        self.used_at = None
+        self.message = None
+        self.future = None
+        self.used = False
+        self.settled = False
+        self._chunks = []
+        self._target = None
+        self._lock = threading.Lock()
+
+    def matches(self, ingredients):
+        """Whether typed ingredients canonicalize to the speculated pantry"""
+        return canonical_key(ingredients) == self.key
+
+    def feed(self, text):
+        """on_text of the speculative request (called from API threads)"""
+        with self._lock:
+            if not self._chunks:
+                self.first_token_at = time.perf_counter()
+            self._chunks.append(text)
+            if self._target is not None:
+                self._target(text)
+
+    def finish(self, message):
+        self.message = message
+        self.finished_at = time.perf_counter()
+
+    def text(self):
+        with self._lock:
+            return "".join(self._chunks)
+
+    async def result(self, on_text=None):
+        """Continue with the request: replay the chunks so far to on_text and wait for the message"""
+        self.used = True
+        self.used_at = time.perf_counter()
+        if on_text is not None:
+            with self._lock:
+                for chunk in self._chunks:
+                    on_text(chunk)
+                self._target = on_text
+        return await asyncio.wrap_future(self.future)
+
+    def cancel(self):
+        """Stop the request if it is still running, returns True if it had already completed"""
+        if self.future is not None:
+            self.future.cancel()
+        return self.message is not None
+
+    def wasted_tokens(self):
+        """(input, output) tokens of an unused request: its usage, or an estimate if cancelled"""
+        usage = getattr(self.message, "usage", None)
+        if usage is not None:
+            return ((getattr(usage, "input_tokens", 0) or 0) + (getattr(usage, "cache_read_input_tokens", 0) or 0)
+                    + (getattr(usage, "cache_creation_input_tokens", 0) or 0), usage.output_tokens or 0)
+        return estimate_tokens(self.prompt), estimate_tokens(self.text())
+
+    def in_flight_when_used(self):
+        return self.finished_at is None or self.finished_at > self.used_at
+
+    def head_start(self):
+        """Seconds the request ran before the user asked for it"""
+        now = self.used_at or time.perf_counter()
+        return min(now, self.finished_at or now) - self.started_at
+
+
+class PrefetchStats:
+    """One user's prefetch counters"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        stats = dict.fromkeys(STAT_FIELDS, 0)
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    stats.update(json.load(f))
+            except ValueError:
+                pass
+        return stats
+
+    def record(self, **amounts):
+        """Add to the counters (under the file's lock, so concurrent sessions don't lose counts)"""
+        with locked_file(self.path):
+            stats = self.load()
+            for name, value in amounts.items():
+                stats[name] += value
+                metrics.increment(f"recipe_prefetch_{name}_total", value)
+            stats["head_start_seconds"] = round(stats["head_start_seconds"], 3)
+            write_atomic(self.path, json.dumps(stats, indent=2))
+        return stats
+
+
+def summarize(stats):
+    """Hit rate (of sessions that asked for a suggestion) and usage rate (of all speculations)"""
+    decided = stats["hits"] + stats["misses"]
+    return dict(stats,
+                hit_rate=stats["hits"] / decided if decided else 0.0,
+                usage_rate=stats["hits"] / stats["speculations"] if stats["speculations"] else 0.0,
+                wasted_tokens=stats["wasted_input_tokens"] + stats["wasted_output_tokens"],
+                avg_head_start=stats["head_start_seconds"] / stats["hits"] if stats["hits"] else 0.0)
+
+
+def collect_stats(users_dir):
+    """Sum of the prefetch counters of all users"""
+    total = dict.fromkeys(STAT_FIELDS, 0)
+    for root, _, files in os.walk(users_dir):
+        if PREFETCH_FILE in files:
+            for name, value in PrefetchStats(os.path.join(root, PREFETCH_FILE)).load().items():
+                if name in total:
+                    total[name] += value
+    return summarize(total)
+
+
+def main():
+    users_dir = sys.argv[1] if len(sys.argv) > 1 else "users"
+    stats = collect_stats(users_dir)
+    print(f"Speculations: {stats['speculations']} (hits {stats['hits']}, of which in flight "
+          f"{stats['hits_in_flight']}; misses {stats['misses']}; abandoned {stats['abandoned']})")
+    print(f"Hit rate: {stats['hit_rate']:.1%} of suggestion requests, "
+          f"{stats['usage_rate']:.1%} of speculations used")
+    print(f"Average head start: {stats['avg_head_start']:.2f}s")
+    print(f"Wasted tokens: {stats['wasted_tokens']} "
+          f"({stats['wasted_input_tokens']} input, {stats['wasted_output_tokens']} output)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Off-peak pre-generation of recipe suggestions via the Message Batches API
+
+For each user, the most recent pantries (suggested_recipes[].ingredients) are sent together
+with the user's current preferences as one batch. Once the batch has ended, the answers are
+stored per user (precomputed.py) and option 1 serves them when the pantry matches closely enough.
+
+Usage (e.g. from cron at night):
+  python3 pregenerate.py run [users_dir] [--at 03:00] [--poll-interval 60]
+  python3 pregenerate.py stats [users_dir]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+from datetime import datetime, timedelta
+
+import recipe_assistant as ra
+import resilience
+from precomputed import PrecomputedAnswers
+from suggestion_cache import normalize_ingredients
+from user_registry import iter_user_dirs, user_dir
+
+# Most recent distinct pantries pre-generated per user
+PANTRIES_PER_USER = 3
+# Seconds between batch status checks
+POLL_INTERVAL = 60
+# Submitted but not yet stored batch (lets an interrupted run resume polling)
+PENDING_FILE = "pregenerate_pending.json"
+
+
+def recent_pantries(preferences, limit=PANTRIES_PER_USER):
+    """Distinct ingredient lists of the most recent suggestions, newest first"""
+    pantries = []
+    seen = set()
+    for recipe in reversed(preferences.get("suggested_recipes", [])):
+        ingredients = recipe.get("ingredients", "").strip()
+        key = normalize_ingredients(ingredients)
+        if ingredients and key not in seen:
+            seen.add(key)
+            pantries.append(ingredients)
+            if len(pantries) >= limit:
+                break
+    return pantries
+
+
+def build_batch_requests(users_dir, per_user=PANTRIES_PER_USER):
+    """Batch requests for all users plus a custom_id -> job mapping"""
+    requests, jobs = [], {}
+    for username, directory in iter_user_dirs(users_dir):
+        preferences_file = os.path.join(directory, "preferences.json")
+        preferences = ra.load_preferences(preferences_file)
+        lang = preferences.get("language", "en")
+        store = PrecomputedAnswers(ra.precomputed_path(preferences_file))
+        waiting = {normalize_ingredients(i) for i in store.pantries(lang)}
+
+        for ingredients in recent_pantries(preferences, per_user):
+            if normalize_ingredients(ingredients) in waiting:
+                continue
+            prompt, _ = ra.build_suggestion_prompt(ingredients, preferences, lang)
+            custom_id = f"req-{len(requests)}"
+            requests.append({"custom_id": custom_id, "params": ra.build_suggestion_request(prompt, lang)})
+            jobs[custom_id] = {"user": username, "ingredients": ingredients, "lang": lang, "prompt": prompt}
+    return requests, jobs
+
+
+def wait_for_batch(client, batch_id, poll_interval=POLL_INTERVAL):
+    """Poll until the batch has ended, returns the final batch object"""
+    while True:
+        try:
+            batch = client.messages.batches.retrieve(batch_id)
+        except Exception as error:
+            # The client does not retry (see ra.get_client): keep polling through upstream hiccups
+            if not resilience.is_upstream_failure(error):
+                raise
+            print(f"[Batch] {batch_id}: status check failed ({type(error).__name__}), retrying")
+            time.sleep(poll_interval)
+            continue
+        if batch.processing_status == "ended":
+            return batch
+        counts = batch.request_counts
+        print(f"[Batch] {batch_id}: {counts.processing} processing, {counts.succeeded} succeeded")
+        time.sleep(poll_interval)
+
+
+def store_results(client, batch_id, jobs, users_dir):
+    """Store the succeeded answers per user, returns (stored, failed)"""
+    by_user = {}
+    failed = 0
+    for item in client.messages.batches.results(batch_id):
+        job = jobs.get(item.custom_id)
+        if job is None or item.result.type != "succeeded":
+            failed += 1
+            continue
+        message = item.result.message
+        response_text = message.content[0].text
+        # Same heading parser as save_suggested_recipes
+        parser = ra.RecipeHeadingParser()
+        parser.feed(response_text)
+        recipe_names = parser.close()
+        if not recipe_names:
+            failed += 1
+            continue
+        by_user.setdefault(job["user"], []).append({
+            "ingredients": job["ingredients"],
+            "lang": job["lang"],
+            "prompt": job["prompt"],
+            "response": response_text,
+            "recipes": recipe_names,
+            "usage": ra.usage_to_dict(getattr(message, "usage", None)),
+            "stop_reason": getattr(message, "stop_reason", None),
+            "batch_id": batch_id,
+            "created_at": datetime.now().isoformat()
+        })
+
+    for username, answers in by_user.items():
+        PrecomputedAnswers(ra.precomputed_path(os.path.join(user_dir(users_dir, username),
+                                                            "preferences.json"))).add(answers)
+    return sum(len(answers) for answers in by_user.values()), failed
+
+
+def run(client, users_dir, poll_interval=POLL_INTERVAL):
+    """Submit (or resume) a batch, wait for it and store the answers"""
+    # Profiles are read through the storage of this users directory (JSON or SQLite)
+    if os.path.abspath(users_dir) != os.path.abspath(ra.USERS_DIR):
+        ra.use_users_dir(users_dir)
+    pending_file = os.path.join(users_dir, PENDING_FILE)
+    if os.path.exists(pending_file):
+        with open(pending_file, 'r', encoding='utf-8') as f:
+            pending = json.load(f)
+        print(f"[Batch] Resuming {pending['batch_id']}")
+    else:
+        requests, jobs = build_batch_requests(users_dir)
+        if not requests:
+            print("Nothing to pre-generate")
+            return 0, 0
+        batch = client.messages.batches.create(requests=requests)
+        pending = {"batch_id": batch.id, "jobs": jobs, "submitted_at": datetime.now().isoformat()}
+        with open(pending_file, 'w', encoding='utf-8') as f:
+            json.dump(pending, f, indent=2, ensure_ascii=False)
+        print(f"[Batch] Submitted {batch.id} with {len(requests)} requests")
+
+    wait_for_batch(client, pending["batch_id"], poll_interval)
+    stored, failed = store_results(client, pending["batch_id"], pending["jobs"], users_dir)
+    os.remove(pending_file)
+    return stored, failed
+
+
+def collect_stats(users_dir):
+    """Precompute counters per user"""
+    stats = {}
+    for username, directory in iter_user_dirs(users_dir):
+        store = PrecomputedAnswers(ra.precomputed_path(os.path.join(directory, "preferences.json")))
+        if store.exists():
+            stats[username] = store.stats()
+    return stats
+
+
+def hit_rate(stats):
+    """Share of lookups (with answers waiting) that were served from a precomputed answer"""
+    lookups = stats["hits"] + stats["misses"]
+    return stats["hits"] / lookups if lookups else 0.0
+
+
+def seconds_until(clock):
+    """Seconds until the next HH:MM"""
+    now = datetime.now()
+    hour, minute = (int(part) for part in clock.split(":"))
+    target = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if target <= now:
+        target += timedelta(days=1)
+    return (target - now).total_seconds()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-generate recipe suggestions off-peak")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run", help="submit a batch, wait for it and store the answers")
+    run_parser.add_argument("users_dir", nargs="?", default=ra.USERS_DIR)
+    run_parser.add_argument("--at", help="wait until this time of day (HH:MM) before submitting")
+    run_parser.add_argument("--poll-interval", type=float, default=POLL_INTERVAL, help="seconds between checks")
+    stats_parser = commands.add_parser("stats", help="show the precompute hit rate")
+    stats_parser.add_argument("users_dir", nargs="?", default=ra.USERS_DIR)
+    args = parser.parse_args()
+
+    if args.command == "stats":
+        stats = collect_stats(args.users_dir)
+        total = {"generated": 0, "hits": 0, "misses": 0, "waiting": 0}
+        for username, user_stats in stats.items():
+            for key in total:
+                total[key] += user_stats[key]
+            print(f"{username}: {user_stats['generated']} generated, {user_stats['hits']} hits, "
+                  f"{user_stats['misses']} misses ({hit_rate(user_stats):.0%})")
+        print(f"Total: {total['generated']} generated, {total['waiting']} waiting, "
+              f"hit rate {hit_rate(total):.0%}")
+        return 0
+
+    if not os.environ.get("ANTHROPIC_API_KEY"):
+        print("❌ Error: ANTHROPIC_API_KEY not found!")
+        return 1
+    if args.at:
+        time.sleep(seconds_until(args.at))
+
+    stored, failed = run(ra.get_client(), args.users_dir, args.poll_interval)
+    print(f"Stored {stored} precomputed suggestion(s), {failed} failed")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,188 @@
+"""
+Compact profile model for the Recipe Assistant
+Per-dish rating aggregates (count, mean, last rating, time-decayed score) are updated
+incrementally with every rating, so old raw ratings can be rolled up into them and a
+profile stays about the same size no matter how long its history is
+"""
+
+import sys
+from datetime import datetime
+
+# Raw ratings kept in the profile after compaction (older ones live on in dish_stats)
+KEEP_RAW_RATINGS = 50
+# Compact once this many raw ratings have accumulated (amortizes the rewrite)
+COMPACT_AFTER = 2 * KEEP_RAW_RATINGS
+# Half-life of the time-decayed dish score in days
+SCORE_HALF_LIFE_DAYS = 90
+# Rating that counts as neutral for the score (1-2 lower it, 4-5 raise it)
+NEUTRAL_RATING = 3
+
+
+def _parse_date(value):
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class DishStats:
+    """Rating aggregate of one dish"""
+
+    __slots__ = ("count", "total", "last_rating", "last_date", "score")
+
+    def __init__(self, count=0, total=0, last_rating=None, last_date=None, score=0.0):
+        self.count = count
+        self.total = total
+        self.last_rating = last_rating
+        self.last_date = last_date
+        # Decayed score as of last_date
+        self.score = score
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def score_at(self, when=None):
+        """Time-decayed score: recent ratings weigh more, old ones fade out"""
+        last = _parse_date(self.last_date)
+        when = when or datetime.now()
+        if last is None or when <= last:
+            return self.score
+        return self.score * 0.5 ** ((when - last).total_seconds() / 86400 / SCORE_HALF_LIFE_DAYS)
+
+    def add(self, rating, date):
+        """Add one rating"""
+        self.score = self.score_at(_parse_date(date)) + (rating - NEUTRAL_RATING)
+        self.count += 1
+        self.total += rating
+        self.last_rating = rating
+        self.last_date = date
+
+    def to_dict(self):
+        return {"count": self.count, "total": self.total, "last_rating": self.last_rating,
+                "last_date": self.last_date, "score": round(self.score, 4)}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["count"], data["total"], data.get("last_rating"), data.get("last_date"),
+                   data.get("score", 0.0))
+
+
+def bump_version(prefs):
+    """Mark an in-memory profile as changed (invalidates derived caches, e.g. the prompt context)"""
+    prefs["version"] = prefs.get("version", 0) + 1
+
+
+def to_json(obj):
+    """json.dump default hook for DishStats values"""
+    if isinstance(obj, DishStats):
+        return obj.to_dict()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def from_stored(prefs):
+    """Turn a freshly loaded profile into the compact in-memory form (interned names, DishStats)"""
+    for key in ("liked_dishes", "disliked_dishes"):
+        prefs[key] = [sys.intern(dish) for dish in prefs.get(key, [])]
+    for entry in prefs.get("ratings", []):
+        entry["dish"] = sys.intern(entry["dish"])
+    if "dish_stats" in prefs:
+        prefs["dish_stats"] = {sys.intern(dish): DishStats.from_dict(stats) if isinstance(stats, dict) else stats
+                               for dish, stats in prefs["dish_stats"].items()}
+    return prefs
+
+
+def ensure_dish_stats(prefs):
+    """Build the aggregates from the raw ratings of a profile that has none yet (older profiles)"""
+    if "dish_stats" in prefs:
+        return prefs["dish_stats"]
+    dish_stats = prefs["dish_stats"] = {}
+    for entry in prefs.get("ratings", []):
+        dish = sys.intern(entry["dish"])
+        stats = dish_stats.get(dish)
+        if stats is None:
+            stats = dish_stats[dish] = DishStats()
+        stats.add(entry["rating"], entry.get("date"))
+    return dish_stats
+
+
+def _move_to_end(dishes, dish):
+    if dish in dishes:
+        dishes.remove(dish)
+    dishes.append(dish)
+
+
+def record_rating(prefs, rating_entry, verdict):
+    """Add a rating to the profile and update the dish aggregate and liked/disliked lists"""
+    dish_stats = ensure_dish_stats(prefs)
+    dish = rating_entry["dish"] = sys.intern(rating_entry["dish"])
+    prefs["ratings"].append(rating_entry)
+    bump_version(prefs)
+
+    stats = dish_stats.get(dish)
+    if stats is None:
+        stats = dish_stats[dish] = DishStats()
+    stats.add(rating_entry["rating"], rating_entry.get("date"))
+
+    # Each dish is listed once; the newest verdict wins
+    if verdict == "liked":
+        _move_to_end(prefs["liked_dishes"], dish)
+        if dish in prefs["disliked_dishes"]:
+            prefs["disliked_dishes"].remove(dish)
+    elif verdict == "disliked":
+        _move_to_end(prefs["disliked_dishes"], dish)
+        if dish in prefs["liked_dishes"]:
+            prefs["liked_dishes"].remove(dish)
+    return stats
+
+
+def _dedupe(dishes):
+    """Keep the last occurrence of each dish, in order"""
+    seen = set()
+    result = []
+    for dish in reversed(dishes):
+        if dish not in seen:
+            seen.add(dish)
+            result.append(dish)
+    result.reverse()
+    return result
+
+
+def compact(prefs, keep=KEEP_RAW_RATINGS):
+    """
+    Roll old raw ratings into the dish aggregates (keeping the last `keep`) and
+    remove duplicates from the liked/disliked lists; returns the number of dropped ratings
+    """
+    dish_stats = ensure_dish_stats(prefs)
+    dropped = max(0, len(prefs["ratings"]) - keep)
+    if dropped:
+        prefs["ratings"] = prefs["ratings"][-keep:]
+
+    liked = _dedupe(prefs["liked_dishes"])
+    disliked = _dedupe(prefs["disliked_dishes"])
+    # A dish in both lists stays only in the one matching its last rating
+    for dish in set(liked) & set(disliked):
+        last_rating = dish_stats[dish].last_rating if dish in dish_stats else None
+        if last_rating is not None and last_rating >= 4:
+            disliked.remove(dish)
+        elif last_rating is not None and last_rating <= 2:
+            liked.remove(dish)
+    prefs["liked_dishes"] = liked
+    prefs["disliked_dishes"] = disliked
+    bump_version(prefs)
+    return dropped
+
+
+def needs_compaction(prefs):
+    """Check whether enough raw ratings have accumulated to compact (or aggregates are missing)"""
+    ratings = prefs.get("ratings", [])
+    if "dish_stats" not in prefs:
+        return bool(ratings)
+    return len(ratings) >= COMPACT_AFTER
+
+
+def rating_count(prefs):
+    """Total number of ratings (including the ones rolled up into aggregates)"""
+    if "dish_stats" in prefs:
+        return sum(stats.count for stats in prefs["dish_stats"].values())
+    return len(prefs.get("ratings", []))
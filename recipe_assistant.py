@@ -7,14 +7,56 @@ Supports multiple languages (English, German)
 """
 
 import os
-import json
-import anthropic
+import time
+import random
+import asyncio
+import inspect
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+import context_builder
+import jsonl_log
+import metrics
+import resilience
+import taste_model
+from ingredient_normalizer import ingredient_ids, similarity as ingredient_similarity
+from model_router import ModelRouter
+from precomputed import PrecomputedAnswers, precomputed_path, MATCH_THRESHOLD as PRECOMPUTED_THRESHOLD
+from prefetch import Speculation, PrefetchStats, prefetch_mode, prefetch_path, speculated_pantry
+from recipe_index import RecipeIndex, INDEX_DB_NAME, offline_first_enabled, OFFLINE_FIRST_THRESHOLD
+from resilience import CircuitOpenError, ModelUnavailableError
+from storage import create_storage, default_preferences, username_from_path
+from suggestion_cache import SuggestionCache, CACHE_DIR_NAME, make_cache_key, cache_enabled
+from user_registry import UserRegistry, REGISTRY_DB_NAME, PAGE_SIZE, user_dir
+
 # User data directory
 USERS_DIR = "users"
-# Log file for Claude API communication
+# Cross-user observability sink (rolling metrics file, see metrics.py)
 GLOBAL_LOG_FILE = "claude_api_log.json"
+# Claude model and output budget for recipe suggestions
+MODEL = "claude-sonnet-4-20250514"
+MAX_TOKENS = 1000
+# Async engine: concurrent model calls, retries for rate-limited calls, preference I/O threads
+MAX_CONCURRENT_REQUESTS = 16
+MAX_RATE_LIMIT_RETRIES = 5
+IO_WORKERS = 8
+# HTTP status codes that are retried (rate limited / overloaded)
+RETRYABLE_STATUS_CODES = (429, 529)
+# While the model is unavailable: serve a logged suggestion with at least this ingredient
+# overlap (0-1), searching this many recent log entries (see find_fallback_answer)
+FALLBACK_THRESHOLD = 0.3
+FALLBACK_LOG_ENTRIES = 200
+
+# Shared on-disk cache for recipe suggestions (created on first use, see suggestion_cache.py)
+_suggestion_cache = None
+# Preference storage backend (created on first use, see storage.py)
+_storage = None
+# Inverted index of previous suggestions (created on first use, see recipe_index.py)
+_recipe_index = None
+# Registry of all users for the picker (created on first use, see user_registry.py)
+_registry = None
 
 # Language translations
 TRANSLATIONS = {
@@ -88,12 +130,15 @@ TRANSLATIONS = {
         "invalid_selection": "Invalid selection.",
         "api_key_error": "Error: ANTHROPIC_API_KEY not found!",
         "api_key_instruction": "Please set your API key as environment variable:",
+        "model_unavailable": "Claude cannot be reached right now and there is no earlier suggestion for these ingredients. Please try again later.",
         "log_saved": "[Log] API call saved",
         "in_log": "entries in log",
-        "claude_prompt_ingredients": "You are a helpful cooking assistant. The user wants to cook lunch.\n\nAvailable ingredients: {ingredients}\n{preferences}\n\nPlease suggest 2-3 suitable recipes that can be prepared with these ingredients.\n\nIMPORTANT: Format each recipe name as a Markdown heading with '## Recipe Name' (two hashtags).\n\nFor each recipe, provide:\n- Name of the dish (as ## heading)\n- Required ingredients (mark which ones are available)\n- Brief preparation instructions (3-5 steps)\n- Preparation time\n\nKeep the suggestions concise and practically feasible.",
+        "claude_prompt_system": "You are a helpful cooking assistant. The user wants to cook lunch.\n\nThe user tells you the available ingredients and, if known, their preferences. Please suggest 2-3 suitable recipes that can be prepared with these ingredients.\n\nIMPORTANT: Format each recipe name as a Markdown heading with '## Recipe Name' (two hashtags).\n\nFor each recipe, provide:\n- Name of the dish (as ## heading)\n- Required ingredients (mark which ones are available)\n- Brief preparation instructions (3-5 steps)\n- Preparation time\n\nKeep the suggestions concise and practically feasible.",
+        "claude_prompt_ingredients": "Available ingredients: {ingredients}\n{preferences}",
         "pref_dishes_liked": "Dishes the user liked",
         "pref_dishes_disliked": "Dishes the user disliked",
-        "pref_dietary": "Dietary restrictions"
+        "pref_dietary": "Dietary restrictions",
+        "pref_rating_notes": "Comments on earlier dishes"
     },
     "de": {
         "welcome": "Willkommen beim KI-Rezept-Assistenten!",
@@ -165,12 +210,15 @@ TRANSLATIONS = {
         "invalid_selection": "Ungültige Auswahl.",
         "api_key_error": "Fehler: ANTHROPIC_API_KEY nicht gefunden!",
         "api_key_instruction": "Bitte setze deinen API-Key als Umgebungsvariable:",
+        "model_unavailable": "Claude ist gerade nicht erreichbar und es gibt keinen früheren Vorschlag für diese Zutaten. Bitte versuche es später noch einmal.",
         "log_saved": "[Log] API-Call gespeichert",
         "in_log": "Einträge im Log",
-        "claude_prompt_ingredients": "Du bist ein hilfreicher Koch-Assistent. Der Nutzer möchte ein Mittagessen kochen.\n\nVerfügbare Zutaten: {ingredients}\n{preferences}\n\nBitte schlage 2-3 passende Rezepte vor, die mit diesen Zutaten zubereitet werden können.\n\nWICHTIG: Formatiere jeden Rezeptnamen als Markdown-Überschrift mit '## Rezeptname' (zwei Hashtags).\n\nGib für jedes Rezept an:\n- Name des Gerichts (als ## Überschrift)\n- Benötigte Zutaten (markiere, welche vorhanden sind)\n- Kurze Zubereitungsanleitung (3-5 Schritte)\n- Zubereitungszeit\n\nHalte die Vorschläge prägnant und praktisch umsetzbar.",
+        "claude_prompt_system": "Du bist ein hilfreicher Koch-Assistent. Der Nutzer möchte ein Mittagessen kochen.\n\nDer Nutzer nennt dir die verfügbaren Zutaten und, falls bekannt, seine Vorlieben. Bitte schlage 2-3 passende Rezepte vor, die mit diesen Zutaten zubereitet werden können.\n\nWICHTIG: Formatiere jeden Rezeptnamen als Markdown-Überschrift mit '## Rezeptname' (zwei Hashtags).\n\nGib für jedes Rezept an:\n- Name des Gerichts (als ## Überschrift)\n- Benötigte Zutaten (markiere, welche vorhanden sind)\n- Kurze Zubereitungsanleitung (3-5 Schritte)\n- Zubereitungszeit\n\nHalte die Vorschläge prägnant und praktisch umsetzbar.",
+        "claude_prompt_ingredients": "Verfügbare Zutaten: {ingredients}\n{preferences}",
         "pref_dishes_liked": "Gerichte, die dem Nutzer gut geschmeckt haben",
         "pref_dishes_disliked": "Gerichte, die dem Nutzer nicht geschmeckt haben",
-        "pref_dietary": "Ernährungseinschränkungen"
+        "pref_dietary": "Ernährungseinschränkungen",
+        "pref_rating_notes": "Anmerkungen zu früheren Gerichten"
     }
 }
 
@@ -178,53 +226,123 @@ def t(lang, key):
     """Get translation for a key in specified language"""
     return TRANSLATIONS.get(lang, TRANSLATIONS["en"]).get(key, key)
 
+def get_storage():
+    """Get the configured preference storage backend"""
+    global _storage
+    if _storage is None:
+        _storage = create_storage(USERS_DIR)
+    return _storage
+
+def use_users_dir(users_dir):
+    """Switch to another users directory (storage, registry, cache and index are reopened there)"""
+    global USERS_DIR, _storage, _registry, _suggestion_cache, _recipe_index
+    USERS_DIR = users_dir
+    _storage = _registry = _suggestion_cache = _recipe_index = None
+
+def get_suggestion_cache():
+    """Get the shared suggestion cache"""
+    global _suggestion_cache
+    if _suggestion_cache is None:
+        _suggestion_cache = SuggestionCache(os.path.join(USERS_DIR, CACHE_DIR_NAME))
+    return _suggestion_cache
+
+def get_recipe_index():
+    """Get the shared recipe history index"""
+    global _recipe_index
+    if _recipe_index is None:
+        _recipe_index = RecipeIndex(os.path.join(USERS_DIR, INDEX_DB_NAME))
+    return _recipe_index
+
+def get_registry():
+    """Get the user registry, building it from disk if it does not exist yet"""
+    global _registry
+    if _registry is None:
+        db_file = os.path.join(USERS_DIR, REGISTRY_DB_NAME)
+        is_new = not os.path.exists(db_file)
+        _registry = UserRegistry(db_file)
+        if is_new:
+            _registry.rebuild(USERS_DIR, get_storage())
+    return _registry
+
+def touch_user(preferences, preferences_file):
+    """Update last-active time, language and counts of a user in the registry"""
+    storage = get_storage()
+    get_registry().update(username_from_path(preferences_file), preferences.get("language", "en"),
+                          storage.count_ratings(preferences, preferences_file),
+                          storage.count_unrated(preferences, preferences_file))
+
 def get_user_files(username):
-    """Get file paths for a specific user"""
-    user_dir = os.path.join(USERS_DIR, username)
+    """Get file paths for a specific user (flat or sharded users directory)"""
+    directory = user_dir(USERS_DIR, username)
     return {
-        "dir": user_dir,
-        "preferences": os.path.join(user_dir, "preferences.json"),
-        "log": os.path.join(user_dir, "api_log.json")
+        "dir": directory,
+        "preferences": os.path.join(directory, "preferences.json"),
+        "log": os.path.join(directory, "api_log.jsonl"),
+        "precomputed": precomputed_path(os.path.join(directory, "preferences.json")),
+        "legacy_log": os.path.join(directory, "api_log.json")
     }
 
 def ensure_user_directory(username):
     """Create user directory if it doesn't exist"""
     user_files = get_user_files(username)
     os.makedirs(user_files["dir"], exist_ok=True)
+    # One-shot migration of the old JSON array log
+    if os.path.exists(user_files["legacy_log"]):
+        jsonl_log.migrate_json_log(user_files["legacy_log"], user_files["log"])
     return user_files
 
-def list_users():
-    """List all existing users"""
-    if not os.path.exists(USERS_DIR):
-        return []
-    return [d for d in os.listdir(USERS_DIR)
-            if os.path.isdir(os.path.join(USERS_DIR, d))]
+def create_user_profile(username, language):
+    """Create the directory and initial profile of a new user (written right away, also inside a batch)"""
+    preferences_file = ensure_user_directory(username)["preferences"]
+    storage = get_storage()
+    storage.save(default_preferences(language), preferences_file)
+    storage.flush(preferences_file)
+    return preferences_file
 
 def select_or_create_user():
-    """Let user select existing user or create new one"""
-    users = list_users()
+    """Let user select existing user (paged, filterable by name prefix) or create new one"""
+    registry = get_registry()
 
     print("\n" + "=" * 60)
     print("👤  User Selection / Benutzerauswahl")
     print("=" * 60)
 
-    if users:
-        print("\nExisting users / Existierende Benutzer:")
+    prefix, offset = "", 0
+    while registry.count():
+        matching = registry.count(prefix)
+        users = registry.page(prefix, offset)
+        if users:
+            print(f"\nExisting users / Existierende Benutzer ({offset + 1}-{offset + len(users)} / {matching}):")
+        else:
+            print(f"\nNo users found / Keine Benutzer gefunden: {prefix}*")
         for i, user in enumerate(users, 1):
-            print(f"{i}. {user}")
+            print(f"{i}. {user['username']} ({t(user['language'], 'language_' + user['language'])})")
         print(f"{len(users) + 1}. Create new user / Neuen Benutzer erstellen")
+        if matching > PAGE_SIZE or prefix:
+            print("n/p = next/previous page / nächste/vorherige Seite, /abc = filter by name / nach Name filtern")
 
-        while True:
-            try:
-                choice = int(input(f"\nSelect user / Benutzer auswählen (1-{len(users) + 1}): "))
-                if 1 <= choice <= len(users):
-                    return users[choice - 1]
-                elif choice == len(users) + 1:
-                    break
-                else:
-                    print(f"Please enter a number between / Bitte gib eine Zahl zwischen 1 und {len(users) + 1} ein")
-            except ValueError:
-                print("Please enter a valid number / Bitte gib eine gültige Zahl ein")
+        choice = input(f"\nSelect user / Benutzer auswählen (1-{len(users) + 1}): ").strip()
+        if choice.lower() == "n":
+            if offset + PAGE_SIZE < matching:
+                offset += PAGE_SIZE
+            continue
+        if choice.lower() == "p":
+            offset = max(0, offset - PAGE_SIZE)
+            continue
+        if choice.startswith("/"):
+            prefix, offset = choice[1:].strip(), 0
+            continue
+        try:
+            choice = int(choice)
+        except ValueError:
+            print("Please enter a valid number / Bitte gib eine gültige Zahl ein")
+            continue
+        if 1 <= choice <= len(users):
+            return users[choice - 1]["username"]
+        elif choice == len(users) + 1:
+            break
+        else:
+            print(f"Please enter a number between / Bitte gib eine Zahl zwischen 1 und {len(users) + 1} ein")
 
     # Create new user
     while True:
@@ -235,7 +353,7 @@ def select_or_create_user():
         if not username.replace("_", "").replace("-", "").isalnum():
             print("Username can only contain letters, numbers, underscore and hyphen / Benutzername darf nur Buchstaben, Zahlen, Unterstriche und Bindestriche enthalten")
             continue
-        if username in users:
+        if registry.exists(username) or os.path.isdir(get_user_files(username)["dir"]):
             print("Username already exists / Benutzername existiert bereits")
             continue
 
@@ -258,17 +376,10 @@ def select_or_create_user():
             except ValueError:
                 print("Please enter a valid number / Bitte gib eine gültige Zahl ein")
 
-        # Create user directory and save initial preferences with language
-        user_files = ensure_user_directory(username)
-        initial_prefs = {
-            "language": language,
-            "liked_dishes": [],
-            "disliked_dishes": [],
-            "ratings": [],
-            "dietary_restrictions": [],
-            "suggested_recipes": []
-        }
-        save_preferences(initial_prefs, user_files["preferences"])
+        # Register the user, create the directory and save initial preferences in one transaction
+        if not registry.register(username, language, lambda: create_user_profile(username, language)):
+            print("Username already exists / Benutzername existiert bereits")
+            continue
 
         print(f"\n✓ {t(language, 'language_saved')}")
 
@@ -276,100 +387,110 @@ def select_or_create_user():
 
 def load_preferences(preferences_file):
     """Load saved user preferences"""
-    if os.path.exists(preferences_file):
-        with open(preferences_file, 'r', encoding='utf-8') as f:
-            prefs = json.load(f)
-            # Ensure language key exists (backward compatibility)
-            if "language" not in prefs:
-                prefs["language"] = "en"
-            return prefs
-    return {
-        "language": "en",  # Default language
-        "liked_dishes": [],
-        "disliked_dishes": [],
-        "ratings": [],
-        "dietary_restrictions": [],
-        "suggested_recipes": []
-    }
+    with metrics.phase("preferences_load"):
+        return get_storage().load(preferences_file)
 
 def save_preferences(preferences, preferences_file):
     """Save user preferences"""
-    with open(preferences_file, 'w', encoding='utf-8') as f:
-        json.dump(preferences, f, indent=2, ensure_ascii=False)
-
-def load_api_log(log_file):
-    """Load the API log"""
-    if os.path.exists(log_file):
-        with open(log_file, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    return []
-
-def save_api_log(log_entries, log_file):
-    """Save the API log (maximum 100 entries)"""
-    # Keep only the last 100 entries
-    log_entries = log_entries[-100:]
-
-    with open(log_file, 'w', encoding='utf-8') as f:
-        json.dump(log_entries, f, indent=2, ensure_ascii=False)
-
-def log_api_call(prompt, response, log_file):
-    """Add an API call to the log"""
-    log_entries = load_api_log(log_file)
-
+    with metrics.phase("preferences_save"):
+        get_storage().save(preferences, preferences_file)
+        touch_user(preferences, preferences_file)
+
+def load_api_log(log_file, last=None):
+    """Load the API log (optionally only the last entries)"""
+    if last is not None:
+        return jsonl_log.read_last(log_file, last)
+    return jsonl_log.read_all(log_file)
+
+def log_api_call(prompt, response, log_file, **details):
+    """Add an API call to the log (details: e.g. usage, stop_reason)"""
     log_entry = {
         "timestamp": datetime.now().isoformat(),
         "prompt": prompt,
         "response": response
     }
+    log_entry.update(details)
 
-    log_entries.append(log_entry)
-    save_api_log(log_entries, log_file)
+    # Append-only: write cost does not depend on the log size
+    with metrics.phase("log_write"):
+        jsonl_log.append_entry(log_file, log_entry)
 
     # Note: Using print without translation for technical log messages
-    print(f"[Log] API call saved ({len(log_entries)} entries in log)")
-
-def get_recipe_suggestion(client, ingredients, preferences, preferences_file, log_file, lang):
-    """Get recipe suggestion from Claude based on ingredients and preferences"""
-
-    # Build context from preferences
-    preference_context = ""
-    if preferences["liked_dishes"]:
-        preference_context += f"\n\n{t(lang, 'pref_dishes_liked')}: {', '.join(preferences['liked_dishes'][-5:])}"
-    if preferences["disliked_dishes"]:
-        preference_context += f"\n{t(lang, 'pref_dishes_disliked')}: {', '.join(preferences['disliked_dishes'][-5:])}"
-    if preferences["dietary_restrictions"]:
-        preference_context += f"\n{t(lang, 'pref_dietary')}: {', '.join(preferences['dietary_restrictions'])}"
-
-    # Use language-specific prompt
-    prompt = t(lang, "claude_prompt_ingredients").format(
-        ingredients=ingredients,
-        preferences=preference_context
-    )
-
-    message = client.messages.create(
-        model="claude-sonnet-4-20250514",
-        max_tokens=1000,
-        messages=[
+    print("[Log] API call saved")
+
+def build_preference_context(preferences, lang, ingredients="", budget=None):
+    """
+    Build the preference part of the prompt from saved preferences:
+    the dishes most relevant to the ingredients, within a token budget (see context_builder.py)
+    """
+    labels = {
+        "liked": t(lang, "pref_dishes_liked"),
+        "disliked": t(lang, "pref_dishes_disliked"),
+        "dietary": t(lang, "pref_dietary"),
+        "note": t(lang, "pref_rating_notes")
+    }
+    return context_builder.build_context(preferences, labels, ingredients, budget)
+
+def build_system_blocks(lang):
+    """Static per-language instructions as a system block marked for prompt caching"""
+    return [{
+        "type": "text",
+        "text": t(lang, "claude_prompt_system"),
+        "cache_control": {"type": "ephemeral"}
+    }]
+
+def build_suggestion_request(prompt, lang, model=MODEL, max_tokens=MAX_TOKENS):
+    """Keyword arguments for messages.create: cached static system block + small dynamic user turn"""
+    return {
+        "model": model,
+        "max_tokens": max_tokens,
+        "system": build_system_blocks(lang),
+        "messages": [
             {"role": "user", "content": prompt}
         ]
-    )
-
-    response_text = message.content[0].text
-
-    # Log prompt and response
-    log_api_call(prompt, response_text, log_file)
-
-    # Save the recipe suggestions
-    save_suggested_recipes(response_text, ingredients, preferences, preferences_file)
-
-    return response_text
-
-def save_suggested_recipes(response_text, ingredients, preferences, preferences_file):
-    """Extract and save recipe names from Claude's response"""
-    lines = response_text.split('\n')
-    recipe_names = []
+    }
 
-    for line in lines:
+def build_suggestion_prompt(ingredients, preferences, lang):
+    """Build the dynamic (user turn) part of the prompt, returns (prompt, preference_context)"""
+    with metrics.phase("prompt_build"):
+        preference_context = build_preference_context(preferences, lang, ingredients)
+        prompt = t(lang, "claude_prompt_ingredients").format(
+            ingredients=ingredients,
+            preferences=preference_context
+        )
+    return prompt, preference_context
+
+def usage_to_dict(usage):
+    """Convert the SDK usage object into a plain dict for the log"""
+    if usage is None:
+        return None
+    keys = ("input_tokens", "output_tokens", "cache_read_input_tokens", "cache_creation_input_tokens")
+    return {key: getattr(usage, key) for key in keys if getattr(usage, key, None) is not None}
+
+class RecipeHeadingParser:
+    """Incrementally extracts '## ' recipe names from (streamed) response text"""
+
+    def __init__(self):
+        self.recipe_names = []
+        self.closed = False
+        self._partial_line = ""
+
+    def feed(self, chunk):
+        """Parse all lines completed by this chunk; keep the unfinished rest"""
+        lines = (self._partial_line + chunk).split('\n')
+        self._partial_line = lines.pop()
+        for line in lines:
+            self._parse_line(line)
+
+    def close(self):
+        """Parse the last (unterminated) line and return the recipe names"""
+        if self._partial_line:
+            self._parse_line(self._partial_line)
+            self._partial_line = ""
+        self.closed = True
+        return self.recipe_names
+
+    def _parse_line(self, line):
         line = line.strip()
         # Recognize recipe names: lines starting with ## (Markdown H2)
         if line.startswith('##'):
@@ -377,26 +498,781 @@ def save_suggested_recipes(response_text, ingredients, preferences, preferences_
             # Remove additional formatting if present
             name = name.strip('#').strip()
             if name and len(name) < 100:  # Prevent too long "names"
-                recipe_names.append(name)
+                self.recipe_names.append(name)
 
-    # Save found recipes
-    if recipe_names:
-        timestamp = datetime.now().isoformat()
-        for recipe_name in recipe_names:
-            preferences["suggested_recipes"].append({
-                "name": recipe_name,
-                "ingredients": ingredients,
-                "suggested_at": timestamp,
-                "rated": False
-            })
+def rating_verdict(rating):
+    """Classify a 1-5 rating as liked, disliked or neutral (None)"""
+    if rating >= 4:
+        return "liked"
+    if rating <= 2:
+        return "disliked"
+    return None
+
+def _retry_after_seconds(error, attempt):
+    """Delay before retrying a rate-limited call (retry-after header or jittered backoff)"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    for header, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        value = headers.get(header)
+        if value:
+            try:
+                return max(0.0, float(value) * scale)
+            except ValueError:
+                pass
+    return min(60.0, 0.5 * 2 ** attempt) * (0.5 + random.random() / 2)
+
+def get_taste_model(preferences, preferences_file):
+    """The user's taste model (see taste_model.py), or None without NumPy or ratings"""
+    return taste_model.load_model(os.path.dirname(preferences_file), USERS_DIR,
+                                  lambda: get_storage().taste_history(preferences, preferences_file))
+
+def find_fallback_answer(log_file, ingredients, lang, disliked_dishes=(), taste=None):
+    """
+    The most recent logged suggestion for similar ingredients (or the best match in the shared
+    recipe index), without disliked dishes; None if there is none. Served while the model is unavailable.
+    With a taste model the matching logged suggestions are re-ranked by the user's taste instead.
+    """
+    wanted = ingredient_ids(ingredients)
+    disliked = {d.lower() for d in disliked_dishes}
+    if not wanted:
+        return None
+    candidates = []
+    for entry in reversed(load_api_log(log_file, last=FALLBACK_LOG_ENTRIES)):
+        if entry.get("interrupted") or entry.get("lang", lang) != lang:
+            continue
+        score = ingredient_similarity(wanted, ingredient_ids(entry.get("ingredients") or ""))
+        if score < FALLBACK_THRESHOLD:
+            continue
+        parser = RecipeHeadingParser()
+        parser.feed(entry["response"])
+        recipe_names = parser.close()
+        if recipe_names and not any(name.lower() in disliked for name in recipe_names):
+            candidate = {"response": entry["response"], "score": score,
+                         "ingredients": entry.get("ingredients") or "", "recipes": recipe_names}
+            if taste is None:
+                return candidate
+            candidates.append(candidate)
+    if candidates:
+        candidates = taste.rerank(candidates)
+        if candidates:
+            return candidates[0]
+    return get_recipe_index().find_answer(ingredients, lang, disliked_dishes, FALLBACK_THRESHOLD, taste)
+
+class AsyncRecipeEngine:
+    """
+    Async suggestion and feedback engine for many concurrent users.
+    Works with anthropic.AsyncAnthropic (or a sync client, called in threads).
+    Without a client, the default client (get_client) is created on the first model call.
+    """
+
+    def __init__(self, client=None, max_concurrency=MAX_CONCURRENT_REQUESTS, io_workers=IO_WORKERS):
+        self.client = client
+        self.max_concurrency = max_concurrency
+        self._api_client = None
+        self._is_async = False
+        # Preference/log file I/O never runs on the event loop
+        self._io_executor = ThreadPoolExecutor(max_workers=io_workers, thread_name_prefix="recipe-io")
+        self._api_executor = None
+        self._semaphore = None
+        # Shared pause after a 429 so all requests back off together
+        self._paused_until = 0.0
+        self._user_locks = {}
+        self._in_flight = {}
+        # Adaptive timeouts/hedging (separately for streamed and complete responses) and circuit breaker
+        self.latency = {mode: resilience.LatencyTracker(timeout)
+                        for mode, timeout in resilience.INITIAL_TIMEOUT.items()}
+        self.breaker = resilience.CircuitBreaker()
+        self._latency_seeded = False
+        # Model tier and output budget per request (see model_router.py)
+        self.router = ModelRouter()
+
+    def _get_client(self):
+        """Client used for model calls (resolved on first use)"""
+        if self._api_client is None:
+            client = self.client if self.client is not None else get_client()
+            self._is_async = inspect.iscoroutinefunction(inspect.unwrap(client.messages.create))
+            self._api_client = client
+        return self._api_client
+
+    def _get_semaphore(self):
+        # Created lazily so it belongs to the running event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    def _user_lock(self, preferences_file):
+        """Per-user lock so writes for the same profile never interleave"""
+        lock = self._user_locks.get(preferences_file)
+        if lock is None:
+            lock = self._user_locks[preferences_file] = asyncio.Lock()
+        return lock
+
+    async def _io(self, func, *args, **kwargs):
+        """Run blocking file I/O in the thread pool"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._io_executor, functools.partial(func, *args, **kwargs))
+
+    def _stream_sync(self, on_text, stop_event, kwargs):
+        """Stream a response with the sync client (runs in an API thread)"""
+        with self._get_client().messages.stream(**kwargs) as stream:
+            for text in stream.text_stream:
+                if stop_event.is_set():
+                    return None
+                on_text(text)
+            return stream.get_final_message()
+
+    async def _stream_async(self, on_text, kwargs):
+        """Stream a response with the async client"""
+        async with self._get_client().messages.stream(**kwargs) as stream:
+            async for text in stream.text_stream:
+                on_text(text)
+            return await stream.get_final_message()
+
+    async def _call_once(self, on_text, kwargs):
+        """
+        A single request (streamed with on_text), in an API thread for a sync client.
+        A cancelled call (e.g. the losing attempt of a hedge) cannot stop its thread: a sync
+        stream ends at its next chunk, a complete request runs until it returns. Its concurrency
+        slot is only released then, so abandoned attempts still count against max_concurrency.
+        """
+        loop = asyncio.get_running_loop()
+        client = self._get_client()
+        semaphore = self._get_semaphore()
+        await semaphore.acquire()
+        release_on_return = True
+        stop_event = threading.Event()
+        started = time.perf_counter()
+        try:
+            if self._is_async:
+                if on_text is not None:
+                    message = await self._stream_async(on_text, kwargs)
+                else:
+                    message = await client.messages.create(**kwargs)
+            else:
+                if self._api_executor is None:
+                    # One thread per concurrency slot
+                    self._api_executor = ThreadPoolExecutor(max_workers=self.max_concurrency,
+                                                            thread_name_prefix="recipe-api")
+                if on_text is not None:
+                    call = functools.partial(self._stream_sync, on_text, stop_event, kwargs)
+                else:
+                    call = functools.partial(client.messages.create, **kwargs)
+                future = self._api_executor.submit(call)
+                release_on_return = False
+                future.add_done_callback(lambda _: _release_threadsafe(loop, semaphore))
+                message = await asyncio.wrap_future(future)
+            metrics.api_call(kwargs.get("model"), time.perf_counter() - started, message)
+            return message
+        except asyncio.CancelledError:
+            # Stop a sync stream that is still running in its thread
+            stop_event.set()
+            raise
+        except Exception as error:
+            metrics.api_call(kwargs.get("model"), time.perf_counter() - started, error=error)
+            raise
+        finally:
+            if release_on_return:
+                semaphore.release()
+
+    async def _hedged_call(self, on_text, kwargs):
+        """
+        One call with an adaptive timeout. If there is no response (or first streamed chunk)
+        after the usual p95, an identical second request is sent: whichever responds first
+        wins and the other one is cancelled. Raises AttemptTimeout if neither responds in time.
+        """
+        loop = asyncio.get_running_loop()
+        tracker = self.latency["stream" if on_text is not None else "message"]
+        timeout, hedge_delay = tracker.timeout(), tracker.hedge_delay()
+        claim_lock = threading.Lock()
+        winner = []
+        responded = asyncio.Event()
+
+        def claim(index):
+            # Called from API threads for sync streams
+            with claim_lock:
+                if not winner:
+                    winner.append(index)
+                    loop.call_soon_threadsafe(responded.set)
+                return winner[0] == index
+
+        def forward(index):
+            def handle_text(text):
+                if claim(index):
+                    on_text(text)
+            return handle_text
+
+        def on_done(index, task):
+            if not task.cancelled() and task.exception() is None:
+                claim(index)
+            else:
+                loop.call_soon(responded.set)
 
-        # Keep only the last 20 suggestions
-        preferences["suggested_recipes"] = preferences["suggested_recipes"][-20:]
+        def start(index):
+            task = loop.create_task(self._call_once(forward(index) if on_text is not None else None, kwargs))
+            task.add_done_callback(functools.partial(on_done, index))
+            return task
 
-        # Save immediately so recipes are preserved even without feedback
-        save_preferences(preferences, preferences_file)
+        started = loop.time()
+        tasks = [start(0)]
+        try:
+            while not winner:
+                if all(task.done() for task in tasks):
+                    # Every attempt failed: report the first error
+                    return tasks[0].result()
+                now = loop.time()
+                if now >= started + timeout:
+                    raise resilience.AttemptTimeout(timeout)
+                wake_at = started + timeout
+                if hedge_delay is not None and len(tasks) == 1:
+                    if now >= started + hedge_delay:
+                        metrics.increment("recipe_api_hedged_total")
+                        tasks.append(start(1))
+                        continue
+                    wake_at = min(wake_at, started + hedge_delay)
+                responded.clear()
+                try:
+                    await asyncio.wait_for(responded.wait(), wake_at - now)
+                except asyncio.TimeoutError:
+                    pass
+            tracker.record(loop.time() - started)
+            for index, task in enumerate(tasks):
+                if index != winner[0]:
+                    task.cancel()
+            if winner[0] == 1:
+                metrics.increment("recipe_api_hedge_wins_total")
+            # A stream that has started is not timed out: its text is already being shown
+            return await tasks[winner[0]]
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def _call_model(self, on_text=None, **kwargs):
+        """
+        Call the Messages API with bounded concurrency, adaptive timeouts, hedging and retries
+        (rate limits: shared pause; timeouts, connection errors and 5xx: jittered backoff).
+        With on_text the response is streamed and on_text is called for each text chunk.
+        Raises CircuitOpenError without calling the API while the circuit breaker is open.
+        """
+        streamed = []
+
+        def handle_text(text):
+            streamed.append(True)
+            on_text(text)
+
+        failures = 0
+        for attempt in range(MAX_RATE_LIMIT_RETRIES + 1):
+            if not self.breaker.allow():
+                metrics.increment("recipe_api_short_circuited_total")
+                raise CircuitOpenError(self.breaker.retry_in())
+            delay = self._paused_until - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
 
-def get_feedback(client, dish_name, preferences, preferences_file, lang):
+            try:
+                message = await self._hedged_call(handle_text if on_text is not None else None, kwargs)
+                self.breaker.record_success()
+                return message
+            except Exception as error:
+                if resilience.is_upstream_failure(error) and self.breaker.record_failure():
+                    metrics.increment("recipe_circuit_opened_total")
+                    # Note: Using print without translation for technical log messages
+                    print(f"[Resilience] Model API unhealthy, failing fast for {self.breaker.cooldown:.0f}s")
+                status = getattr(error, "status_code", None)
+                if streamed or attempt == MAX_RATE_LIMIT_RETRIES:
+                    # Text already shown is not requested again
+                    raise
+                if status in RETRYABLE_STATUS_CODES:
+                    metrics.increment("recipe_api_retries_total", status=status)
+                    retry_in = _retry_after_seconds(error, attempt)
+                    self._paused_until = max(self._paused_until, time.monotonic() + retry_in)
+                elif resilience.is_upstream_failure(error) and failures < resilience.MAX_FAILURE_RETRIES:
+                    failures += 1
+                    metrics.increment("recipe_api_retries_total", status=status or type(error).__name__)
+                    await asyncio.sleep(resilience.backoff(failures))
+                else:
+                    raise
+
+    async def _get_or_compute(self, cache_key, compute):
+        """Cache lookup with single-flight coalescing of identical requests, returns (text, from_cache)"""
+        cached = await self._io(get_suggestion_cache().get, cache_key)
+        if cached is not None:
+            metrics.increment("recipe_cache_lookups_total", result="hit")
+            return cached, True
+
+        in_flight = self._in_flight.get(cache_key)
+        if in_flight is not None:
+            metrics.increment("recipe_cache_lookups_total", result="coalesced")
+            return await asyncio.shield(in_flight), True
+
+        metrics.increment("recipe_cache_lookups_total", result="miss")
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[cache_key] = future
+        try:
+            response_text = await compute()
+            await self._io(get_suggestion_cache().put, cache_key, response_text)
+            future.set_result(response_text)
+            return response_text, False
+        except BaseException as error:
+            future.set_exception(error)
+            # Avoid "exception was never retrieved" warnings when nobody waited
+            future.exception()
+            raise
+        finally:
+            del self._in_flight[cache_key]
+
+    async def load_preferences(self, preferences_file):
+        """Load preferences in the I/O thread pool"""
+        return await self._io(load_preferences, preferences_file)
+
+    async def _answer_from_index(self, ingredients, preferences, preferences_file, lang, on_text):
+        """Offline-first: serve a previous response for a similar pantry, or return None"""
+        with metrics.phase("index_lookup"):
+            taste = await self._io(get_taste_model, preferences, preferences_file)
+            candidate = await self._io(get_recipe_index().find_answer, ingredients, lang,
+                                       preferences["disliked_dishes"], OFFLINE_FIRST_THRESHOLD, taste)
+        metrics.increment("recipe_index_lookups_total", result="hit" if candidate else "miss")
+        if candidate is None:
+            return None
+
+        response_text = candidate["response"]
+        # Note: Using print without translation for technical log messages
+        print(f"[Index] Answered from recipe history (match {candidate['score']:.0%}"
+              + (f", taste {candidate['taste']:+.2f})" if "taste" in candidate else ")"))
+        if on_text is not None:
+            on_text(response_text if response_text.endswith("\n") else response_text + "\n")
+        async with self._user_lock(preferences_file):
+            await self._io(save_suggested_recipes, response_text, ingredients, preferences, preferences_file)
+        return response_text
+
+    async def _answer_from_fallback(self, ingredients, preferences, preferences_file, log_file, lang, on_text):
+        """While the model is unavailable: a previous suggestion for similar ingredients, or None"""
+        taste = await self._io(get_taste_model, preferences, preferences_file)
+        candidate = await self._io(find_fallback_answer, log_file, ingredients, lang,
+                                   preferences["disliked_dishes"], taste)
+        metrics.increment("recipe_fallback_total", result="hit" if candidate else "miss")
+        if candidate is None:
+            return None
+
+        response_text = candidate["response"]
+        # Note: Using print without translation for technical log messages
+        print(f"[Fallback] Model API unavailable, showing an earlier suggestion (match {candidate['score']:.0%})")
+        if on_text is not None:
+            on_text(response_text if response_text.endswith("\n") else response_text + "\n")
+        async with self._user_lock(preferences_file):
+            await self._io(save_suggested_recipes, response_text, ingredients, preferences, preferences_file)
+        return response_text
+
+    async def _answer_from_precomputed(self, ingredients, preferences, preferences_file, log_file,
+                                       lang, on_text):
+        """Serve an answer pre-generated off-peak for a similar pantry, or return None"""
+        store = PrecomputedAnswers(precomputed_path(preferences_file))
+        if not store.exists():
+            return None
+        async with self._user_lock(preferences_file):
+            answer = await self._io(store.take, ingredients, lang, preferences["disliked_dishes"])
+        metrics.increment("recipe_precompute_lookups_total", result="hit" if answer else "miss")
+        if answer is None:
+            return None
+
+        response_text = answer["response"]
+        # Note: Using print without translation for technical log messages
+        print(f"[Precomputed] Suggestion prepared off-peak (match {answer['score']:.0%})")
+        if on_text is not None:
+            on_text(response_text if response_text.endswith("\n") else response_text + "\n")
+        # The model call happened in the batch; it is logged now that the user sees it
+        await self._io(log_api_call, answer["prompt"], response_text, log_file,
+                       ingredients=answer["ingredients"], lang=lang, usage=answer.get("usage"),
+                       stop_reason=answer.get("stop_reason"), precomputed=True, batch_id=answer.get("batch_id"))
+        async with self._user_lock(preferences_file):
+            recipe_names = await self._io(save_suggested_recipes, response_text, ingredients,
+                                          preferences, preferences_file)
+        if recipe_names:
+            await self._io(get_recipe_index().add, lang, answer["ingredients"], response_text, recipe_names,
+                           username_from_path(preferences_file))
+        return response_text
+
+    async def suggest(self, ingredients, preferences, preferences_file, log_file, lang,
+                      use_cache=True, on_text=None, offline_first=None, use_precomputed=True, speculation=None):
+        """
+        Async version of get_recipe_suggestion.
+        With on_text the response is streamed and on_text is called for each text chunk.
+        With use_precomputed an answer pre-generated off-peak (pregenerate.py) is served if it matches.
+        With offline_first a similar previous suggestion is served without calling the API.
+        With speculation (see prefetch.py) the model call it started ahead of time is used
+        instead of a new one; precomputed and offline-first answers were checked when it started.
+        """
+        if speculation is not None:
+            use_precomputed = offline_first = False
+        if use_precomputed:
+            response_text = await self._answer_from_precomputed(ingredients, preferences, preferences_file,
+                                                                log_file, lang, on_text)
+            if response_text is not None:
+                return response_text
+
+        if offline_first is None:
+            offline_first = offline_first_enabled()
+        if offline_first:
+            response_text = await self._answer_from_index(ingredients, preferences, preferences_file,
+                                                          lang, on_text)
+            if response_text is not None:
+                return response_text
+
+        await self._seed_latency_once(log_file)
+
+        if speculation is not None:
+            prompt, preference_context, route = speculation.prompt, speculation.preference_context, speculation.route
+        else:
+            prompt, preference_context = build_suggestion_prompt(ingredients, preferences, lang)
+            route = self.router.route(ingredients, preference_context, lang)
+        parser = RecipeHeadingParser()
+        chunks = []
+        request_started = []
+        first_token = []
+        fresh_responses = []
+
+        def handle_text(text):
+            if not chunks:
+                first_token.append(time.perf_counter() - request_started[0])
+                if metrics.enabled():
+                    metrics.observe("recipe_api_first_token_seconds", first_token[0])
+            chunks.append(text)
+            parser.feed(text)
+            on_text(text)
+
+        def replay_text(text):
+            # Chunks of a speculative request (its first-token time is taken from the speculation)
+            chunks.append(text)
+            parser.feed(text)
+            on_text(text)
+
+        async def call_route(route):
+            """One model call with the route's model and budget, logged; returns the response text"""
+            nonlocal parser
+            parser = RecipeHeadingParser()
+            chunks.clear()
+            first_token.clear()
+            request_started[:] = [time.perf_counter()]
+            speculative = speculation is not None and route is speculation.route
+            try:
+                if speculative:
+                    message = await speculation.result(replay_text if on_text is not None else None)
+                else:
+                    message = await self._call_model(
+                        on_text=handle_text if on_text is not None else None,
+                        **build_suggestion_request(prompt, lang, route["model"], route["max_tokens"])
+                    )
+            except BaseException:
+                if chunks:
+                    # Interrupted stream: keep the partial response and the recipes parsed so far
+                    partial_text = "".join(chunks)
+                    parser.close()
+                    await self._io(log_api_call, prompt, partial_text, log_file,
+                                   ingredients=ingredients, lang=lang, model=route["model"],
+                                   route=route, interrupted=True)
+                    async with self._user_lock(preferences_file):
+                        await self._io(save_suggested_recipes, partial_text, ingredients,
+                                       preferences, preferences_file, parser)
+                raise
+
+            latency = time.perf_counter() - request_started[0]
+            prefetched = {}
+            if speculative:
+                # Time of the model call itself, not of the user typing
+                latency = speculation.finished_at - speculation.started_at
+                if speculation.first_token_at is not None:
+                    first_token[:] = [speculation.first_token_at - speculation.started_at]
+                prefetched["prefetched"] = {"used": True, "head_start_ms": round(speculation.head_start() * 1000, 1),
+                                            "in_flight": speculation.in_flight_when_used()}
+            self.router.record(route["tier"], latency)
+            response_text = message.content[0].text
+            if on_text is not None:
+                # Finish the streamed output line before any further messages
+                if not response_text.endswith("\n"):
+                    on_text("\n")
+            else:
+                parser.feed(response_text)
+            recipe_names = parser.close()
+            stop_reason = getattr(message, "stop_reason", None)
+            escalation = self.router.escalate(route, recipe_names, stop_reason)
+
+            # Log prompt and response (once, with the complete text) with the routing outcome
+            await self._io(log_api_call, prompt, response_text, log_file,
+                           ingredients=ingredients, lang=lang, model=route["model"],
+                           usage=usage_to_dict(getattr(message, "usage", None)),
+                           stop_reason=stop_reason,
+                           latency_ms=round(latency * 1000, 1),
+                           first_token_ms=round(first_token[0] * 1000, 1) if first_token else None,
+                           route=dict(route, recipes=len(recipe_names), escalated=escalation is not None),
+                           **prefetched)
+            return response_text, escalation, stop_reason
+
+        async def request_suggestion():
+            response_text, escalation, stop_reason = await call_route(route)
+            if escalation is not None:
+                metrics.increment("recipe_route_escalations_total", tier=route["tier"])
+                problem = "was cut off" if stop_reason == "max_tokens" else "has no recipes"
+                # Note: Using print without translation for technical log messages
+                print(f"[Routing] The {route['tier']} model's answer {problem}, asking {escalation['model']}")
+                response_text, _, _ = await call_route(escalation)
+            fresh_responses.append(response_text)
+            return response_text
+
+        try:
+            if use_cache and cache_enabled():
+                cache_key = make_cache_key(ingredients, preference_context, lang,
+                                           route["model"], route["max_tokens"])
+                response_text, from_cache = await self._get_or_compute(cache_key, request_suggestion)
+                if from_cache:
+                    # Note: Using print without translation for technical log messages
+                    print("[Cache] Suggestion served from cache")
+                    if on_text is not None:
+                        on_text(response_text if response_text.endswith("\n") else response_text + "\n")
+            else:
+                response_text = await request_suggestion()
+        except Exception as error:
+            # Upstream down (breaker open or retries exhausted): fall back to an earlier suggestion
+            if chunks or not (isinstance(error, CircuitOpenError) or resilience.is_upstream_failure(error)):
+                raise
+            response_text = await self._answer_from_fallback(ingredients, preferences, preferences_file,
+                                                             log_file, lang, on_text)
+            if response_text is None:
+                raise ModelUnavailableError(str(error)) from error
+            return response_text
+
+        # Save the recipe suggestions (also for cache hits, so feedback keeps working)
+        async with self._user_lock(preferences_file):
+            recipe_names = await self._io(save_suggested_recipes, response_text, ingredients, preferences,
+                                          preferences_file, parser if parser.closed else None)
+
+        # New model responses are added to the history index incrementally
+        if fresh_responses and recipe_names:
+            await self._io(get_recipe_index().add, lang, ingredients, response_text, recipe_names,
+                           username_from_path(preferences_file))
+
+        return response_text
+
+    async def speculate(self, speculation, lang, log_file):
+        """Run the model call of a speculation (prefetch.Speculation) in the background, returns the message"""
+        await self._seed_latency_once(log_file)
+        message = await self._call_model(
+            on_text=speculation.feed,
+            **build_suggestion_request(speculation.prompt, lang, speculation.route["model"],
+                                       speculation.route["max_tokens"])
+        )
+        speculation.finish(message)
+        return message
+
+    async def _seed_latency_once(self, log_file):
+        if not self._latency_seeded:
+            self._latency_seeded = True
+            await self._io(self._seed_latency, log_file)
+
+    def _seed_latency(self, log_file):
+        """Seed the latency trackers from the log, so a fresh process starts with adaptive timeouts"""
+        streamed, complete = [], []
+        entries = load_api_log(log_file, last=resilience.LATENCY_WINDOW)
+        self.router.seed(entries)
+        for entry in entries:
+            if entry.get("first_token_ms") is not None:
+                streamed.append(entry["first_token_ms"] / 1000)
+            elif entry.get("latency_ms") is not None:
+                complete.append(entry["latency_ms"] / 1000)
+        self.latency["stream"].seed(streamed)
+        self.latency["message"].seed(complete)
+
+    async def record_feedback(self, dish_name, rating, preferences, preferences_file, reason=None):
+        """Async, non-interactive version of get_feedback, returns the verdict"""
+        rating_entry = {
+            "dish": dish_name,
+            "rating": rating,
+            "date": datetime.now().isoformat()
+        }
+        if reason:
+            rating_entry["reason"] = reason
+        verdict = rating_verdict(rating)
+
+        async with self._user_lock(preferences_file):
+            await self._io(self._save_rating, preferences, preferences_file, rating_entry, verdict)
+        return verdict
+
+    @staticmethod
+    def _save_rating(preferences, preferences_file, rating_entry, verdict):
+        with metrics.phase("feedback_save"):
+            get_storage().add_rating(preferences, preferences_file, rating_entry, verdict)
+            touch_user(preferences, preferences_file)
+        with metrics.phase("taste_update"):
+            taste_model.record_rating(os.path.dirname(preferences_file), preferences, rating_entry,
+                                      lambda: get_storage().taste_history(preferences, preferences_file))
+
+# Default Anthropic client (the SDK is only imported when a model call is about to happen)
+_client = None
+_client_lock = threading.Lock()
+
+def api_key_available():
+    """Check whether an API key is configured (without importing the SDK)"""
+    return bool(os.environ.get("ANTHROPIC_API_KEY"))
+
+def get_client():
+    """Create the default Anthropic client on first use"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            import anthropic
+            # Retries and timeouts are handled by the engine (see resilience.py)
+            _client = anthropic.Anthropic(api_key=os.environ.get("ANTHROPIC_API_KEY"), max_retries=0,
+                                          timeout=resilience.MAX_TIMEOUT)
+        return _client
+
+# Shared background event loop used by the synchronous wrappers
+_engine_loop = None
+_engines = {}
+_engine_lock = threading.Lock()
+
+def get_engine(client):
+    """Get the shared async engine for a client (None: default client, created on the first model call)"""
+    with _engine_lock:
+        engine = _engines.get(id(client))
+        if engine is None or engine.client is not client:
+            engine = _engines[id(client)] = AsyncRecipeEngine(client)
+        return engine
+
+def _release_threadsafe(loop, semaphore):
+    """Release an asyncio semaphore from an API thread (ignored once the loop is closed)"""
+    try:
+        loop.call_soon_threadsafe(semaphore.release)
+    except RuntimeError:
+        pass
+
+async def _run_and_signal(coro, done):
+    try:
+        return await coro
+    finally:
+        done.set()
+
+def _get_engine_loop():
+    global _engine_loop
+    with _engine_lock:
+        if _engine_loop is None:
+            _engine_loop = asyncio.new_event_loop()
+            threading.Thread(target=_engine_loop.run_forever, name="recipe-engine", daemon=True).start()
+        return _engine_loop
+
+def run_async(coro):
+    """Start a coroutine on the shared background event loop, returns a concurrent.futures.Future"""
+    return asyncio.run_coroutine_threadsafe(coro, _get_engine_loop())
+
+def run_sync(coro):
+    """Run a coroutine on the shared background event loop and wait for its result"""
+    done = threading.Event()
+    future = run_async(_run_and_signal(coro, done))
+    try:
+        return future.result()
+    except KeyboardInterrupt:
+        # Cancel the coroutine and give it a moment to save partial results
+        future.cancel()
+        done.wait(timeout=5)
+        raise
+
+def get_recipe_suggestion(client, ingredients, preferences, preferences_file, log_file, lang,
+                          use_cache=True, on_text=None, offline_first=None, use_precomputed=True,
+                          speculation=None):
+    """Get recipe suggestion from Claude based on ingredients and preferences"""
+    return run_sync(get_engine(client).suggest(
+        ingredients, preferences, preferences_file, log_file, lang,
+        use_cache=use_cache, on_text=on_text, offline_first=offline_first,
+        use_precomputed=use_precomputed, speculation=speculation))
+
+def start_prefetch(client, preferences, user_files, lang):
+    """
+    Speculatively request a suggestion for the user's usual pantry while the menu is shown
+    (RECIPE_ASSISTANT_PREFETCH), returns the Speculation or None
+    """
+    mode = prefetch_mode()
+    if mode == "off" or (client is None and not api_key_available()):
+        return None
+    pantry = speculated_pantry(preferences["suggested_recipes"], mode)
+    if pantry is None:
+        return None
+
+    # Pantries answered without a model call anyway are not prefetched
+    store = PrecomputedAnswers(precomputed_path(user_files["preferences"]))
+    if store.exists() and any(ingredient_similarity(pantry, other) >= PRECOMPUTED_THRESHOLD
+                              for other in store.pantries(lang)):
+        return None
+    if offline_first_enabled() and get_recipe_index().find_answer(
+            pantry, lang, preferences["disliked_dishes"], OFFLINE_FIRST_THRESHOLD) is not None:
+        return None
+    engine = get_engine(client)
+    prompt, preference_context = build_suggestion_prompt(pantry, preferences, lang)
+    route = engine.router.route(pantry, preference_context, lang)
+    if cache_enabled() and get_suggestion_cache().get(make_cache_key(
+            pantry, preference_context, lang, route["model"], route["max_tokens"])) is not None:
+        return None
+
+    speculation = Speculation(pantry, prompt, preference_context, route)
+    speculation.future = run_async(engine.speculate(speculation, lang, user_files["log"]))
+    return speculation
+
+def settle_prefetch(speculation, user_files, lang, outcome="misses"):
+    """
+    Count the outcome of a speculation once: hit if its call was used, otherwise it is
+    cancelled (outcome: misses or abandoned) and logged with the tokens it wasted
+    """
+    if speculation is None or speculation.settled:
+        return
+    speculation.settled = True
+    stats = PrefetchStats(prefetch_path(user_files["preferences"]))
+    if speculation.used:
+        stats.record(speculations=1, hits=1, hits_in_flight=int(speculation.in_flight_when_used()),
+                     head_start_seconds=speculation.head_start())
+        # Note: Using print without translation for technical log messages
+        print(f"[Prefetch] Suggestion was requested {speculation.head_start():.1f}s ahead of your input")
+        return
+
+    completed = speculation.cancel()
+    input_tokens, output_tokens = speculation.wasted_tokens()
+    response_text = speculation.message.content[0].text if completed else speculation.text()
+    if response_text:
+        log_api_call(speculation.prompt, response_text, user_files["log"],
+                     ingredients=speculation.ingredients, lang=lang, model=speculation.route["model"],
+                     usage=usage_to_dict(getattr(speculation.message, "usage", None)),
+                     route=speculation.route, interrupted=not completed, prefetched={"used": False})
+    stats.record(speculations=1, **{outcome: 1}, wasted_input_tokens=input_tokens,
+                 wasted_output_tokens=output_tokens)
+    # Note: Using print without translation for technical log messages
+    print(f"[Prefetch] Speculative suggestion for '{speculation.ingredients}' not used "
+          f"({input_tokens + output_tokens} tokens wasted)")
+
+def save_suggested_recipes(response_text, ingredients, preferences, preferences_file, parser=None):
+    """Extract and save recipe names from Claude's response (or an already fed parser), returns the names"""
+    with metrics.phase("parse"):
+        if parser is None:
+            parser = RecipeHeadingParser()
+            parser.feed(response_text)
+        recipe_names = parser.close()
+
+    # Save found recipes
+    if recipe_names:
+        timestamp = datetime.now().isoformat()
+        ids = ingredient_ids(ingredients)
+        entries = [{
+            "name": recipe_name,
+            "ingredients": ingredients,
+            "ingredient_ids": list(ids),
+            "suggested_at": timestamp,
+            "rated": False
+        } for recipe_name in recipe_names]
+
+        # Saved so recipes are preserved even without feedback (inside a storage batch,
+        # e.g. the CLI session, only once the batch ends or the profile is flushed)
+        with metrics.phase("preferences_save"):
+            get_storage().add_suggestions(preferences, preferences_file, entries)
+            touch_user(preferences, preferences_file)
+
+    return recipe_names
+
+def get_feedback(dish_name, preferences, preferences_file, lang):
     """Collect feedback after cooking"""
 
     print(f"\n--- {t(lang, 'feedback_for')}: {dish_name} ---")
@@ -416,42 +1292,28 @@ def get_feedback(client, dish_name, preferences, preferences_file, lang):
         except ValueError:
             print(t(lang, "please_enter_valid"))
 
-    # Save feedback
-    preferences["ratings"].append({
-        "dish": dish_name,
-        "rating": rating,
-        "date": datetime.now().isoformat()
-    })
-
-    if rating >= 4:
-        preferences["liked_dishes"].append(dish_name)
+    verdict = rating_verdict(rating)
+    if verdict == "liked":
         if lang == "de":
             print(f"✓ {t(lang, 'noted_liked')} '{dish_name}' geschmeckt!")
         else:
             print(f"✓ {t(lang, 'noted_liked')} '{dish_name}'!")
-    elif rating <= 2:
-        preferences["disliked_dishes"].append(dish_name)
+    elif verdict == "disliked":
         print(f"✓ {t(lang, 'noted_disliked')} '{dish_name}' {t(lang, 'not_to_taste')}")
 
     # Optional: Ask for details
+    reason = None
     if rating <= 2:
         reason = input(f"\n{t(lang, 'what_not_liked')}: ")
-        if reason:
-            preferences["ratings"][-1]["reason"] = reason
-
-    # Mark recipe as rated
-    for recipe in preferences["suggested_recipes"]:
-        if recipe["name"].lower() == dish_name.lower():
-            recipe["rated"] = True
-            break
 
-    save_preferences(preferences, preferences_file)
+    # Save feedback and mark recipe as rated
+    run_sync(get_engine(None).record_feedback(dish_name, rating, preferences, preferences_file, reason))
     print(f"\n{t(lang, 'thank_feedback')}\n")
 
-def select_recipe_from_suggestions(preferences, lang):
+def select_recipe_from_suggestions(preferences, lang, preferences_file=None):
     """Let user select from suggested recipes"""
-    # Filter unrated recipes
-    unrated_recipes = [r for r in preferences["suggested_recipes"] if not r.get("rated", False)]
+    # Last 10 unrated recipes
+    unrated_recipes = get_storage().unrated_suggestions(preferences, preferences_file, limit=10)
 
     if not unrated_recipes:
         print(f"\n{t(lang, 'no_unrated_recipes')}")
@@ -459,7 +1321,7 @@ def select_recipe_from_suggestions(preferences, lang):
         return None
 
     print(f"\n--- {t(lang, 'recently_suggested')} ---")
-    for i, recipe in enumerate(unrated_recipes[-10:], 1):  # Show maximum last 10
+    for i, recipe in enumerate(unrated_recipes, 1):  # Show maximum last 10
         date = datetime.fromisoformat(recipe["suggested_at"]).strftime("%d.%m.%Y %H:%M")
         print(f"{i}. {recipe['name']}")
         print(f"   {t(lang, 'suggested_on')}: {date}")
@@ -470,12 +1332,12 @@ def select_recipe_from_suggestions(preferences, lang):
 
     while True:
         try:
-            choice = int(input(f"\n{t(lang, 'which_recipe_cooked')} (0-{len(unrated_recipes[-10:])}): "))
-            if 0 <= choice <= len(unrated_recipes[-10:]):
+            choice = int(input(f"\n{t(lang, 'which_recipe_cooked')} (0-{len(unrated_recipes)}): "))
+            if 0 <= choice <= len(unrated_recipes):
                 if choice == 0:
                     return None
-                return unrated_recipes[-10:][choice - 1]["name"]
-            print(f"{t(lang, 'please_enter_number')} 0 {t(lang, 'please_enter_number')} {len(unrated_recipes[-10:])}.")
+                return unrated_recipes[choice - 1]["name"]
+            print(f"{t(lang, 'please_enter_number')} 0 {t(lang, 'please_enter_number')} {len(unrated_recipes)}.")
         except ValueError:
             print(t(lang, "please_enter_valid"))
 
@@ -486,17 +1348,6 @@ def main():
     print("🍳  Willkommen beim KI-Rezept-Assistenten!")
     print("=" * 60)
 
-    # API key check
-    api_key = os.environ.get("ANTHROPIC_API_KEY")
-    if not api_key:
-        print("\n❌ Error / Fehler: ANTHROPIC_API_KEY not found / nicht gefunden!")
-        print("Please set your API key as environment variable:")
-        print("Bitte setze deinen API-Key als Umgebungsvariable:")
-        print("  export ANTHROPIC_API_KEY='your-api-key'")
-        return
-
-    client = anthropic.Anthropic(api_key=api_key)
-
     # Select or create user
     username = select_or_create_user()
     user_files = ensure_user_directory(username)
@@ -506,6 +1357,9 @@ def main():
 
     print(f"\n✓ {t(lang, 'logged_in_as')}: {username}")
 
+    # Opt-in: start the suggestion for the usual pantry while the user is still choosing
+    speculation = start_prefetch(None, preferences, user_files, lang)
+
     # Select mode
     print(f"\n{t(lang, 'what_to_do')}")
     print(f"1 - {t(lang, 'option_1')}")
@@ -514,8 +1368,17 @@ def main():
     print(f"4 - {t(lang, 'option_4')}")
 
     choice = input(f"\n{t(lang, 'your_choice')} (1-4): ").strip()
+    if choice != "1":
+        settle_prefetch(speculation, user_files, lang, "abandoned")
 
     if choice == "1":
+        # API key check (only suggestions call the API; the client is created on the first call)
+        if not api_key_available():
+            print(f"\n❌ {t(lang, 'api_key_error')}")
+            print(t(lang, "api_key_instruction"))
+            print("  export ANTHROPIC_API_KEY='your-api-key'")
+            return
+
         # Request ingredients
         print(f"\n--- {t(lang, 'available_ingredients')} ---")
         print(t(lang, "list_ingredients"))
@@ -524,17 +1387,32 @@ def main():
         ingredients = input(f"\n{t(lang, 'your_ingredients')}: ").strip()
 
         if not ingredients:
+            settle_prefetch(speculation, user_files, lang, "abandoned")
             print(t(lang, "no_ingredients"))
             return
+        if speculation is not None and not speculation.matches(ingredients):
+            settle_prefetch(speculation, user_files, lang, "misses")
+            speculation = None
 
         print(f"\n🤔 {t(lang, 'thinking')}\n")
 
-        # Get recipe suggestion
-        suggestion = get_recipe_suggestion(client, ingredients, preferences,
-                                          user_files["preferences"], user_files["log"], lang)
+        # Get recipe suggestion (streamed: text is printed as it arrives)
         print("=" * 60)
-        print(suggestion)
+        try:
+            get_recipe_suggestion(None, ingredients, preferences,
+                                  user_files["preferences"], user_files["log"], lang,
+                                  on_text=lambda text: print(text, end="", flush=True),
+                                  speculation=speculation)
+        except ModelUnavailableError:
+            print(f"❌ {t(lang, 'model_unavailable')}")
+            print("=" * 60)
+            return
+        finally:
+            # A cached answer can make a matching speculation unnecessary
+            settle_prefetch(speculation, user_files, lang, "misses")
         print("=" * 60)
+        # Write the new suggestions before waiting for the feedback, not only when the session ends
+        get_storage().flush(user_files["preferences"])
 
         # Ask if feedback should be given
         yes_no = "y/n" if lang == "en" else "j/n"
@@ -543,23 +1421,24 @@ def main():
 
         if cooked:
             dish_name = input(f"{t(lang, 'which_dish_cooked')} ")
-            get_feedback(client, dish_name, preferences, user_files["preferences"], lang)
+            get_feedback(dish_name, preferences, user_files["preferences"], lang)
 
     elif choice == "2":
         # Direct feedback - with selection from suggested recipes
-        dish_name = select_recipe_from_suggestions(preferences, lang)
+        dish_name = select_recipe_from_suggestions(preferences, lang, user_files["preferences"])
 
         if dish_name is None:
             # Manual entry
             dish_name = input(f"\n{t(lang, 'which_dish_cooked')} ")
 
         if dish_name:
-            get_feedback(client, dish_name, preferences, user_files["preferences"], lang)
+            get_feedback(dish_name, preferences, user_files["preferences"], lang)
 
     elif choice == "3":
         # Show preferences
         print(f"\n--- {t(lang, 'your_preferences')} ---")
-        print(f"{t(lang, 'num_ratings')}: {len(preferences['ratings'])}")
+        storage = get_storage()
+        print(f"{t(lang, 'num_ratings')}: {storage.count_ratings(preferences, user_files['preferences'])}")
 
         if preferences["liked_dishes"]:
             print(f"\n{t(lang, 'dishes_liked')}")
@@ -572,22 +1451,22 @@ def main():
                 print(f"  ✗ {dish}")
 
         # Show suggested recipes
-        unrated = [r for r in preferences["suggested_recipes"] if not r.get("rated", False)]
-        if unrated:
-            print(f"\n{t(lang, 'unrated_suggestions')}: {len(unrated)}")
-            for recipe in unrated[-5:]:
+        num_unrated = storage.count_unrated(preferences, user_files["preferences"])
+        if num_unrated:
+            print(f"\n{t(lang, 'unrated_suggestions')}: {num_unrated}")
+            for recipe in storage.unrated_suggestions(preferences, user_files["preferences"], limit=5):
                 date = datetime.fromisoformat(recipe["suggested_at"]).strftime("%d.%m.%Y")
                 suggested_label = t(lang, "suggested_on").lower() if lang == "de" else "suggested on"
                 print(f"  • {recipe['name']} ({suggested_label} {date})")
 
     elif choice == "4":
         # Show API log
-        log_entries = load_api_log(user_files["log"])
+        num_entries = jsonl_log.count_entries(user_files["log"])
 
-        if not log_entries:
+        if not num_entries:
             print(f"\n{t(lang, 'no_api_calls')}")
         else:
-            print(f"\n--- {t(lang, 'api_log')} ({len(log_entries)} {t(lang, 'entries')}) ---")
+            print(f"\n--- {t(lang, 'api_log')} ({num_entries} {t(lang, 'entries')}) ---")
             print(f"\n{t(lang, 'how_many_entries')}")
             print(f"1 - {t(lang, 'last_5')}")
             print(f"2 - {t(lang, 'last_10')}")
@@ -596,11 +1475,11 @@ def main():
             log_choice = input(f"\n{t(lang, 'your_choice')} (1-3): ").strip()
 
             if log_choice == "1":
-                entries_to_show = log_entries[-5:]
+                entries_to_show = load_api_log(user_files["log"], last=5)
             elif log_choice == "2":
-                entries_to_show = log_entries[-10:]
+                entries_to_show = load_api_log(user_files["log"], last=10)
             else:
-                entries_to_show = log_entries
+                entries_to_show = load_api_log(user_files["log"])
 
             for i, entry in enumerate(entries_to_show, 1):
                 timestamp = datetime.fromisoformat(entry["timestamp"]).strftime("%d.%m.%Y %H:%M:%S")
@@ -621,4 +1500,9 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    try:
+        # Changes of the whole session are written once per profile at the end
+        with get_storage().batch():
+            main()
+    finally:
+        metrics.export(GLOBAL_LOG_FILE)
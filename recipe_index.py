@@ -0,0 +1,231 @@
+"""
+Inverted recipe index for the Recipe Assistant
+Maps ingredient tokens to previously suggested recipes (across all users, per language)
+so similar pantry requests can be answered from history without calling the API
+"""
+
+import os
+import re
+import sys
+import sqlite3
+import threading
+from datetime import datetime
+
+import jsonl_log
+from storage import create_storage
+from ingredient_normalizer import canonical_names
+from user_registry import iter_user_dirs
+
+# SQLite file holding the index (in the users directory)
+INDEX_DB_NAME = "recipe_index.db"
+# Answer from history if the ingredient overlap score reaches this value (0-1)
+OFFLINE_FIRST_THRESHOLD = 0.6
+# Enable offline-first answers with RECIPE_ASSISTANT_OFFLINE_FIRST=1
+OFFLINE_FIRST_ENV_VAR = "RECIPE_ASSISTANT_OFFLINE_FIRST"
+# Number of best-scoring candidates checked against the user's disliked dishes
+MAX_CANDIDATES = 20
+
+# Pattern to recover ingredients from older log entries (en/de prompts)
+_PROMPT_INGREDIENTS = re.compile(r"^(?:Available ingredients|Verfügbare Zutaten): (.*)$", re.MULTILINE)
+
+
+def tokenize_ingredients(ingredients):
+    """Split a free-text ingredient list into its set of canonical ingredients (see ingredient_normalizer.py)"""
+    return set(canonical_names(ingredients))
+
+
+def offline_first_enabled():
+    """Check whether offline-first answers are enabled via environment variable"""
+    return os.environ.get(OFFLINE_FIRST_ENV_VAR, "").strip().lower() in ("1", "on", "true", "yes")
+
+
+class RecipeIndex:
+    """Persistent token -> response index, updated incrementally on each new suggestion"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS responses (
+            id INTEGER PRIMARY KEY,
+            lang TEXT NOT NULL,
+            username TEXT,
+            ingredients TEXT NOT NULL,
+            num_tokens INTEGER NOT NULL,
+            response TEXT NOT NULL,
+            created_at TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_responses_user ON responses(username);
+        CREATE TABLE IF NOT EXISTS recipes (
+            response_id INTEGER NOT NULL REFERENCES responses(id),
+            name TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_recipes_response ON recipes(response_id);
+        CREATE TABLE IF NOT EXISTS postings (
+            lang TEXT NOT NULL,
+            token TEXT NOT NULL,
+            response_id INTEGER NOT NULL REFERENCES responses(id),
+            PRIMARY KEY (lang, token, response_id)
+        ) WITHOUT ROWID;
+    """
+
+    def __init__(self, index_file):
+        self.index_file = index_file
+        index_dir = os.path.dirname(index_file)
+        if index_dir:
+            os.makedirs(index_dir, exist_ok=True)
+        self._conn = sqlite3.connect(index_file, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(self.SCHEMA)
+
+    def close(self):
+        """Close the database connection"""
+        self._conn.close()
+
+    def add(self, lang, ingredients, response_text, recipe_names, username=None, created_at=None):
+        """Add one suggestion (response and its recipes) to the index"""
+        tokens = tokenize_ingredients(ingredients)
+        if not tokens or not recipe_names:
+            return None
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "INSERT INTO responses (lang, username, ingredients, num_tokens, response, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (lang, username, ingredients, len(tokens), response_text,
+                 created_at or datetime.now().isoformat())
+            )
+            response_id = cursor.lastrowid
+            self._conn.executemany(
+                "INSERT INTO recipes (response_id, name) VALUES (?, ?)",
+                [(response_id, name) for name in recipe_names]
+            )
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO postings (lang, token, response_id) VALUES (?, ?, ?)",
+                [(lang, token, response_id) for token in tokens]
+            )
+        return response_id
+
+    def search(self, ingredients, lang, limit=MAX_CANDIDATES):
+        """
+        Return candidate responses ordered by ingredient overlap
+        (Jaccard similarity of the token sets, newest first on ties)
+        """
+        tokens = sorted(tokenize_ingredients(ingredients))
+        if not tokens:
+            return []
+        placeholders = ",".join("?" * len(tokens))
+        with self._lock:
+            rows = self._conn.execute(
+                f"""SELECT r.id, r.ingredients, r.response, r.created_at,
+                           COUNT(*) * 1.0 / (? + r.num_tokens - COUNT(*)) AS score
+                    FROM postings p JOIN responses r ON r.id = p.response_id
+                    WHERE p.lang = ? AND p.token IN ({placeholders})
+                    GROUP BY r.id
+                    ORDER BY score DESC, r.id DESC
+                    LIMIT ?""",
+                [len(tokens), lang] + tokens + [limit]
+            ).fetchall()
+            candidates = []
+            for response_id, indexed_ingredients, response, created_at, score in rows:
+                names = [r[0] for r in self._conn.execute(
+                    "SELECT name FROM recipes WHERE response_id = ?", (response_id,))]
+                candidates.append({
+                    "id": response_id,
+                    "ingredients": indexed_ingredients,
+                    "response": response,
+                    "recipes": names,
+                    "score": score,
+                    "created_at": created_at
+                })
+        return candidates
+
+    def find_answer(self, ingredients, lang, disliked_dishes=(), threshold=OFFLINE_FIRST_THRESHOLD, taste=None):
+        """
+        Best previous response that clears the threshold and contains no disliked dish, or None.
+        With a taste model (taste_model.TasteModel) the candidates are re-ranked by the user's taste.
+        """
+        disliked = {d.lower() for d in disliked_dishes}
+        candidates = []
+        for candidate in self.search(ingredients, lang):
+            if candidate["score"] < threshold:
+                break
+            if any(name.lower() in disliked for name in candidate["recipes"]):
+                continue
+            if taste is None:
+                return candidate
+            candidates.append(candidate)
+        if candidates:
+            candidates = taste.rerank(candidates)
+        return candidates[0] if candidates else None
+
+    def retokenize(self):
+        """Rebuild all postings with the current ingredient normalization, returns the number of responses"""
+        with self._lock, self._conn:
+            rows = self._conn.execute("SELECT id, lang, ingredients FROM responses").fetchall()
+            self._conn.execute("DELETE FROM postings")
+            postings, sizes = [], []
+            for response_id, lang, ingredients in rows:
+                tokens = tokenize_ingredients(ingredients)
+                postings.extend((lang, token, response_id) for token in tokens)
+                sizes.append((len(tokens), response_id))
+            self._conn.executemany("INSERT OR IGNORE INTO postings (lang, token, response_id) VALUES (?, ?, ?)",
+                                   postings)
+            self._conn.executemany("UPDATE responses SET num_tokens = ? WHERE id = ?", sizes)
+        return len(rows)
+
+    def contains(self, username, response_text):
+        """Check whether a user's response has already been indexed"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT 1 FROM responses WHERE username = ? AND response = ?", (username, response_text)
+            ).fetchone() is not None
+
+    def count(self):
+        """Number of indexed responses"""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+
+def build_from_logs(index, users_dir):
+    """Index the responses of all users' API logs (for existing installations)"""
+    # Imported here: recipe_assistant imports this module
+    from recipe_assistant import RecipeHeadingParser
+
+    added = 0
+    if not os.path.isdir(users_dir):
+        return added
+    storage = create_storage(users_dir)
+    try:
+        for username, user_dir in iter_user_dirs(users_dir):
+            log_file = os.path.join(user_dir, "api_log.jsonl")
+            default_lang = storage.load(os.path.join(user_dir, "preferences.json")).get("language", "en")
+
+            for entry in jsonl_log.read_all(log_file):
+                if entry.get("interrupted") or index.contains(username, entry["response"]):
+                    continue
+                ingredients = entry.get("ingredients")
+                if ingredients is None:
+                    match = _PROMPT_INGREDIENTS.search(entry.get("prompt", ""))
+                    if not match:
+                        continue
+                    ingredients = match.group(1)
+                # Same heading parser as the live path (save_suggested_recipes)
+                parser = RecipeHeadingParser()
+                parser.feed(entry["response"])
+                if index.add(entry.get("lang", default_lang), ingredients, entry["response"],
+                             parser.close(), username, entry.get("timestamp")):
+                    added += 1
+    finally:
+        if storage.name == "sqlite":
+            storage.close()
+    return added
+
+
+if __name__ == "__main__":
+    # Usage: python3 recipe_index.py build [users_dir]
+    if len(sys.argv) < 2 or sys.argv[1] != "build":
+        print("Usage: python3 recipe_index.py build [users_dir]")
+        sys.exit(1)
+    users_dir = sys.argv[2] if len(sys.argv) > 2 else "users"
+    recipe_index = RecipeIndex(os.path.join(users_dir, INDEX_DB_NAME))
+    print(f"Indexed {build_from_logs(recipe_index, users_dir)} responses ({recipe_index.count()} in total)")
+    recipe_index.close()
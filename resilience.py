@@ -0,0 +1,178 @@
+"""
+Resilience policy for the model call: adaptive timeouts, hedging, retries and a circuit breaker
+
+- LatencyTracker keeps the recent time to the first response (first streamed chunk, or the
+  complete message when not streaming). Its p95 sets the hedge delay, and a multiple of it
+  sets the timeout of each attempt.
+- CircuitBreaker opens when most recent attempts failed upstream. While it is open, calls
+  fail fast and the engine serves a previous suggestion instead. After a cooldown one probe
+  call decides whether it closes again.
+"""
+
+import time
+import random
+from collections import deque
+
+# Samples kept for the percentiles, and the number needed before they are used
+LATENCY_WINDOW = 200
+MIN_LATENCY_SAMPLES = 20
+# Attempt timeout: p95 times this factor, within the bounds below.
+# Before enough samples exist, the initial timeout is used.
+TIMEOUT_P95_FACTOR = 3.0
+MIN_TIMEOUT = 5.0
+MAX_TIMEOUT = 120.0
+INITIAL_TIMEOUT = {"stream": 30.0, "message": 90.0}
+# A second identical request is sent once the first one is slower than the p95
+# (never earlier than MIN_HEDGE_DELAY seconds)
+HEDGE_PERCENTILE = 95
+MIN_HEDGE_DELAY = 0.5
+# Retries of timeouts, connection errors and 5xx responses (rate limits are retried separately)
+MAX_FAILURE_RETRIES = 2
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 8.0
+# Circuit breaker: open once FAILURE_RATE of the last BREAKER_WINDOW attempts failed upstream
+# (counted from MIN_BREAKER_CALLS attempts on), probe again after the cooldown (seconds)
+BREAKER_WINDOW = 20
+MIN_BREAKER_CALLS = 10
+FAILURE_RATE = 0.5
+COOLDOWN = 30.0
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class ModelUnavailableError(Exception):
+    """The model could not be reached and there was no previous suggestion to fall back to"""
+
+
+class CircuitOpenError(ModelUnavailableError):
+    """Raised without calling the API while the circuit breaker is open"""
+
+    def __init__(self, retry_in):
+        super().__init__(f"Model API unavailable (circuit open, next try in {retry_in:.0f}s)")
+        self.retry_in = retry_in
+
+
+class AttemptTimeout(TimeoutError):
+    """One attempt got no response within the adaptive timeout"""
+
+    def __init__(self, timeout):
+        super().__init__(f"No response from the model API within {timeout:.1f}s")
+        self.timeout = timeout
+
+
+def _is_connection_error(error):
+    # The SDK's APIConnectionError/APITimeoutError, checked by name so the SDK is not imported
+    return any(cls.__name__ == "APIConnectionError" for cls in type(error).__mro__)
+
+
+def is_upstream_failure(error):
+    """Errors that mean the upstream is unhealthy (counted by the circuit breaker)"""
+    if isinstance(error, AttemptTimeout) or _is_connection_error(error):
+        return True
+    status = getattr(error, "status_code", None)
+    return isinstance(status, int) and status >= 500
+
+
+def backoff(attempt):
+    """Jittered exponential backoff before retry number attempt (1, 2, ...)"""
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of sorted values"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(q / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+class LatencyTracker:
+    """Recent response latencies (seconds) and the timeout and hedge delay derived from them"""
+
+    def __init__(self, initial_timeout, window=LATENCY_WINDOW, min_samples=MIN_LATENCY_SAMPLES):
+        self.initial_timeout = initial_timeout
+        self.min_samples = min_samples
+        self.samples = deque(maxlen=window)
+
+    def record(self, seconds):
+        self.samples.append(seconds)
+
+    def seed(self, samples):
+        """Start from earlier latencies (e.g. from the log, for short-lived processes)"""
+        self.samples.extend(samples)
+
+    def p95(self):
+        """p95 of the recent latencies, or None while there are too few samples"""
+        if len(self.samples) < self.min_samples:
+            return None
+        return percentile(sorted(self.samples), HEDGE_PERCENTILE)
+
+    def timeout(self):
+        p95 = self.p95()
+        if p95 is None:
+            return self.initial_timeout
+        return min(MAX_TIMEOUT, max(MIN_TIMEOUT, p95 * TIMEOUT_P95_FACTOR))
+
+    def hedge_delay(self):
+        """Seconds after which a second request is sent, or None (not enough samples yet)"""
+        p95 = self.p95()
+        return None if p95 is None else max(MIN_HEDGE_DELAY, p95)
+
+
+class CircuitBreaker:
+    """Closed -> open when too many recent attempts failed -> half-open after the cooldown"""
+
+    def __init__(self, failure_rate=FAILURE_RATE, window=BREAKER_WINDOW, min_calls=MIN_BREAKER_CALLS,
+                 cooldown=COOLDOWN, clock=time.monotonic):
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.cooldown = cooldown
+        self.clock = clock
+        self.state = CLOSED
+        # Outcomes of the recent attempts (True: upstream failure)
+        self.outcomes = deque(maxlen=window)
+        self.opened_at = 0.0
+        self.probe_started = None
+
+    def allow(self):
+        """Whether a call may go out now (in half-open state: one probe at a time)"""
+        if self.state == CLOSED:
+            return True
+        now = self.clock()
+        if self.state == OPEN:
+            if now - self.opened_at < self.cooldown:
+                return False
+            self.state = HALF_OPEN
+            self.probe_started = None
+        # A probe that never reported back (e.g. cancelled) does not block forever
+        if self.probe_started is None or now - self.probe_started >= self.cooldown:
+            self.probe_started = now
+            return True
+        return False
+
+    def retry_in(self):
+        """Seconds until the next probe is allowed"""
+        started = self.opened_at if self.state == OPEN else (self.probe_started or self.clock())
+        return max(0.0, started + self.cooldown - self.clock())
+
+    def record_success(self):
+        if self.state != CLOSED:
+            self.state = CLOSED
+            self.outcomes.clear()
+            self.probe_started = None
+        self.outcomes.append(False)
+
+    def record_failure(self):
+        """Count an upstream failure; returns True if the breaker opened"""
+        self.outcomes.append(True)
+        if self.state == CLOSED:
+            failures = sum(self.outcomes)
+            if len(self.outcomes) < self.min_calls or failures < self.failure_rate * len(self.outcomes):
+                return False
+        opened = self.state != OPEN
+        self.state = OPEN
+        self.opened_at = self.clock()
+        self.probe_started = None
+        return opened
@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+"""
+HTTP service mode for the Recipe Assistant (standard library only)
+
+One long-running process serves many requests: the Anthropic client (with its connection
+pool) is created once, loaded profiles stay in memory (LRU) and are written behind, and
+requests are handled on a fixed worker pool. SIGINT/SIGTERM stop the server gracefully:
+running requests finish and all changed profiles are written before exiting.
+
+Endpoints (JSON):
+  GET  /health
+  POST /users                       {"username": "alice", "language": "en"}
+  GET  /users/<name>/preferences
+  POST /users/<name>/suggestions    {"ingredients": "tomatoes, pasta", "use_cache": true}
+  POST /users/<name>/feedback       {"dish": "Pasta Caprese", "rating": 4, "reason": "..."}
+  GET  /users/<name>/log?last=5
+
+Usage:
+  python3 server.py [--host 127.0.0.1] [--port 8080] [--workers 32] [--base-url URL]
+"""
+
+import os
+import sys
+import json
+import time
+import signal
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+import recipe_assistant as ra
+import jsonl_log
+import metrics
+import resilience
+from storage import create_storage
+
+# Worker threads handling connections
+WORKERS = 32
+# Seconds between write-behind flushes of changed profiles
+FLUSH_INTERVAL = 2.0
+# Idle keep-alive connections are closed after this many seconds
+KEEPALIVE_TIMEOUT = 5
+# Largest accepted request body
+MAX_BODY_BYTES = 64 * 1024
+
+
+class HttpError(Exception):
+    """Error answered with an HTTP status and a JSON message"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def make_client(base_url=None):
+    """The shared Anthropic client (base_url: e.g. a local mock of the Messages API)"""
+    import anthropic
+    api_key = os.environ.get("ANTHROPIC_API_KEY")
+    # Retries and timeouts are handled by the engine (see resilience.py)
+    options = {"max_retries": 0, "timeout": resilience.MAX_TIMEOUT}
+    if base_url:
+        # A local endpoint does not check the key
+        return anthropic.Anthropic(api_key=api_key or "local", base_url=base_url, **options)
+    return anthropic.Anthropic(api_key=api_key, **options)
+
+
+class RecipeService:
+    """Request handling independent of HTTP; every method returns a JSON-serializable dict"""
+
+    def __init__(self, client):
+        self.client = client
+        self.started = time.time()
+
+    def _user_files(self, username):
+        if not username or not username.replace("_", "").replace("-", "").isalnum():
+            raise HttpError(400, f"Invalid username: {username!r}")
+        user_files = ra.get_user_files(username)
+        if not os.path.isdir(user_files["dir"]):
+            raise HttpError(404, f"Unknown user: {username}")
+        return user_files
+
+    def health(self):
+        storage = ra.get_storage()
+        return {
+            "status": "ok",
+            "uptime_s": round(time.time() - self.started, 1),
+            "storage": storage.name,
+            "cached_profiles": len(storage.cache),
+            "dirty_profiles": storage.dirty_count(),
+            "circuit": ra.get_engine(self.client).breaker.state
+        }
+
+    def register(self, body):
+        username = str(body.get("username", "")).strip()
+        language = body.get("language", "en")
+        if language not in ra.TRANSLATIONS:
+            raise HttpError(400, f"Unsupported language: {language}")
+        if not username or not username.replace("_", "").replace("-", "").isalnum():
+            raise HttpError(400, f"Invalid username: {username!r}")
+        registry = ra.get_registry()
+        if registry.exists(username) or os.path.isdir(ra.get_user_files(username)["dir"]):
+            raise HttpError(409, f"User already exists: {username}")
+
+        if not registry.register(username, language, lambda: ra.create_user_profile(username, language)):
+            raise HttpError(409, f"User already exists: {username}")
+        return {"username": username, "language": language}
+
+    def preferences(self, username):
+        user_files = self._user_files(username)
+        preferences = ra.load_preferences(user_files["preferences"])
+        storage = ra.get_storage()
+        return {
+            "username": username,
+            "language": preferences.get("language", "en"),
+            "num_ratings": storage.count_ratings(preferences, user_files["preferences"]),
+            "liked_dishes": preferences["liked_dishes"][-10:],
+            "disliked_dishes": preferences["disliked_dishes"][-10:],
+            "dietary_restrictions": preferences.get("dietary_restrictions", []),
+            "unrated_suggestions": storage.unrated_suggestions(preferences, user_files["preferences"], limit=5)
+        }
+
+    def suggest(self, username, body):
+        user_files = self._user_files(username)
+        ingredients = str(body.get("ingredients", "")).strip()
+        if not ingredients:
+            raise HttpError(400, "No ingredients provided")
+        preferences = ra.load_preferences(user_files["preferences"])
+        lang = body.get("lang") or preferences.get("language", "en")
+        try:
+            response_text = ra.get_recipe_suggestion(
+                self.client, ingredients, preferences, user_files["preferences"], user_files["log"], lang,
+                use_cache=bool(body.get("use_cache", True)))
+        except resilience.ModelUnavailableError as error:
+            raise HttpError(503, str(error))
+        parser = ra.RecipeHeadingParser()
+        parser.feed(response_text)
+        return {"recipes": parser.close(), "response": response_text}
+
+    def feedback(self, username, body):
+        user_files = self._user_files(username)
+        dish = str(body.get("dish", "")).strip()
+        if not dish:
+            raise HttpError(400, "No dish provided")
+        try:
+            rating = int(body.get("rating"))
+        except (TypeError, ValueError):
+            raise HttpError(400, "Rating must be a number between 1 and 5")
+        if not 1 <= rating <= 5:
+            raise HttpError(400, f"Rating must be between 1 and 5, got {rating}")
+        preferences = ra.load_preferences(user_files["preferences"])
+        verdict = ra.run_sync(ra.get_engine(self.client).record_feedback(
+            dish, rating, preferences, user_files["preferences"], body.get("reason")))
+        return {"dish": dish, "rating": rating, "verdict": verdict}
+
+    def log(self, username, query):
+        user_files = self._user_files(username)
+        try:
+            last = int(query["last"][0]) if "last" in query else 5
+        except ValueError:
+            raise HttpError(400, "last must be a number")
+        return {
+            "total": jsonl_log.count_entries(user_files["log"]),
+            "entries": ra.load_api_log(user_files["log"], last=last)
+        }
+
+    def handle(self, method, path, query, body):
+        """Route a request, returns the response dict"""
+        parts = [part for part in path.split("/") if part]
+        if parts == ["health"] and method == "GET":
+            return self.health()
+        if parts == ["users"] and method == "POST":
+            return self.register(body)
+        if len(parts) == 3 and parts[0] == "users":
+            username, resource = parts[1], parts[2]
+            if resource == "preferences" and method == "GET":
+                return self.preferences(username)
+            if resource == "suggestions" and method == "POST":
+                return self.suggest(username, body)
+            if resource == "feedback" and method == "POST":
+                return self.feedback(username, body)
+            if resource == "log" and method == "GET":
+                return self.log(username, query)
+        raise HttpError(404, f"Not found: {method} {path}")
+
+
+class RecipeRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "RecipeAssistant"
+    timeout = KEEPALIVE_TIMEOUT
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_BODY_BYTES:
+            raise HttpError(413, "Request body too large")
+        if not length:
+            return {}
+        try:
+            body = json.loads(self.rfile.read(length))
+        except ValueError:
+            raise HttpError(400, "Request body is not valid JSON")
+        if not isinstance(body, dict):
+            raise HttpError(400, "Request body must be a JSON object")
+        return body
+
+    def _dispatch(self, method):
+        started = time.perf_counter()
+        url = urlsplit(self.path)
+        try:
+            body = self._read_body() if method == "POST" else {}
+            status, result = 200, self.server.service.handle(method, url.path, parse_qs(url.query), body)
+        except HttpError as error:
+            status, result = error.status, {"error": str(error)}
+        except Exception as error:
+            self.log_error("%s %s failed: %r", method, url.path, error)
+            status, result = 500, {"error": f"{type(error).__name__}: {error}"}
+        self._send_json(status, result)
+        metrics.observe("recipe_http_request_seconds", time.perf_counter() - started, status=status)
+
+    def _send_json(self, status, result):
+        data = json.dumps(result, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class RecipeHTTPServer(HTTPServer):
+    """HTTPServer that handles connections on a fixed worker pool"""
+
+    def __init__(self, address, service, workers=WORKERS, verbose=False):
+        super().__init__(address, RecipeRequestHandler)
+        self.service = service
+        self.verbose = verbose
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="recipe-http")
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self._process_request, request, client_address)
+
+    def _process_request(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        """Stop accepting connections and wait for running requests"""
+        super().server_close()
+        self.pool.shutdown(wait=True)
+
+
+class WriteBehindFlusher(threading.Thread):
+    """Periodically writes changed profiles of the cached storage"""
+
+    def __init__(self, storage, interval=FLUSH_INTERVAL):
+        super().__init__(name="recipe-flush", daemon=True)
+        self.storage = storage
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.storage.flush()
+            except OSError as error:
+                print(f"[Server] Flush failed, retrying: {error}")
+
+    def stop(self):
+        """Stop and write everything that is still dirty, returns the number of written profiles"""
+        self._stop_event.set()
+        self.join()
+        return self.storage.flush()
+
+
+def serve(host="127.0.0.1", port=8080, workers=WORKERS, client=None, base_url=None,
+          flush_interval=FLUSH_INTERVAL, verbose=False, ready=None):
+    """
+    Run the server until SIGINT/SIGTERM (or until ready's server is shut down).
+    ready(server) is called once the server is listening.
+    """
+    ra._storage = create_storage(ra.USERS_DIR, cached=True)
+    client = client or make_client(base_url)
+    server = RecipeHTTPServer((host, port), RecipeService(client), workers, verbose)
+    flusher = WriteBehindFlusher(ra._storage, flush_interval)
+    flusher.start()
+
+    def stop(signum, frame):
+        # shutdown() waits for serve_forever, so it must not run on the serving thread
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGINT, stop)
+        signal.signal(signal.SIGTERM, stop)
+
+    print(f"[Server] Listening on http://{server.server_address[0]}:{server.server_address[1]} "
+          f"({workers} workers, {ra._storage.name} storage)")
+    if ready is not None:
+        ready(server)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        written = flusher.stop()
+        metrics.export(ra.GLOBAL_LOG_FILE)
+        print(f"[Server] Stopped, {written} profile(s) written")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recipe Assistant HTTP server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=WORKERS, help="worker threads")
+    parser.add_argument("--base-url", help="Messages API base URL (e.g. a local mock)")
+    parser.add_argument("--flush-interval", type=float, default=FLUSH_INTERVAL,
+                        help="seconds between writes of changed profiles")
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    args = parser.parse_args()
+
+    if not args.base_url and not ra.api_key_available():
+        print("❌ Error: ANTHROPIC_API_KEY not found!")
+        return 1
+    return serve(args.host, args.port, args.workers, base_url=args.base_url,
+                 flush_interval=args.flush_interval, verbose=args.verbose)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
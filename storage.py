@@ -0,0 +1,855 @@
+"""
+Storage backends for user preferences
+JSON (default): one preferences.json document per user (compacted, see profile_model.py),
+written atomically under a per-user file lock, merging changes made by other processes
+SQLite: indexed tables for users, ratings, dish aggregates, suggestions and dietary restrictions
+Cached variants (long-running processes, see server.py) keep loaded profiles in memory;
+the cached JSON backend writes changed profiles behind (flush())
+"""
+
+import os
+import sys
+import json
+import sqlite3
+import threading
+import contextlib
+from collections import OrderedDict
+from datetime import datetime
+
+import metrics
+import profile_model
+from ingredient_normalizer import ingredient_ids
+from user_registry import iter_user_dirs
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+
+# Select the backend with RECIPE_ASSISTANT_STORAGE=json|sqlite
+STORAGE_ENV_VAR = "RECIPE_ASSISTANT_STORAGE"
+# SQLite database file name (created inside the users directory)
+SQLITE_DB_NAME = "recipes.db"
+# Number of suggested recipes kept in preferences.json
+MAX_SUGGESTED_RECIPES = 20
+# Number of history items the SQLite backend loads into the in-memory profile
+PROFILE_WINDOW = 50
+# Number of profiles the cached backends keep in memory
+MAX_CACHED_PROFILES = 256
+# fsync policy for preferences.json: off (default), file (before the rename) or full (also the directory)
+FSYNC_ENV_VAR = "RECIPE_ASSISTANT_FSYNC"
+FSYNC_POLICIES = ("off", "file", "full")
+
+
+def default_preferences(language="en"):
+    """Return an empty preference profile"""
+    return {
+        "language": language,
+        "liked_dishes": [],
+        "disliked_dishes": [],
+        "ratings": [],
+        "dietary_restrictions": [],
+        "suggested_recipes": []
+    }
+
+
+def username_from_path(preferences_file):
+    """Derive the username from users/<name>/preferences.json"""
+    return os.path.basename(os.path.dirname(os.path.abspath(preferences_file)))
+
+
+@contextlib.contextmanager
+def locked_file(preferences_file):
+    """
+    Exclusive advisory lock of a profile (on <file>.lock), held across processes
+    for the read-merge-write of a save. A no-op where neither fcntl nor msvcrt exists.
+    """
+    with open(f"{preferences_file}.lock", 'a+b') as lock:
+        if fcntl is not None:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+        elif msvcrt is not None:
+            lock.seek(0)
+            # LK_LOCK retries for 10 seconds, then raises
+            while True:
+                try:
+                    msvcrt.locking(lock.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    pass
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
+            elif msvcrt is not None:
+                lock.seek(0)
+                msvcrt.locking(lock.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def fsync_policy():
+    """Configured fsync policy (off, file or full)"""
+    policy = os.environ.get(FSYNC_ENV_VAR, "off").strip().lower()
+    if policy not in FSYNC_POLICIES:
+        raise ValueError(f"Unknown fsync policy: {policy} (use {', '.join(FSYNC_POLICIES)})")
+    return policy
+
+
+def write_atomic(target, text, fsync="off"):
+    """Write text (or bytes) via a temp file and os.replace, so readers never see a partial file"""
+    temp_file = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with (open(temp_file, 'wb') if isinstance(text, bytes) else open(temp_file, 'w', encoding='utf-8')) as f:
+            f.write(text)
+            nbytes = f.tell()
+            if fsync != "off":
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(temp_file, target)
+    except BaseException:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        raise
+    if fsync == "full" and hasattr(os, "O_DIRECTORY"):
+        # Make the rename itself durable
+        directory = os.open(os.path.dirname(os.path.abspath(target)), os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(directory)
+        finally:
+            os.close(directory)
+    return nbytes
+
+
+def _replay(preferences, changes, source):
+    """Apply journaled changes of one process to the (newer) profile of another"""
+    for change in changes:
+        kind = change[0]
+        if kind == "suggestions":
+            preferences["suggested_recipes"].extend(dict(entry) for entry in change[1])
+            preferences["suggested_recipes"] = preferences["suggested_recipes"][-MAX_SUGGESTED_RECIPES:]
+        elif kind == "rating":
+            _apply_rating(preferences, dict(change[1]), change[2])
+        elif kind == "renormalize":
+            _renormalize_suggestions(preferences)
+        elif kind == "settings":
+            # Profile settings: the last writer wins
+            preferences["language"] = source.get("language", "en")
+            preferences["dietary_restrictions"] = list(source.get("dietary_restrictions", []))
+    profile_model.bump_version(preferences)
+
+
+def _renormalize_suggestions(preferences):
+    """Recompute the ingredient IDs of all suggested recipes, returns their number"""
+    for recipe in preferences["suggested_recipes"]:
+        recipe["ingredient_ids"] = list(ingredient_ids(recipe.get("ingredients", "")))
+    return len(preferences["suggested_recipes"])
+
+
+def _ids_to_text(ids):
+    return " ".join(map(str, ids))
+
+
+def _ids_from_text(text):
+    return [int(value) for value in text.split()] if text else []
+
+
+def _apply_rating(preferences, rating_entry, verdict):
+    """Record a rating and mark the matching suggestion as rated"""
+    dish_name = rating_entry["dish"]
+    profile_model.record_rating(preferences, rating_entry, verdict)
+    for recipe in preferences["suggested_recipes"]:
+        if recipe["name"].lower() == dish_name.lower():
+            recipe["rated"] = True
+            break
+
+
+class JsonStorage:
+    """
+    Stores each profile as a pretty-printed preferences.json file.
+    Changes are journaled per profile and written by flush(): immediately, or once at the
+    end of a batch() (e.g. one CLI session). A write holds the profile's file lock; if another
+    process wrote the file since it was loaded (revision changed), the journaled changes are
+    replayed onto the newer file instead of overwriting it.
+    """
+
+    name = "json"
+
+    def __init__(self, fsync=None):
+        self.fsync = fsync or fsync_policy()
+        self._lock = threading.RLock()
+        # preferences_file -> [preferences, journaled changes]
+        self._dirty = {}
+        # preferences_file -> (file identity, revision) as last read or written by this process
+        self._known = {}
+        self._batch_depth = 0
+
+    @staticmethod
+    def _identity(stat):
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _read(self, preferences_file):
+        try:
+            with open(preferences_file, 'r', encoding='utf-8') as f:
+                prefs = json.load(f)
+                metrics.file_op("read", "preferences", nbytes=f.tell() if metrics.enabled() else 0)
+                identity = self._identity(os.fstat(f.fileno()))
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            self._known[preferences_file] = (identity, prefs.get("revision", 0))
+        # Ensure language key exists (backward compatibility)
+        if "language" not in prefs:
+            prefs["language"] = "en"
+        return profile_model.from_stored(prefs)
+
+    def load(self, preferences_file):
+        """Load saved user preferences"""
+        prefs = self._read(preferences_file)
+        return prefs if prefs is not None else default_preferences()
+
+    def _changed(self, preferences, preferences_file, change, apply=None):
+        """Apply and journal a change, then write it (unless a batch is open)"""
+        while True:
+            with self._lock:
+                entry = self._dirty.get(preferences_file)
+                if entry is None or entry[0] is preferences:
+                    if apply is not None:
+                        apply()
+                    if entry is None:
+                        entry = self._dirty[preferences_file] = [preferences, []]
+                    entry[1].append(change)
+                    profile_model.bump_version(preferences)
+                    deferred = self._batch_depth > 0
+                    break
+            # Another in-memory copy of the same profile has unwritten changes: write those first
+            self.flush(preferences_file)
+        if not deferred:
+            self.flush(preferences_file)
+
+    def save(self, preferences, preferences_file):
+        """Save user preferences (profile settings; history is journaled by add_suggestions/add_rating)"""
+        self._changed(preferences, preferences_file, ("settings",))
+
+    def add_suggestions(self, preferences, preferences_file, entries):
+        """Append suggested recipes to the profile"""
+        def apply():
+            preferences["suggested_recipes"].extend(entries)
+            # Keep only the last 20 suggestions
+            preferences["suggested_recipes"] = preferences["suggested_recipes"][-MAX_SUGGESTED_RECIPES:]
+        self._changed(preferences, preferences_file, ("suggestions", [dict(e) for e in entries]), apply)
+
+    def renormalize(self, preferences, preferences_file):
+        """Recompute the ingredient IDs of the profile's suggestions, returns their number"""
+        count = []
+        self._changed(preferences, preferences_file, ("renormalize",),
+                      lambda: count.append(_renormalize_suggestions(preferences)))
+        return count[0]
+
+    def add_rating(self, preferences, preferences_file, rating_entry, verdict):
+        """Record a rating, update the dish aggregate and liked/disliked dishes and mark the recipe as rated"""
+        self._changed(preferences, preferences_file, ("rating", dict(rating_entry), verdict),
+                      lambda: _apply_rating(preferences, rating_entry, verdict))
+
+    @contextlib.contextmanager
+    def batch(self):
+        """Collect all changes inside the block and write each changed profile once at the end"""
+        with self._lock:
+            self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._batch_depth -= 1
+                done = self._batch_depth == 0
+            if done:
+                self.flush()
+
+    def dirty_count(self):
+        """Number of profiles with unwritten changes"""
+        return len(self._dirty)
+
+    def flush(self, preferences_file=None):
+        """Write changed profiles (all, or only the given one), returns the number written"""
+        with self._lock:
+            files = [preferences_file] if preferences_file else list(self._dirty)
+        written = 0
+        for path in files:
+            if self._write(path):
+                written += 1
+        return written
+
+    def _write(self, preferences_file):
+        with locked_file(preferences_file):
+            with self._lock:
+                entry = self._dirty.get(preferences_file)
+                known = self._known.get(preferences_file)
+            if entry is None:
+                return False
+            # Re-read the file only if someone else may have replaced it
+            try:
+                unchanged = (known is not None and known[1] == entry[0].get("revision", 0)
+                             and self._identity(os.stat(preferences_file)) == known[0])
+            except FileNotFoundError:
+                unchanged = known is None
+            on_disk = None if unchanged else self._read(preferences_file)
+
+            with self._lock:
+                # Everything journaled so far goes into this write (including changes made meanwhile)
+                preferences, changes = self._dirty.pop(preferences_file)
+                revision = preferences.get("revision", 0)
+                if on_disk is not None and on_disk.get("revision", 0) != revision:
+                    # Written by another process since we loaded it: merge instead of overwriting
+                    metrics.increment("recipe_preferences_merges_total")
+                    revision = on_disk.get("revision", 0)
+                    _replay(on_disk, changes, preferences)
+                    version = preferences.get("version", 0)
+                    preferences.clear()
+                    preferences.update(on_disk)
+                    preferences["version"] = version + 1
+                if profile_model.needs_compaction(preferences):
+                    profile_model.compact(preferences)
+                preferences["revision"] = revision + 1
+                text = json.dumps(preferences, indent=2, ensure_ascii=False, default=profile_model.to_json)
+
+            try:
+                nbytes = write_atomic(preferences_file, text, self.fsync)
+                identity = self._identity(os.stat(preferences_file))
+            except BaseException:
+                # Keep the changes for the next flush (ahead of any made meanwhile); the revision
+                # no longer matches the file, so they are replayed onto it
+                with self._lock:
+                    newer = self._dirty.get(preferences_file)
+                    self._dirty[preferences_file] = [preferences, changes + (newer[1] if newer else [])]
+                    self._known.pop(preferences_file, None)
+                raise
+            with self._lock:
+                self._known[preferences_file] = (identity, revision + 1)
+            metrics.file_op("write", "preferences", nbytes=nbytes)
+        return True
+
+    def unrated_suggestions(self, preferences, preferences_file, limit=None):
+        """Return unrated suggestions (oldest first, optionally only the last ones)"""
+        unrated = [r for r in preferences["suggested_recipes"] if not r.get("rated", False)]
+        return unrated[-limit:] if limit else unrated
+
+    def count_unrated(self, preferences, preferences_file):
+        """Count unrated suggestions"""
+        return len(self.unrated_suggestions(preferences, preferences_file))
+
+    def count_ratings(self, preferences, preferences_file):
+        """Count saved ratings (including the ones rolled up into aggregates)"""
+        return profile_model.rating_count(preferences)
+
+    def taste_history(self, preferences, preferences_file):
+        """{"dish_stats", "suggested_recipes"} of one user, for training a taste model"""
+        return preferences
+
+
+class SqliteStorage:
+    """Stores all profiles in one SQLite database with indexed history tables"""
+
+    name = "sqlite"
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY,
+            username TEXT NOT NULL UNIQUE,
+            language TEXT NOT NULL DEFAULT 'en',
+            created_at TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS ratings (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL REFERENCES users(id),
+            dish TEXT NOT NULL,
+            rating INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            reason TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_ratings_user ON ratings(user_id, id);
+        CREATE TABLE IF NOT EXISTS dish_verdicts (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL REFERENCES users(id),
+            dish TEXT NOT NULL,
+            verdict TEXT NOT NULL CHECK (verdict IN ('liked', 'disliked'))
+        );
+        CREATE INDEX IF NOT EXISTS idx_verdicts_user ON dish_verdicts(user_id, verdict, id);
+        CREATE INDEX IF NOT EXISTS idx_verdicts_recent ON dish_verdicts(user_id, id);
+        CREATE TABLE IF NOT EXISTS dish_stats (
+            user_id INTEGER NOT NULL REFERENCES users(id),
+            dish TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            total INTEGER NOT NULL,
+            last_rating INTEGER,
+            last_date TEXT,
+            score REAL NOT NULL,
+            PRIMARY KEY (user_id, dish)
+        );
+        CREATE INDEX IF NOT EXISTS idx_dish_stats_recent ON dish_stats(user_id, last_date);
+        CREATE TABLE IF NOT EXISTS suggested_recipes (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL REFERENCES users(id),
+            name TEXT NOT NULL,
+            ingredients TEXT NOT NULL,
+            suggested_at TEXT NOT NULL,
+            rated INTEGER NOT NULL DEFAULT 0,
+            ingredient_ids TEXT NOT NULL DEFAULT ''
+        );
+        CREATE INDEX IF NOT EXISTS idx_suggested_rated ON suggested_recipes(user_id, rated, id);
+        CREATE INDEX IF NOT EXISTS idx_suggested_name ON suggested_recipes(user_id, name COLLATE NOCASE);
+        CREATE TABLE IF NOT EXISTS dietary_restrictions (
+            user_id INTEGER NOT NULL REFERENCES users(id),
+            restriction TEXT NOT NULL,
+            PRIMARY KEY (user_id, restriction)
+        );
+    """
+
+    def __init__(self, db_file):
+        self.db_file = db_file
+        db_dir = os.path.dirname(db_file)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self._conn = sqlite3.connect(db_file, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(self.SCHEMA)
+            # Databases created before ingredient IDs were stored
+            columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(suggested_recipes)")}
+            migrate = "ingredient_ids" not in columns
+            if migrate:
+                self._conn.execute(
+                    "ALTER TABLE suggested_recipes ADD COLUMN ingredient_ids TEXT NOT NULL DEFAULT ''")
+        if migrate:
+            self.renormalize_suggestions()
+
+    def close(self):
+        """Close the database connection"""
+        self._conn.close()
+
+    @contextlib.contextmanager
+    def batch(self):
+        """Every change is its own transaction already; kept for the JsonStorage interface"""
+        yield self
+
+    def dirty_count(self):
+        return 0
+
+    def flush(self, preferences_file=None):
+        """History is written incrementally, nothing to flush"""
+        return 0
+
+    def _user_id(self, username, language="en", create=True):
+        """Look up (or create) the user row and return its id"""
+        row = self._conn.execute("SELECT id FROM users WHERE username = ?", (username,)).fetchone()
+        if row:
+            return row["id"]
+        if not create:
+            return None
+        cursor = self._conn.execute(
+            "INSERT INTO users (username, language, created_at) VALUES (?, ?, ?)",
+            (username, language, datetime.now().isoformat())
+        )
+        return cursor.lastrowid
+
+    def load(self, preferences_file):
+        """Load a profile with the most recent history items"""
+        username = username_from_path(preferences_file)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, language FROM users WHERE username = ?", (username,)
+            ).fetchone()
+            if row is None:
+                return default_preferences()
+
+            user_id = row["id"]
+            prefs = default_preferences(row["language"])
+            # Each dish once, in the list of its most recent verdict
+            seen = set()
+            for r in self._conn.execute(
+                "SELECT dish, verdict FROM dish_verdicts WHERE user_id = ? ORDER BY id DESC LIMIT ?",
+                (user_id, 4 * PROFILE_WINDOW)
+            ):
+                key = r["verdict"] + "_dishes"
+                if r["dish"] not in seen and len(prefs[key]) < PROFILE_WINDOW:
+                    prefs[key].append(r["dish"])
+                seen.add(r["dish"])
+            prefs["liked_dishes"].reverse()
+            prefs["disliked_dishes"].reverse()
+
+            rows = self._conn.execute(
+                "SELECT dish, rating, date, reason FROM ratings WHERE user_id = ? ORDER BY id DESC LIMIT ?",
+                (user_id, PROFILE_WINDOW)
+            ).fetchall()
+            for r in reversed(rows):
+                entry = {"dish": r["dish"], "rating": r["rating"], "date": r["date"]}
+                if r["reason"]:
+                    entry["reason"] = r["reason"]
+                prefs["ratings"].append(entry)
+
+            rows = self._conn.execute(
+                "SELECT name, ingredients, suggested_at, rated, ingredient_ids FROM suggested_recipes "
+                "WHERE user_id = ? ORDER BY id DESC LIMIT ?",
+                (user_id, MAX_SUGGESTED_RECIPES)
+            ).fetchall()
+            prefs["suggested_recipes"] = [self._suggestion_dict(r) for r in reversed(rows)]
+
+            prefs["dietary_restrictions"] = [r["restriction"] for r in self._conn.execute(
+                "SELECT restriction FROM dietary_restrictions WHERE user_id = ? ORDER BY restriction",
+                (user_id,)
+            )]
+
+            # Aggregates of the most recently rated dishes (add_rating reads the others on demand)
+            prefs["dish_stats"] = self._read_dish_stats(
+                user_id, "ORDER BY last_date DESC LIMIT ?", (PROFILE_WINDOW,))
+            if not prefs["dish_stats"] and prefs["ratings"]:
+                # Database from before dish aggregates: build them once from the full history
+                self._build_dish_stats(user_id)
+                prefs["dish_stats"] = self._read_dish_stats(
+                    user_id, "ORDER BY last_date DESC LIMIT ?", (PROFILE_WINDOW,))
+        return profile_model.from_stored(prefs)
+
+    def _read_dish_stats(self, user_id, clause, args):
+        return {r["dish"]: profile_model.DishStats(
+            r["count"], r["total"], r["last_rating"], r["last_date"], r["score"]
+        ) for r in self._conn.execute(
+            "SELECT dish, count, total, last_rating, last_date, score FROM dish_stats "
+            f"WHERE user_id = ? {clause}", (user_id,) + tuple(args)
+        )}
+
+    def _build_dish_stats(self, user_id):
+        history = {"ratings": [dict(r) for r in self._conn.execute(
+            "SELECT dish, rating, date FROM ratings WHERE user_id = ? ORDER BY id", (user_id,))]}
+        with self._conn:
+            self._write_dish_stats(user_id, profile_model.ensure_dish_stats(history))
+
+    def _write_dish_stats(self, user_id, dish_stats):
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO dish_stats (user_id, dish, count, total, last_rating, last_date, score) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(user_id, dish, s.count, s.total, s.last_rating, s.last_date, s.score)
+             for dish, s in dish_stats.items()]
+        )
+
+    @staticmethod
+    def _suggestion_dict(row):
+        return {
+            "name": row["name"],
+            "ingredients": row["ingredients"],
+            "ingredient_ids": _ids_from_text(row["ingredient_ids"]),
+            "suggested_at": row["suggested_at"],
+            "rated": bool(row["rated"])
+        }
+
+    def save(self, preferences, preferences_file):
+        """
+        Save profile-level settings (language, dietary restrictions).
+        History is written incrementally by add_suggestions/add_rating.
+        """
+        profile_model.bump_version(preferences)
+        username = username_from_path(preferences_file)
+        language = preferences.get("language", "en")
+        with self._lock, self._conn:
+            user_id = self._user_id(username, language)
+            self._conn.execute("UPDATE users SET language = ? WHERE id = ?", (language, user_id))
+            self._conn.execute("DELETE FROM dietary_restrictions WHERE user_id = ?", (user_id,))
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO dietary_restrictions (user_id, restriction) VALUES (?, ?)",
+                [(user_id, r) for r in preferences.get("dietary_restrictions", [])]
+            )
+
+    def add_suggestions(self, preferences, preferences_file, entries):
+        """Insert suggested recipes"""
+        preferences["suggested_recipes"].extend(entries)
+        profile_model.bump_version(preferences)
+        preferences["suggested_recipes"] = preferences["suggested_recipes"][-MAX_SUGGESTED_RECIPES:]
+
+        username = username_from_path(preferences_file)
+        with self._lock, self._conn:
+            user_id = self._user_id(username, preferences.get("language", "en"))
+            self._conn.executemany(
+                "INSERT INTO suggested_recipes (user_id, name, ingredients, suggested_at, rated, ingredient_ids) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(user_id, e["name"], e["ingredients"], e["suggested_at"], int(e.get("rated", False)),
+                  _ids_to_text(e.get("ingredient_ids") or ingredient_ids(e["ingredients"]))) for e in entries]
+            )
+
+    def add_rating(self, preferences, preferences_file, rating_entry, verdict):
+        """Insert a rating, update the dish aggregate and mark the matching suggestion as rated"""
+        dish_name = rating_entry["dish"]
+        username = username_from_path(preferences_file)
+        with self._lock:
+            user_id = self._user_id(username, create=False)
+            if user_id is not None:
+                # The loaded profile only holds recent aggregates; start from the stored one
+                preferences.setdefault("dish_stats", {}).update(
+                    self._read_dish_stats(user_id, "AND dish = ?", (dish_name,)))
+        stats = profile_model.record_rating(preferences, rating_entry, verdict)
+        for recipe in preferences["suggested_recipes"]:
+            if recipe["name"].lower() == dish_name.lower():
+                recipe["rated"] = True
+                break
+
+        with self._lock, self._conn:
+            user_id = self._user_id(username, preferences.get("language", "en"))
+            self._conn.execute(
+                "INSERT INTO ratings (user_id, dish, rating, date, reason) VALUES (?, ?, ?, ?, ?)",
+                (user_id, dish_name, rating_entry["rating"], rating_entry["date"], rating_entry.get("reason"))
+            )
+            if verdict:
+                self._conn.execute(
+                    "INSERT INTO dish_verdicts (user_id, dish, verdict) VALUES (?, ?, ?)",
+                    (user_id, dish_name, verdict)
+                )
+            self._write_dish_stats(user_id, {dish_name: stats})
+            self._conn.execute(
+                "UPDATE suggested_recipes SET rated = 1 WHERE id = ("
+                "SELECT id FROM suggested_recipes WHERE user_id = ? AND rated = 0 "
+                "AND name = ? COLLATE NOCASE ORDER BY id LIMIT 1)",
+                (user_id, dish_name)
+            )
+
+    def unrated_suggestions(self, preferences, preferences_file, limit=None):
+        """Return unrated suggestions via the (user_id, rated) index"""
+        username = username_from_path(preferences_file)
+        with self._lock:
+            user_id = self._user_id(username, create=False)
+            if user_id is None:
+                return []
+            rows = self._conn.execute(
+                "SELECT name, ingredients, suggested_at, rated, ingredient_ids FROM suggested_recipes "
+                "WHERE user_id = ? AND rated = 0 ORDER BY id DESC LIMIT ?",
+                (user_id, limit if limit else -1)
+            ).fetchall()
+        return [self._suggestion_dict(r) for r in reversed(rows)]
+
+    def renormalize_suggestions(self):
+        """Recompute the ingredient IDs of all stored suggestions (all users), returns their number"""
+        with self._lock, self._conn:
+            rows = self._conn.execute("SELECT id, ingredients FROM suggested_recipes").fetchall()
+            self._conn.executemany(
+                "UPDATE suggested_recipes SET ingredient_ids = ? WHERE id = ?",
+                [(_ids_to_text(ingredient_ids(row["ingredients"])), row["id"]) for row in rows]
+            )
+        return len(rows)
+
+    def _taste_history(self, user_id):
+        suggestions = [{"name": r["name"], "ingredients": r["ingredients"]} for r in self._conn.execute(
+            "SELECT name, ingredients FROM suggested_recipes WHERE user_id = ? ORDER BY id", (user_id,))]
+        return {"dish_stats": self._read_dish_stats(user_id, "", ()), "suggested_recipes": suggestions}
+
+    def taste_history(self, preferences, preferences_file):
+        """{"dish_stats", "suggested_recipes"} of one user (all of them, not the profile window)"""
+        username = username_from_path(preferences_file)
+        with self._lock:
+            user_id = self._user_id(username, create=False)
+            if user_id is None:
+                return {"dish_stats": {}, "suggested_recipes": []}
+            return self._taste_history(user_id)
+
+    def taste_histories(self):
+        """(username, {"dish_stats", "suggested_recipes"}) of all users, for retraining taste models"""
+        with self._lock:
+            users = self._conn.execute("SELECT id, username FROM users ORDER BY id").fetchall()
+            return [(user["username"], self._taste_history(user["id"])) for user in users]
+
+    def count_unrated(self, preferences, preferences_file):
+        """Count unrated suggestions"""
+        username = username_from_path(preferences_file)
+        with self._lock:
+            user_id = self._user_id(username, create=False)
+            if user_id is None:
+                return 0
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM suggested_recipes WHERE user_id = ? AND rated = 0", (user_id,)
+            ).fetchone()[0]
+
+    def count_ratings(self, preferences, preferences_file):
+        """Count saved ratings (including the ones rolled up into aggregates)"""
+        username = username_from_path(preferences_file)
+        with self._lock:
+            user_id = self._user_id(username, create=False)
+            if user_id is None:
+                return 0
+            # Imported compacted profiles keep older ratings only as aggregates
+            return self._conn.execute(
+                "SELECT COALESCE(SUM(count), 0) FROM dish_stats WHERE user_id = ?", (user_id,)
+            ).fetchone()[0]
+
+    def import_profile(self, username, prefs):
+        """Import a full JSON profile (replaces existing data for this user)"""
+        language = prefs.get("language", "en")
+        with self._lock, self._conn:
+            user_id = self._user_id(username, language)
+            self._conn.execute("UPDATE users SET language = ? WHERE id = ?", (language, user_id))
+            for table in ("ratings", "dish_verdicts", "dish_stats", "suggested_recipes", "dietary_restrictions"):
+                self._conn.execute(f"DELETE FROM {table} WHERE user_id = ?", (user_id,))
+            self._conn.executemany(
+                "INSERT INTO ratings (user_id, dish, rating, date, reason) VALUES (?, ?, ?, ?, ?)",
+                [(user_id, r["dish"], r["rating"], r.get("date", ""), r.get("reason"))
+                 for r in prefs.get("ratings", [])]
+            )
+            self._conn.executemany(
+                "INSERT INTO dish_verdicts (user_id, dish, verdict) VALUES (?, ?, ?)",
+                [(user_id, d, "liked") for d in prefs.get("liked_dishes", [])]
+                + [(user_id, d, "disliked") for d in prefs.get("disliked_dishes", [])]
+            )
+            self._conn.executemany(
+                "INSERT INTO suggested_recipes (user_id, name, ingredients, suggested_at, rated, ingredient_ids) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(user_id, r["name"], r.get("ingredients", ""), r.get("suggested_at", ""),
+                  int(r.get("rated", False)), _ids_to_text(ingredient_ids(r.get("ingredients", ""))))
+                 for r in prefs.get("suggested_recipes", [])]
+            )
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO dietary_restrictions (user_id, restriction) VALUES (?, ?)",
+                [(user_id, r) for r in prefs.get("dietary_restrictions", [])]
+            )
+            self._write_dish_stats(user_id, profile_model.ensure_dish_stats(prefs))
+
+
+class ProfileCache:
+    """LRU of loaded profiles (preferences_file -> preferences)"""
+
+    def __init__(self, max_profiles=MAX_CACHED_PROFILES):
+        self.max_profiles = max_profiles
+        self.lock = threading.RLock()
+        self._profiles = OrderedDict()
+
+    def __len__(self):
+        return len(self._profiles)
+
+    def get(self, preferences_file):
+        with self.lock:
+            preferences = self._profiles.get(preferences_file)
+            if preferences is not None:
+                self._profiles.move_to_end(preferences_file)
+        metrics.increment("recipe_profile_cache_total", result="hit" if preferences is not None else "miss")
+        return preferences
+
+    def put(self, preferences_file, preferences, replace=False):
+        """Add a profile (keeping one already cached unless replace), returns (cached profile, evicted)"""
+        evicted = []
+        with self.lock:
+            if replace:
+                self._profiles[preferences_file] = preferences
+            else:
+                preferences = self._profiles.setdefault(preferences_file, preferences)
+            self._profiles.move_to_end(preferences_file)
+            while len(self._profiles) > self.max_profiles:
+                evicted.append(self._profiles.popitem(last=False))
+        return preferences, evicted
+
+
+class CachedJsonStorage(JsonStorage):
+    """
+    JSON storage for long-running processes: loaded profiles stay in memory and changes
+    are written behind (flush(), also when a changed profile is evicted)
+    """
+
+    def __init__(self, max_profiles=MAX_CACHED_PROFILES, fsync=None):
+        super().__init__(fsync)
+        self.cache = ProfileCache(max_profiles)
+        # Always batching: nothing is written until flush()
+        self._batch_depth = 1
+
+    def load(self, preferences_file):
+        """Load a profile from memory (reading the file only on a miss)"""
+        preferences = self.cache.get(preferences_file)
+        if preferences is not None:
+            return preferences
+        preferences, evicted = self.cache.put(preferences_file, super().load(preferences_file))
+        self._write_evicted(evicted)
+        return preferences
+
+    def _changed(self, preferences, preferences_file, change, apply=None):
+        super()._changed(preferences, preferences_file, change, apply)
+        _, evicted = self.cache.put(preferences_file, preferences, replace=True)
+        self._write_evicted(evicted)
+
+    def _write_evicted(self, evicted):
+        for preferences_file, _ in evicted:
+            self.flush(preferences_file)
+
+
+class CachedSqliteStorage(SqliteStorage):
+    """SQLite storage for long-running processes: loaded profiles stay in memory (writes go through)"""
+
+    def __init__(self, db_file, max_profiles=MAX_CACHED_PROFILES):
+        super().__init__(db_file)
+        self.cache = ProfileCache(max_profiles)
+
+    def load(self, preferences_file):
+        """Load a profile from memory (querying the database only on a miss)"""
+        preferences = self.cache.get(preferences_file)
+        if preferences is None:
+            preferences, _ = self.cache.put(preferences_file, super().load(preferences_file))
+        return preferences
+
+
+def compact_json_tree(users_dir):
+    """Compact all users/<name>/preferences.json files, returns {username: dropped ratings}"""
+    json_storage = JsonStorage()
+    compacted = {}
+    for username, user_dir in iter_user_dirs(users_dir):
+        preferences_file = os.path.join(user_dir, "preferences.json")
+        if os.path.isfile(preferences_file):
+            prefs = json_storage.load(preferences_file)
+            compacted[username] = profile_model.compact(prefs)
+            json_storage.save(prefs, preferences_file)
+    return compacted
+
+
+def renormalize_json_tree(users_dir):
+    """Recompute the ingredient IDs in all users/<name>/preferences.json files, returns the suggestion count"""
+    json_storage = JsonStorage()
+    count = 0
+    for username, user_dir in iter_user_dirs(users_dir):
+        preferences_file = os.path.join(user_dir, "preferences.json")
+        if os.path.isfile(preferences_file):
+            count += json_storage.renormalize(json_storage.load(preferences_file), preferences_file)
+    return count
+
+
+def import_json_tree(users_dir, sqlite_storage):
+    """Bulk import all users/<name>/preferences.json files into SQLite"""
+    json_storage = JsonStorage()
+    imported = []
+    if not os.path.isdir(users_dir):
+        return imported
+    for username, user_dir in iter_user_dirs(users_dir):
+        preferences_file = os.path.join(user_dir, "preferences.json")
+        if os.path.isfile(preferences_file):
+            sqlite_storage.import_profile(username, json_storage.load(preferences_file))
+            imported.append(username)
+    return imported
+
+
+def create_storage(users_dir, backend=None, cached=False):
+    """Create the configured storage backend (cached: in-memory profiles for long-running processes)"""
+    backend = (backend or os.environ.get(STORAGE_ENV_VAR, "json")).strip().lower()
+    if backend == "sqlite":
+        db_file = os.path.join(users_dir, SQLITE_DB_NAME)
+        return CachedSqliteStorage(db_file) if cached else SqliteStorage(db_file)
+    if backend != "json":
+        raise ValueError(f"Unknown storage backend: {backend}")
+    return CachedJsonStorage() if cached else JsonStorage()
+
+
+if __name__ == "__main__":
+    # Usage: python3 storage.py import|compact [users_dir]
+    if len(sys.argv) < 2 or sys.argv[1] not in ("import", "compact"):
+        print("Usage: python3 storage.py import|compact [users_dir]")
+        sys.exit(1)
+    users_dir = sys.argv[2] if len(sys.argv) > 2 else "users"
+    if sys.argv[1] == "compact":
+        results = compact_json_tree(users_dir)
+        print(f"Compacted {len(results)} profile(s), {sum(results.values())} raw rating(s) rolled up")
+        sys.exit(0)
+    target = SqliteStorage(os.path.join(users_dir, SQLITE_DB_NAME))
+    users = import_json_tree(users_dir, target)
+    target.close()
+    print(f"Imported {len(users)} user(s) into {os.path.join(users_dir, SQLITE_DB_NAME)}")
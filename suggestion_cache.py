@@ -0,0 +1,125 @@
+"""
+Persistent suggestion cache for the Recipe Assistant
+Stores Claude responses on disk so repeated pantry requests skip the API call
+"""
+
+import os
+import json
+import time
+import hashlib
+
+import metrics
+from storage import write_atomic
+from ingredient_normalizer import canonical_key
+
+# Cache directory inside the users directory (one JSON file per cached response)
+CACHE_DIR_NAME = ".suggestion_cache"
+# Cached responses expire after this many seconds (default: 7 days)
+CACHE_TTL_SECONDS = 7 * 24 * 60 * 60
+# Maximum number of cached responses before least recently used ones are evicted
+CACHE_MAX_ENTRIES = 500
+# Set to "0" / "off" to bypass the cache entirely
+CACHE_ENV_VAR = "RECIPE_ASSISTANT_CACHE"
+
+
+def normalize_ingredients(ingredients):
+    """Normalize a free-text ingredient list (canonical names, deduplicated, sorted)"""
+    return canonical_key(ingredients)
+
+
+def make_cache_key(ingredients, preference_context, lang, model, max_tokens):
+    """Build the cache key for a suggestion request"""
+    key_data = json.dumps([
+        normalize_ingredients(ingredients),
+        preference_context,
+        lang,
+        model,
+        max_tokens
+    ], ensure_ascii=False)
+    return hashlib.sha256(key_data.encode("utf-8")).hexdigest()
+
+
+def cache_enabled():
+    """Check whether the cache has been disabled via environment variable"""
+    return os.environ.get(CACHE_ENV_VAR, "1").strip().lower() not in ("0", "off", "false", "no")
+
+
+class SuggestionCache:
+    """
+    On-disk response cache with TTL and LRU eviction
+    (identical concurrent requests are coalesced by the engine, see recipe_assistant.py)
+    """
+
+    def __init__(self, cache_dir, ttl_seconds=CACHE_TTL_SECONDS, max_entries=CACHE_MAX_ENTRIES):
+        self.cache_dir = cache_dir
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key):
+        """Return the cached response for a key, or None if missing/expired"""
+        path = self._entry_path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+                metrics.file_op("read", "cache", nbytes=f.tell() if metrics.enabled() else 0)
+        except (OSError, ValueError):
+            return None
+
+        if time.time() - entry.get("created_at", 0) > self.ttl_seconds:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+
+        # Touch the file so eviction treats it as recently used
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return entry["response"]
+
+    def put(self, key, response_text):
+        """Store a response and evict old entries if the cache is full"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        nbytes = write_atomic(self._entry_path(key),
+                              json.dumps({"created_at": time.time(), "response": response_text}, ensure_ascii=False))
+        metrics.file_op("write", "cache", nbytes=nbytes)
+        self._evict()
+
+    def _evict(self):
+        """Remove least recently used entries beyond max_entries"""
+        try:
+            names = [n for n in os.listdir(self.cache_dir) if n.endswith(".json")]
+        except OSError:
+            return
+        if len(names) <= self.max_entries:
+            return
+
+        entries = []
+        for name in names:
+            path = os.path.join(self.cache_dir, name)
+            try:
+                entries.append((os.path.getmtime(path), path))
+            except OSError:
+                continue
+        entries.sort()
+        for _, path in entries[:len(entries) - self.max_entries]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def clear(self):
+        """Remove all cached responses"""
+        if not os.path.exists(self.cache_dir):
+            return
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".json"):
+                try:
+                    os.remove(os.path.join(self.cache_dir, name))
+                except OSError:
+                    pass
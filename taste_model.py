@@ -0,0 +1,379 @@
+"""
+Per-user taste model for the Recipe Assistant
+Learns which ingredients and dish words (cuisines, dish types) a user rates well: every
+rating adds its centered value (-1 to 1) to the features of the dish, i.e. the canonical
+words of its name plus the pantry it was suggested for. Affinities are shrunk towards a
+prior pooled over all users, so new users start from what everybody likes.
+
+Models are small NumPy arrays in users/<name>/taste.npz, updated with every rating.
+Candidates from the recipe history are scored in batch without an API call.
+NumPy is optional: without it there is no taste model and nothing is re-ranked.
+
+Usage:
+  python3 taste_model.py retrain [users_dir] [--workers N]   # all users in parallel, then the prior
+  python3 taste_model.py show <username> [users_dir]
+"""
+
+import io
+import os
+import re
+import sys
+import argparse
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+
+import profile_model
+import storage
+from ingredient_normalizer import (VOCABULARY, UNKNOWN_ID_FLAG, canonical_item, canonical_names,
+                                   ingredient_id)
+from user_registry import iter_user_dirs, user_dir
+
+# File name inside each user directory
+MODEL_FILE = "taste.npz"
+# Pooled prior of all users (in the users directory)
+PRIOR_FILE = ".taste_prior.npz"
+# Feature slots: one per vocabulary ingredient, other names hashed into the rest
+DIMENSIONS = 4096
+# Ratings of a feature that weigh as much as the prior
+PRIOR_STRENGTH = 3.0
+# Shrinks the pooled prior of rarely rated features towards neutral
+POOL_SMOOTHING = 5.0
+# Re-ranking: combined score = ingredient overlap + TASTE_WEIGHT * taste (-1 to 1)
+TASTE_WEIGHT = 0.3
+# Candidates whose recipes score below this are skipped
+DISLIKE_THRESHOLD = -0.5
+
+_DISH_WORD = re.compile(r"[^\W\d_]+")
+_np = False
+
+
+def _numpy():
+    """Import NumPy on first use (optional; without it there is no taste model)"""
+    global _np
+    if _np is False:
+        try:
+            import numpy
+            _np = numpy
+        except ImportError:
+            _np = None
+    return _np
+
+
+def available():
+    """Whether taste models can be used (NumPy installed)"""
+    return _numpy() is not None
+
+
+def feature_slot(name):
+    """Slot of a canonical name"""
+    known = ingredient_id(name)
+    if known < UNKNOWN_ID_FLAG:
+        return known
+    return len(VOCABULARY) + 1 + (known & (UNKNOWN_ID_FLAG - 1)) % (DIMENSIONS - len(VOCABULARY) - 1)
+
+
+@lru_cache(maxsize=16384)
+def dish_features(dish):
+    """Canonical words of a dish name ("Tomaten-Basilikum-Nudeln" -> basil, pasta, tomato)"""
+    names = {canonical_item(word) for word in _DISH_WORD.findall(dish.lower())}
+    names.discard(None)
+    return tuple(sorted(names))
+
+
+@lru_cache(maxsize=16384)
+def recipe_features(dish, ingredients=""):
+    """{slot: name} of a dish and the pantry it was suggested for"""
+    return {feature_slot(name): name for name in dish_features(dish) + canonical_names(ingredients or "")}
+
+
+def model_path(user_directory):
+    return os.path.join(user_directory, MODEL_FILE)
+
+
+def prior_path(users_dir):
+    return os.path.join(users_dir, PRIOR_FILE)
+
+
+def _save_arrays(path, **arrays):
+    buffer = io.BytesIO()
+    _numpy().savez(buffer, **arrays)
+    storage.write_atomic(path, buffer.getvalue())
+
+
+def _load_arrays(path):
+    np = _numpy()
+    try:
+        with np.load(path) as data:
+            return {name: data[name] for name in data.files}
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+_prior_cache = {}
+
+
+def load_prior(path):
+    """Pooled prior affinities (cached until the file changes), or None"""
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    cached = _prior_cache.get(path)
+    if cached is None or cached[0] != mtime:
+        arrays = _load_arrays(path)
+        if arrays is None or arrays["affinity"].shape != (DIMENSIONS,):
+            return None
+        cached = _prior_cache[path] = (mtime, arrays["affinity"])
+    return cached[1]
+
+
+class TasteModel:
+    """Per-feature rating sums and counts of one user, plus the pooled prior"""
+
+    def __init__(self, sums=None, counts=None, labels=None, ratings=0, prior=None):
+        np = _numpy()
+        self.sums = sums if sums is not None else np.zeros(DIMENSIONS, dtype=np.float32)
+        self.counts = counts if counts is not None else np.zeros(DIMENSIONS, dtype=np.float32)
+        # slot -> name (for show)
+        self.labels = labels if labels is not None else {}
+        self.ratings = ratings
+        self.prior = prior
+        self._affinity = None
+
+    @classmethod
+    def load(cls, path, prior=None):
+        """Load a saved model, or None"""
+        arrays = _load_arrays(path)
+        if arrays is None:
+            return None
+        np = _numpy()
+        slots = arrays["slots"].astype(np.intp)
+        sums = np.zeros(DIMENSIONS, dtype=np.float32)
+        counts = np.zeros(DIMENSIONS, dtype=np.float32)
+        sums[slots] = arrays["sums"]
+        counts[slots] = arrays["counts"]
+        labels = {int(slot): str(label) for slot, label in zip(slots, arrays["labels"])}
+        return cls(sums, counts, labels, int(arrays["ratings"]), prior)
+
+    def save(self, path):
+        """Only the rated features are stored (a few KB per user)"""
+        np = _numpy()
+        slots = np.flatnonzero(self.counts).astype(np.uint16)
+        _save_arrays(path, slots=slots, sums=self.sums[slots], counts=self.counts[slots],
+                     labels=np.array([self.labels.get(int(slot), "") for slot in slots]),
+                     ratings=np.array(self.ratings))
+
+    @classmethod
+    def from_history(cls, preferences, prior=None):
+        """Train from a profile's per-dish aggregates (they cover every rating, also compacted ones)"""
+        model = cls(prior=prior)
+        pantries = {recipe["name"].lower(): recipe["ingredients"]
+                    for recipe in preferences.get("suggested_recipes", [])}
+        for dish, stats in profile_model.ensure_dish_stats(preferences).items():
+            model.add(recipe_features(dish, pantries.get(dish.lower(), "")),
+                      stats.total - profile_model.NEUTRAL_RATING * stats.count, stats.count)
+        return model
+
+    def add(self, features, centered_total, count=1):
+        """Add count ratings with the given sum of (rating - neutral) to the features"""
+        np = _numpy()
+        slots = np.fromiter(features, dtype=np.intp, count=len(features))
+        self.sums[slots] += centered_total / 2
+        self.counts[slots] += count
+        self.labels.update(features)
+        self.ratings += count
+        self._affinity = None
+
+    def affinity(self):
+        """Affinity of every feature (-1 to 1): own average rating, shrunk towards the prior"""
+        if self._affinity is None:
+            prior = self.prior if self.prior is not None else 0.0
+            self._affinity = (self.sums + PRIOR_STRENGTH * prior) / (self.counts + PRIOR_STRENGTH)
+        return self._affinity
+
+    def score(self, recipes):
+        """Taste scores of (dish, ingredients) pairs in one batch: mean affinity of their features"""
+        np = _numpy()
+        slots = [list(recipe_features(dish, ingredients)) for dish, ingredients in recipes]
+        lengths = np.fromiter(map(len, slots), dtype=np.intp, count=len(slots))
+        scores = np.zeros(len(slots), dtype=np.float32)
+        if not lengths.sum():
+            return scores
+        flat = np.fromiter((slot for recipe_slots in slots for slot in recipe_slots), dtype=np.intp,
+                           count=int(lengths.sum()))
+        offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        rated = lengths > 0
+        # Empty segments are skipped: each sum runs up to the next non-empty offset
+        scores[rated] = np.add.reduceat(self.affinity()[flat], offsets[rated]) / lengths[rated]
+        return scores
+
+    def rerank(self, candidates):
+        """
+        Order candidate responses (dicts with ingredients, recipes and an overlap score) by overlap
+        plus taste and drop those the user would most likely dislike. Adds "taste" to each candidate.
+        """
+        recipes = [(dish, candidate["ingredients"]) for candidate in candidates for dish in candidate["recipes"]]
+        scores = self.score(recipes)
+        position = 0
+        for candidate in candidates:
+            count = len(candidate["recipes"])
+            candidate["taste"] = round(float(scores[position:position + count].mean()), 3) if count else 0.0
+            position += count
+        kept = [candidate for candidate in candidates if candidate["taste"] > DISLIKE_THRESHOLD]
+        kept.sort(key=lambda candidate: candidate["score"] + TASTE_WEIGHT * candidate["taste"], reverse=True)
+        return kept
+
+    def top(self, count=10):
+        """Best and worst rated features: two lists of (name, affinity, ratings)"""
+        np = _numpy()
+        affinity = self.affinity()
+        rated = np.flatnonzero(self.counts)
+        ordered = rated[np.argsort(-affinity[rated], kind="stable")]
+
+        def describe(slots):
+            return [(self.labels.get(int(slot), f"#{slot}"), float(affinity[slot]), int(self.counts[slot]))
+                    for slot in slots]
+        return describe(ordered[:count]), describe(ordered[::-1][:count])
+
+
+def load_model(user_directory, users_dir, load_history=None):
+    """
+    A user's taste model with the pooled prior. Without a saved model it is built in memory
+    from the rating aggregates load_history() returns (saved with the next rating).
+    None without NumPy or without anything to go on.
+    """
+    if not available():
+        return None
+    prior = load_prior(prior_path(users_dir))
+    model = TasteModel.load(model_path(user_directory), prior)
+    if model is None and load_history is not None:
+        history = load_history()
+        if profile_model.ensure_dish_stats(history):
+            model = TasteModel.from_history(history, prior)
+    if model is None and prior is not None:
+        # Cold start: the prior alone
+        model = TasteModel(prior=prior)
+    return model
+
+
+def record_rating(user_directory, preferences, rating_entry, load_history=None):
+    """
+    Add a new rating to the user's model (incrementally; the first rating builds it from the
+    aggregates load_history() returns, by default the profile's)
+    """
+    if not available():
+        return
+    os.makedirs(user_directory, exist_ok=True)
+    path = model_path(user_directory)
+    # Other processes rate too: no update may be lost between load and save
+    with storage.locked_file(path):
+        model = TasteModel.load(path)
+        if model is None:
+            # The aggregates already include this rating
+            model = TasteModel.from_history(load_history() if load_history is not None else preferences)
+        else:
+            dish = rating_entry["dish"]
+            pantry = next((recipe["ingredients"] for recipe in reversed(preferences.get("suggested_recipes", []))
+                           if recipe["name"].lower() == dish.lower()), "")
+            model.add(recipe_features(dish, pantry), rating_entry["rating"] - profile_model.NEUTRAL_RATING)
+        model.save(path)
+
+
+def _train_user(job):
+    """Retrain and save one user's model, returns its (sums, counts, labels, ratings)"""
+    user_directory, preferences = job
+    if preferences is None:
+        preferences_file = os.path.join(user_directory, "preferences.json")
+        if not os.path.isfile(preferences_file):
+            return None
+        preferences = storage.JsonStorage().load(preferences_file)
+    model = TasteModel.from_history(preferences)
+    model.save(model_path(user_directory))
+    slots = _numpy().flatnonzero(model.counts)
+    return slots, model.sums[slots], model.counts[slots], {int(s): model.labels[int(s)] for s in slots}, model.ratings
+
+
+def retrain_all(users_dir, workers=None):
+    """
+    Retrain every user's model from their rating aggregates (in worker processes), then the
+    pooled prior. Returns counts of users, ratings and rated features.
+    """
+    np = _numpy()
+    if np is None:
+        raise RuntimeError("The taste model needs NumPy (pip install numpy)")
+    backend = storage.create_storage(users_dir)
+    if backend.name == "sqlite":
+        jobs = [(user_dir(users_dir, username), history) for username, history in backend.taste_histories()]
+        backend.close()
+        for user_directory, _ in jobs:
+            os.makedirs(user_directory, exist_ok=True)
+    else:
+        jobs = [(user_directory, None) for _, user_directory in iter_user_dirs(users_dir)]
+
+    workers = min(workers or os.cpu_count() or 1, len(jobs))
+    if workers <= 1:
+        results = map(_train_user, jobs)
+    else:
+        pool = ProcessPoolExecutor(max_workers=workers)
+        results = pool.map(_train_user, jobs, chunksize=max(1, len(jobs) // (workers * 8)))
+
+    sums = np.zeros(DIMENSIONS, dtype=np.float64)
+    counts = np.zeros(DIMENSIONS, dtype=np.float64)
+    labels = {}
+    users = ratings = 0
+    try:
+        for result in results:
+            if result is None:
+                continue
+            slots, user_sums, user_counts, user_labels, user_ratings = result
+            sums[slots] += user_sums
+            counts[slots] += user_counts
+            labels.update(user_labels)
+            users += 1
+            ratings += user_ratings
+    finally:
+        if workers > 1:
+            pool.shutdown()
+
+    affinity = (sums / (counts + POOL_SMOOTHING)).astype(np.float32)
+    os.makedirs(users_dir, exist_ok=True)
+    rated = np.flatnonzero(counts)
+    _save_arrays(prior_path(users_dir), affinity=affinity, users=np.array(users),
+                 slots=rated.astype(np.uint16), labels=np.array([labels.get(int(s), "") for s in rated]))
+    return {"users": users, "ratings": ratings, "features": len(rated)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-user taste models")
+    commands = parser.add_subparsers(dest="command", required=True)
+    command = commands.add_parser("retrain", help="retrain all users in parallel and rebuild the pooled prior")
+    command.add_argument("users_dir", nargs="?", default="users")
+    command.add_argument("--workers", type=int, help="worker processes (default: CPU count)")
+    command = commands.add_parser("show", help="best and worst rated ingredients and dish words of a user")
+    command.add_argument("username")
+    command.add_argument("users_dir", nargs="?", default="users")
+    args = parser.parse_args()
+
+    if args.command == "retrain":
+        results = retrain_all(args.users_dir, args.workers)
+        print(f"Retrained {results['users']} user(s) from {results['ratings']} rating(s), "
+              f"{results['features']} feature(s) in the pooled prior")
+        return 0
+
+    model = load_model(user_dir(args.users_dir, args.username), args.users_dir)
+    if model is None:
+        print("No taste model (NumPy missing, or no ratings and no pooled prior)")
+        return 1
+    liked, disliked = model.top()
+    print(f"{args.username}: {model.ratings} rating(s)" + (" (pooled prior only)" if not model.ratings else ""))
+    for title, features in (("Rated best", liked), ("Rated worst", disliked)):
+        if not features:
+            continue
+        print(f"\n{title}:")
+        for name, affinity, count in features:
+            print(f"  {affinity:+.2f}  {name} ({count})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,248 @@
+"""
+User registry for the Recipe Assistant
+Keeps username, language, created/last-active times and counts in users/registry.db,
+so the user picker does not have to scan the users directory or open every profile.
+
+Large installs can switch users/ to a hash-sharded layout (users/<shard>/<name>/)
+to keep directories small; a marker file in users/ records the layout.
+
+Usage:
+  python3 user_registry.py rebuild [users_dir]   # re-create the registry from disk
+  python3 user_registry.py shard [users_dir]     # move users/<name>/ to users/<shard>/<name>/
+"""
+
+import os
+import sys
+import hashlib
+import sqlite3
+import threading
+from datetime import datetime
+
+# SQLite file name (created inside the users directory)
+REGISTRY_DB_NAME = "registry.db"
+# Marker file that switches users/ to the sharded layout
+SHARD_MARKER = ".sharded"
+# Temporary directory used while moving users into shards
+SHARD_STAGING = ".sharding"
+# Number of hex digits of the username hash used as shard directory (256 shards)
+SHARD_DIGITS = 2
+# Users shown per page in the picker
+PAGE_SIZE = 10
+
+
+def shard_of(username):
+    """Shard directory name for a username"""
+    return hashlib.sha1(username.encode("utf-8")).hexdigest()[:SHARD_DIGITS]
+
+
+def is_sharded(users_dir):
+    """Check whether a users directory uses the sharded layout"""
+    return os.path.exists(os.path.join(users_dir, SHARD_MARKER))
+
+
+def user_dir(users_dir, username):
+    """Directory of a user for the layout of users_dir"""
+    if is_sharded(users_dir):
+        return os.path.join(users_dir, shard_of(username), username)
+    return os.path.join(users_dir, username)
+
+
+def _is_shard_name(name):
+    return len(name) == SHARD_DIGITS and all(c in "0123456789abcdef" for c in name)
+
+
+def iter_user_dirs(users_dir):
+    """Yield (username, directory) for all users on disk, in either layout"""
+    if not os.path.isdir(users_dir):
+        return
+    if not is_sharded(users_dir):
+        for username in sorted(os.listdir(users_dir)):
+            path = os.path.join(users_dir, username)
+            if not username.startswith(".") and os.path.isdir(path):
+                yield username, path
+        return
+    for shard in sorted(os.listdir(users_dir)):
+        shard_path = os.path.join(users_dir, shard)
+        if not _is_shard_name(shard) or not os.path.isdir(shard_path):
+            continue
+        for username in sorted(os.listdir(shard_path)):
+            path = os.path.join(shard_path, username)
+            if os.path.isdir(path):
+                yield username, path
+
+
+def shard_users_dir(users_dir):
+    """Move a flat users directory to the sharded layout, returns the number of moved users"""
+    if is_sharded(users_dir):
+        return _finish_sharding(users_dir)
+    users = list(iter_user_dirs(users_dir))
+    # Write the marker first: a half-finished run is completed by running it again (or by rebuild)
+    with open(os.path.join(users_dir, SHARD_MARKER), 'w', encoding='utf-8') as f:
+        f.write(f"{SHARD_DIGITS}\n")
+    # Stage all users first, so a username that looks like a shard name cannot clash
+    staging = os.path.join(users_dir, SHARD_STAGING)
+    os.makedirs(staging, exist_ok=True)
+    for username, path in users:
+        os.rename(path, os.path.join(staging, username))
+    return _finish_sharding(users_dir)
+
+
+def _finish_sharding(users_dir):
+    """Move staged (or left over top-level) user directories into their shards"""
+    moved = 0
+    staging = os.path.join(users_dir, SHARD_STAGING)
+    sources = [(name, os.path.join(users_dir, name)) for name in os.listdir(users_dir)
+               if not name.startswith(".") and not _is_shard_name(name)]
+    if os.path.isdir(staging):
+        sources += [(name, os.path.join(staging, name)) for name in os.listdir(staging)]
+    for username, path in sources:
+        if not os.path.isdir(path):
+            continue
+        target = user_dir(users_dir, username)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.rename(path, target)
+        moved += 1
+    if os.path.isdir(staging):
+        os.rmdir(staging)
+    return moved
+
+
+class UserRegistry:
+    """SQLite index of all users; every update is a single transaction"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS users (
+            username TEXT PRIMARY KEY,
+            language TEXT NOT NULL DEFAULT 'en',
+            created_at TEXT NOT NULL,
+            last_active TEXT NOT NULL,
+            num_ratings INTEGER NOT NULL DEFAULT 0,
+            num_unrated INTEGER NOT NULL DEFAULT 0
+        );
+    """
+
+    def __init__(self, db_file):
+        self.db_file = db_file
+        db_dir = os.path.dirname(db_file)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self._conn = sqlite3.connect(db_file, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            # The registry can be rebuilt from disk, so commits need not wait for fsync
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(self.SCHEMA)
+
+    def close(self):
+        """Close the database connection"""
+        self._conn.close()
+
+    def register(self, username, language, create=None):
+        """
+        Add a new user; returns False if the name is taken.
+        create() (e.g. writing the initial profile) runs inside the transaction,
+        so a failure leaves no registry entry behind.
+        """
+        now = datetime.now().isoformat()
+        with self._lock:
+            try:
+                with self._conn:
+                    self._conn.execute(
+                        "INSERT INTO users (username, language, created_at, last_active) VALUES (?, ?, ?, ?)",
+                        (username, language, now, now)
+                    )
+                    if create is not None:
+                        create()
+            except sqlite3.IntegrityError:
+                return False
+        return True
+
+    def update(self, username, language, num_ratings=None, num_unrated=None):
+        """Record activity of a user (inserting the user if missing)"""
+        now = datetime.now().isoformat()
+        with self._lock, self._conn:
+            self._conn.execute(
+                """INSERT INTO users (username, language, created_at, last_active, num_ratings, num_unrated)
+                   VALUES (?, ?, ?, ?, ?, ?)
+                   ON CONFLICT(username) DO UPDATE SET
+                       language = excluded.language,
+                       last_active = excluded.last_active,
+                       num_ratings = COALESCE(?, num_ratings),
+                       num_unrated = COALESCE(?, num_unrated)""",
+                (username, language, now, now, num_ratings or 0, num_unrated or 0, num_ratings, num_unrated)
+            )
+
+    def exists(self, username):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT 1 FROM users WHERE username = ?", (username,)).fetchone() is not None
+
+    def count(self, prefix=""):
+        """Number of users whose name starts with prefix"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM users WHERE username >= ? AND username < ?",
+                (prefix, prefix + "\uffff")
+            ).fetchone()[0]
+
+    def page(self, prefix="", offset=0, limit=PAGE_SIZE):
+        """One page of users (dicts) whose name starts with prefix, ordered by name"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM users WHERE username >= ? AND username < ? ORDER BY username LIMIT ? OFFSET ?",
+                (prefix, prefix + "\uffff", limit, offset)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def rebuild(self, users_dir, storage):
+        """
+        Re-create the registry from the user directories (after it drifted from disk).
+        Created times of known users are kept; returns (added_or_updated, removed).
+        """
+        if is_sharded(users_dir):
+            _finish_sharding(users_dir)
+        rows = []
+        for username, path in iter_user_dirs(users_dir):
+            preferences_file = os.path.join(path, "preferences.json")
+            prefs = storage.load(preferences_file)
+            mtimes = [os.path.getmtime(p) for p in (preferences_file, os.path.join(path, "api_log.jsonl"))
+                      if os.path.exists(p)]
+            last_active = datetime.fromtimestamp(max(mtimes or [os.path.getmtime(path)])).isoformat()
+            rows.append((username, prefs.get("language", "en"), last_active, last_active,
+                         storage.count_ratings(prefs, preferences_file),
+                         storage.count_unrated(prefs, preferences_file)))
+
+        with self._lock, self._conn:
+            self._conn.execute("CREATE TEMP TABLE IF NOT EXISTS on_disk (username TEXT PRIMARY KEY)")
+            self._conn.execute("DELETE FROM on_disk")
+            self._conn.executemany("INSERT INTO on_disk VALUES (?)", [(row[0],) for row in rows])
+            removed = self._conn.execute(
+                "DELETE FROM users WHERE username NOT IN (SELECT username FROM on_disk)").rowcount
+            self._conn.executemany(
+                """INSERT INTO users (username, language, created_at, last_active, num_ratings, num_unrated)
+                   VALUES (?, ?, ?, ?, ?, ?)
+                   ON CONFLICT(username) DO UPDATE SET
+                       language = excluded.language,
+                       last_active = MAX(last_active, excluded.last_active),
+                       num_ratings = excluded.num_ratings,
+                       num_unrated = excluded.num_unrated""",
+                rows
+            )
+        return len(rows), removed
+
+
+if __name__ == "__main__":
+    from storage import create_storage
+
+    if len(sys.argv) < 2 or sys.argv[1] not in ("rebuild", "shard"):
+        print("Usage: python3 user_registry.py rebuild|shard [users_dir]")
+        sys.exit(1)
+    users_dir = sys.argv[2] if len(sys.argv) > 2 else "users"
+    if sys.argv[1] == "shard":
+        print(f"Moved {shard_users_dir(users_dir)} user(s) to the sharded layout")
+    registry = UserRegistry(os.path.join(users_dir, REGISTRY_DB_NAME))
+    updated, removed = registry.rebuild(users_dir, create_storage(users_dir))
+    registry.close()
+    print(f"Registry rebuilt: {updated} user(s), {removed} stale entr{'y' if removed == 1 else 'ies'} removed")